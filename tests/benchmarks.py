@@ -0,0 +1,195 @@
+"""
+This module contains the benchmarks of the package hot paths against the in-process fake Vault server.
+
+Usage:
+    python tests/benchmarks.py --latency 0.002 --operations 500 --concurrency 1,8,32
+    python tests/benchmarks.py --json results.json
+    python tests/benchmarks.py --baseline results.json --tolerance 0.2
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_vault import FakeVault
+from vault import VaultClient
+
+
+MOUNT = 'benchmark'
+ROLE = 'benchmark-role'
+
+
+def prepare_client(fake: FakeVault, concurrency: int) -> VaultClient:
+    """
+    A function for creating the client of the benchmarks with the test secrets.
+
+    Args:
+        :param fake (FakeVault): the fake vault server.
+        :param concurrency (int): number of threads sharing the client.
+
+    Returns:
+        (VaultClient) client
+    """
+    client = VaultClient(
+        url=fake.url,
+        namespace=MOUNT,
+        auth={'type': 'approle', 'approle': {'id': 'benchmark', 'secret-id': 'benchmark'}},
+        dbengine={'mount_point': 'database'},
+        transport={'pool_maxsize': max(concurrency, 10)}
+    )
+    for index in range(10):
+        client.kv2engine.write_secret(path=f"secrets/secret-{index}", key='password', value=f"value-{index}")
+    return client
+
+
+def scenarios(client: VaultClient) -> dict:
+    """
+    A function for getting the benchmarked operations.
+
+    Args:
+        :param client (VaultClient): the client of the benchmarks.
+
+    Returns:
+        (dict) {'scenario': callable(index)}
+    """
+    return {
+        'read_secret': lambda index: client.kv2engine.read_secret(path=f"secrets/secret-{index % 10}", key='password'),
+        'write_secret': lambda index: client.kv2engine.write_secret(path=f"secrets/secret-{index % 10}", key='counter', value=str(index)),
+        'list_secrets': lambda index: client.kv2engine.list_secrets(path='secrets'),
+        'generate_credentials': lambda index: client.dbengine.generate_credentials(role=ROLE),
+        'reauthenticate': lambda index: client.reauthenticate(stale_client=client.client)
+    }
+
+
+def measure(operation: callable, operations: int, concurrency: int) -> dict:
+    """
+    A function for measuring the throughput and latency of the operation.
+
+    Args:
+        :param operation (callable): the benchmarked operation, receives the index of the call.
+        :param operations (int): number of calls.
+        :param concurrency (int): number of threads performing the calls.
+
+    Returns:
+        (dict) {'operations': 500, 'concurrency': 8, 'throughput': 1520.3, 'p50': 0.0051, 'p99': 0.0112, 'errors': 0}
+    """
+    def timed(index: int) -> float | None:
+        started = time.perf_counter()
+        try:
+            operation(index)
+        except Exception:  # pylint: disable=broad-exception-caught
+            return None
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed, range(operations)))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(result for result in results if result is not None)
+    return {
+        'operations': operations,
+        'concurrency': concurrency,
+        'throughput': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50': round(statistics.median(latencies), 6) if latencies else None,
+        'p99': round(latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)], 6) if latencies else None,
+        'errors': operations - len(latencies)
+    }
+
+
+def run(latency: float = 0.0, operations: int = 200, concurrency: list = None, names: list = None) -> dict:
+    """
+    A function for running the benchmarks.
+
+    Args:
+        :param latency (float): delay in seconds added by the fake vault to every request.
+        :param operations (int): number of calls for every scenario and concurrency level.
+        :param concurrency (list): concurrency levels.
+        :param names (list): names of the scenarios to run (all by default).
+
+    Returns:
+        (dict) {'read_secret': {'1': {'throughput': ..., 'p50': ..., 'p99': ...}, '8': {...}}}
+
+    Examples:
+        >>> run(latency=0.001, operations=100, concurrency=[1, 8], names=['read_secret'])
+    """
+    results = {}
+    with FakeVault(latency=latency) as fake:
+        for level in concurrency or [1, 8, 32]:
+            client = prepare_client(fake=fake, concurrency=level)
+            for name, operation in scenarios(client).items():
+                if names and name not in names:
+                    continue
+                results.setdefault(name, {})[str(level)] = measure(operation=operation, operations=operations, concurrency=level)
+            client.close()
+    return results
+
+
+def regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    A function for comparing the results with the baseline.
+
+    Args:
+        :param results (dict): the current results.
+        :param baseline (dict): the results of a previous run.
+        :param tolerance (float): allowed relative drop of the throughput.
+
+    Returns:
+        (list) descriptions of the scenarios whose throughput dropped more than the tolerance
+    """
+    found = []
+    for name, levels in results.items():
+        for level, result in levels.items():
+            previous = baseline.get(name, {}).get(level)
+            if previous and result['throughput'] < previous['throughput'] * (1 - tolerance):
+                found.append(f"{name} (concurrency {level}): {result['throughput']} ops/s < {previous['throughput']} ops/s")
+    return found
+
+
+def main(argv: list = None) -> int:
+    """
+    Entrypoint of the benchmarks.
+
+    Args:
+        :param argv (list): command line arguments.
+
+    Returns:
+        (int) exit code, 1 if a regression against the baseline was found
+    """
+    parser = argparse.ArgumentParser(description='Benchmarks of the vault package against the fake vault server')
+    parser.add_argument('--latency', type=float, default=0.0, help='delay in seconds added to every request')
+    parser.add_argument('--operations', type=int, default=200, help='number of calls per scenario and concurrency level')
+    parser.add_argument('--concurrency', default='1,8,32', help='comma-separated concurrency levels')
+    parser.add_argument('--scenarios', default='', help='comma-separated scenarios: ' + ', '.join(scenarios(None)))
+    parser.add_argument('--json', help='write the results to the file')
+    parser.add_argument('--baseline', help='compare the results with a previous json file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative drop of the throughput against the baseline')
+    args = parser.parse_args(argv)
+
+    results = run(
+        latency=args.latency,
+        operations=args.operations,
+        concurrency=[int(level) for level in args.concurrency.split(',')],
+        names=[name for name in args.scenarios.split(',') if name]
+    )
+    print(f"{'scenario':<22}{'threads':>8}{'ops/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, levels in results.items():
+        for level, result in levels.items():
+            p50 = result['p50'] * 1000 if result['p50'] is not None else float('nan')
+            p99 = result['p99'] * 1000 if result['p99'] is not None else float('nan')
+            print(f"{name:<22}{level:>8}{result['throughput']:>12.1f}{p50:>10.2f}{p99:>10.2f}{result['errors']:>8}")
+    if args.json:
+        with open(args.json, 'w', encoding='UTF-8') as output:
+            json.dump(results, output, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='UTF-8') as baseline:
+            found = regressions(results=results, baseline=json.load(baseline), tolerance=args.tolerance)
+        for regression in found:
+            print(f"regression: {regression}")
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,6 +3,7 @@ This module stores fixtures for performing tests.
 """
 import pytest
 import hvac
+from fake_vault import FakeVault
 from vault.client import VaultClient
 
 
@@ -139,3 +140,28 @@ def fixture_configurator_client(vault_url, namespace, prepare_vault):
         },
         dbengine={'mount_point': 'database'}
     )
+
+
+@pytest.fixture(name="cached_client", scope='session')
+def fixture_cached_client(vault_url, namespace, prepare_vault):
+    """Returns client with the enabled cache for the kv2 engine"""
+    return VaultClient(
+        url=vault_url,
+        namespace=namespace,
+        auth={
+            'type': 'approle',
+            'approle': {
+                'id': prepare_vault['id'],
+                'secret-id': prepare_vault['secret-id']
+            }
+        },
+        kv2engine={'cache': {'ttl': 5, 'max_size': 10, 'negative_ttl': 5}},
+        dbengine={'mount_point': 'database'}
+    )
+
+
+@pytest.fixture(name="fake_vault", scope='session')
+def fixture_fake_vault():
+    """Returns the in-process fake vault server"""
+    with FakeVault() as fake:
+        yield fake
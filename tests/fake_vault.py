@@ -0,0 +1,556 @@
+"""
+This module contains a lightweight in-process stand-in for the Vault HTTP API.
+Only the endpoints used by the vault package are implemented.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+HEALTH_STATUS = {'active': 200, 'standby': 429, 'performance_standby': 473, 'sealed': 503}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+# pylint: disable=too-many-instance-attributes
+class FakeVaultState:
+    """
+    In-memory state of the fake Vault server: tokens, kv2 mounts, database leases and transit keys.
+    """
+    def __init__(self, token_ttl: int = 3600, lease_duration: int = 3600, lease_max_ttl: int = None) -> None:
+        self.lock = threading.RLock()
+        self.token_ttl = token_ttl
+        self.lease_duration = lease_duration
+        self.lease_max_ttl = lease_max_ttl
+        self.tokens = {}
+        self.kv = {}
+        self.kv_config = {}
+        self.leases = {}
+        self.counters = {}
+        self.root_token = self.issue_token(ttl=0)
+
+    def issue_token(self, ttl: int = None) -> str:
+        """Creates a new token with the specified ttl (0 means the token never expires)"""
+        token = f"hvs.{uuid.uuid4().hex}"
+        ttl = self.token_ttl if ttl is None else ttl
+        with self.lock:
+            self.tokens[token] = {'ttl': ttl, 'issued': time.time(), 'expires': time.time() + ttl if ttl else None}
+        return token
+
+    def token_valid(self, token: str) -> bool:
+        """Checks that the token exists and has not expired"""
+        with self.lock:
+            info = self.tokens.get(token)
+            return bool(info) and (info['expires'] is None or info['expires'] > time.time())
+
+    def count(self, name: str) -> None:
+        """Increments the request counter for the endpoint"""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+
+class FakeVaultHandler(BaseHTTPRequestHandler):
+    """
+    Request handler for the fake Vault server.
+    """
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeVault/1.0'
+    disable_nagle_algorithm = True
+
+    # pylint: disable=invalid-name
+    def do_GET(self):
+        """Handles GET requests"""
+        self._dispatch('GET')
+
+    def do_POST(self):
+        """Handles POST requests"""
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        """Handles PUT requests"""
+        self._dispatch('PUT')
+
+    def do_PATCH(self):
+        """Handles PATCH requests"""
+        self._dispatch('PATCH')
+
+    def do_DELETE(self):
+        """Handles DELETE requests"""
+        self._dispatch('DELETE')
+
+    def do_LIST(self):
+        """Handles LIST requests"""
+        self._dispatch('LIST')
+    # pylint: enable=invalid-name
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Silences the default request logging"""
+
+    @property
+    def state(self) -> FakeVaultState:
+        """Returns the shared server state"""
+        return self.server.state
+
+    def _send(self, status: int, body: dict = None, headers: dict = None) -> None:
+        payload = json.dumps(body).encode('utf-8') if body is not None else b''
+        self.send_response(status)
+        if body is not None:
+            self.send_header('Content-Type', 'application/json')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        if payload:
+            self.wfile.write(payload)
+
+    def _error(self, status: int, message: str) -> None:
+        self._send(status, {'errors': [message]})
+
+    def _body(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _dispatch(self, method: str) -> None:
+        server = self.server
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+        path = parsed.path
+        if method == 'GET' and query.get('list') == ['true']:
+            method = 'LIST'
+        body = self._body() if method in ('POST', 'PUT', 'PATCH') else {}
+
+        if server.latency:
+            time.sleep(server.latency() if callable(server.latency) else server.latency)
+        for pattern, status in server.failures:
+            if re.search(pattern, path) and (server.failure_rate >= 1 or random.random() < server.failure_rate):
+                self._error(status, 'injected failure')
+                return
+
+        if server.role == 'sealed' and path != '/v1/sys/health':
+            self._error(503, 'Vault is sealed')
+            return
+        self.state.count(f"{method} {path}")
+        with self.state.lock:
+            server.counters[f"{method} {path}"] = server.counters.get(f"{method} {path}", 0) + 1
+            if self.headers.get('X-Vault-Index'):
+                server.last_index = self.headers.get('X-Vault-Index')
+        route = self._route(method, path)
+        if route is None:
+            self._error(404, f"no handler for route {path}")
+            return
+        handler, params, public = route
+        if not public and not self.state.token_valid(self.headers.get('X-Vault-Token')):
+            self._error(403, 'permission denied')
+            return
+        with self.state.lock:
+            handler(body=body, query=query, **params)
+
+    def _route(self, method: str, path: str):
+        routes = [
+            ('GET', r'^/v1/sys/health$', self._health, True),
+            ('POST', r'^/v1/auth/(?P<mount>[^/]+)/login$', self._login, True),
+            ('PUT', r'^/v1/auth/(?P<mount>[^/]+)/login$', self._login, True),
+            ('GET', r'^/v1/auth/token/lookup-self$', self._lookup_self, False),
+            ('POST', r'^/v1/auth/token/renew-self$', self._renew_self, False),
+            ('PUT', r'^/v1/auth/token/renew-self$', self._renew_self, False),
+            ('PUT', r'^/v1/sys/leases/renew$', self._renew_lease, False),
+            ('POST', r'^/v1/sys/leases/renew$', self._renew_lease, False),
+            ('PUT', r'^/v1/sys/leases/revoke$', self._revoke_lease, False),
+            ('POST', r'^/v1/sys/leases/revoke$', self._revoke_lease, False),
+            ('GET', r'^/v1/(?P<mount>[^/]+)/creds/(?P<role>.+)$', self._db_creds, False),
+            ('GET', r'^/v1/(?P<mount>[^/]+)/config$', self._kv_read_config, False),
+            ('POST', r'^/v1/(?P<mount>[^/]+)/config$', self._kv_write_config, False),
+            ('GET', r'^/v1/(?P<mount>[^/]+)/data/(?P<path>.+)$', self._kv_read, False),
+            ('POST', r'^/v1/(?P<mount>[^/]+)/data/(?P<path>.+)$', self._kv_write, False),
+            ('PUT', r'^/v1/(?P<mount>[^/]+)/data/(?P<path>.+)$', self._kv_write, False),
+            ('PATCH', r'^/v1/(?P<mount>[^/]+)/data/(?P<path>.+)$', self._kv_patch, False),
+            ('GET', r'^/v1/(?P<mount>[^/]+)/metadata/(?P<path>.+)$', self._kv_metadata, False),
+            ('POST', r'^/v1/(?P<mount>[^/]+)/metadata/(?P<path>.+)$', self._kv_write_metadata, False),
+            ('LIST', r'^/v1/(?P<mount>[^/]+)/metadata/?(?P<path>.*)$', self._kv_list, False),
+            ('DELETE', r'^/v1/(?P<mount>[^/]+)/metadata/(?P<path>.+)$', self._kv_delete, False),
+            ('POST', r'^/v1/(?P<mount>[^/]+)/encrypt/(?P<name>[^/]+)$', self._transit_encrypt, False),
+            ('POST', r'^/v1/(?P<mount>[^/]+)/decrypt/(?P<name>[^/]+)$', self._transit_decrypt, False),
+            ('POST', r'^/v1/(?P<mount>[^/]+)/rewrap/(?P<name>[^/]+)$', self._transit_rewrap, False),
+            ('POST', r'^/v1/(?P<mount>[^/]+)/sign/(?P<name>[^/]+)(/(?P<hash_algorithm>[^/]+))?$', self._transit_sign, False),
+            ('POST', r'^/v1/(?P<mount>[^/]+)/verify/(?P<name>[^/]+)(/(?P<hash_algorithm>[^/]+))?$', self._transit_verify, False),
+        ]
+        for route_method, pattern, handler, public in routes:
+            if route_method != method:
+                continue
+            match = re.match(pattern, path)
+            if match:
+                return handler, {k: v for k, v in match.groupdict().items() if v is not None}, public
+        return None
+
+    # System
+    def _health(self, **_):
+        role = self.server.role
+        self._send(HEALTH_STATUS[role], {
+            'initialized': True,
+            'sealed': role == 'sealed',
+            'standby': role != 'active',
+            'performance_standby': role == 'performance_standby'
+        })
+
+    # Authentication
+    def _login(self, mount: str, body: dict, **_):
+        if self.server.login_checker and not self.server.login_checker(mount, body):
+            self._error(400, 'invalid credentials')
+            return
+        token = self.state.issue_token()
+        self._send(200, {
+            'request_id': str(uuid.uuid4()),
+            'auth': {
+                'client_token': token,
+                'lease_duration': self.state.token_ttl,
+                'renewable': True,
+                'policies': ['default'],
+                'metadata': {'mount': mount}
+            }
+        })
+
+    def _lookup_self(self, **_):
+        token = self.headers.get('X-Vault-Token')
+        info = self.state.tokens[token]
+        ttl = int(info['expires'] - time.time()) if info['expires'] else 0
+        self._send(200, {'request_id': str(uuid.uuid4()), 'data': {'id': token, 'ttl': ttl, 'renewable': bool(info['ttl']), 'creation_ttl': info['ttl']}})
+
+    def _renew_self(self, body: dict, **_):
+        token = self.headers.get('X-Vault-Token')
+        info = self.state.tokens[token]
+        increment = int(body.get('increment') or info['ttl'])
+        if info['ttl']:
+            info['expires'] = time.time() + increment
+        self._send(200, {'request_id': str(uuid.uuid4()), 'auth': {'client_token': token, 'lease_duration': increment, 'renewable': True}})
+
+    # Database engine
+    def _db_creds(self, mount: str, role: str, **_):
+        lease_id = f"{mount}/creds/{role}/{uuid.uuid4().hex}"
+        self.state.leases[lease_id] = {'expires': time.time() + self.state.lease_duration, 'issued': time.time()}
+        self._send(200, {
+            'request_id': str(uuid.uuid4()),
+            'lease_id': lease_id,
+            'lease_duration': self.state.lease_duration,
+            'renewable': True,
+            'data': {'username': f"v-{role}-{uuid.uuid4().hex[:8]}", 'password': uuid.uuid4().hex}
+        })
+
+    def _renew_lease(self, body: dict, **_):
+        lease = self.state.leases.get(body.get('lease_id'))
+        if not lease:
+            self._error(400, 'lease not found')
+            return
+        increment = int(body.get('increment') or self.state.lease_duration)
+        if self.state.lease_max_ttl:
+            increment = max(min(increment, int(lease['issued'] + self.state.lease_max_ttl - time.time())), 0)
+        lease['expires'] = time.time() + increment
+        self._send(200, {'request_id': str(uuid.uuid4()), 'lease_id': body['lease_id'], 'lease_duration': increment, 'renewable': True})
+
+    def _revoke_lease(self, body: dict, **_):
+        self.state.leases.pop(body.get('lease_id'), None)
+        self._send(204)
+
+    # KV2 engine
+    def _mount(self, mount: str) -> dict:
+        return self.state.kv.setdefault(mount, {})
+
+    def _kv_read_config(self, mount: str, **_):
+        config = self.state.kv_config.get(mount, {'max_versions': 0, 'cas_required': False, 'delete_version_after': '0s'})
+        self._send(200, {'request_id': str(uuid.uuid4()), 'data': config})
+
+    def _kv_write_config(self, mount: str, body: dict, **_):
+        config = self.state.kv_config.setdefault(mount, {'max_versions': 0, 'cas_required': False, 'delete_version_after': '0s'})
+        config.update({k: v for k, v in body.items() if v is not None})
+        self._send(204)
+
+    def _kv_read(self, mount: str, path: str, query: dict, **_):
+        secret = self._mount(mount).get(path)
+        if not secret or not secret['versions']:
+            self._error(404, '')
+            return
+        version = int(query.get('version', ['0'])[0]) or secret['current_version']
+        entry = secret['versions'].get(version)
+        if not entry or entry['destroyed'] or entry['deletion_time']:
+            self._error(404, '')
+            return
+        self._send(200, {
+            'request_id': str(uuid.uuid4()),
+            'data': {
+                'data': entry['data'],
+                'metadata': {'version': version, 'created_time': entry['created_time'], 'deletion_time': '', 'destroyed': False}
+            }
+        })
+
+    def _kv_store(self, mount: str, path: str, data: dict, options: dict) -> None:
+        secret = self._mount(mount).setdefault(path, {'versions': {}, 'current_version': 0, 'created_time': _now()})
+        cas_required = self.state.kv_config.get(mount, {}).get('cas_required', False)
+        if 'cas' in options or cas_required:
+            if 'cas' not in options:
+                self._error(400, 'check-and-set parameter required for this call')
+                return
+            if int(options['cas']) != secret['current_version']:
+                self._error(400, 'check-and-set parameter did not match the current version')
+                return
+        version = secret['current_version'] + 1
+        secret['versions'][version] = {'data': data, 'created_time': _now(), 'deletion_time': '', 'destroyed': False}
+        secret['current_version'] = version
+        secret['updated_time'] = _now()
+        max_versions = self.state.kv_config.get(mount, {}).get('max_versions') or 10
+        for old in sorted(secret['versions'])[:-max_versions]:
+            del secret['versions'][old]
+        self._send(200, {
+            'request_id': str(uuid.uuid4()),
+            'data': {'version': version, 'created_time': secret['versions'][version]['created_time'], 'deletion_time': '', 'destroyed': False}
+        }, headers={'X-Vault-Index': base64.b64encode(f"index-{version}".encode()).decode()})
+
+    def _kv_write(self, mount: str, path: str, body: dict, **_):
+        self._kv_store(mount, path, body.get('data', {}), body.get('options', {}))
+
+    def _kv_patch(self, mount: str, path: str, body: dict, **_):
+        if self.headers.get('Content-Type') != 'application/merge-patch+json':
+            self._error(415, 'unsupported content type')
+            return
+        secret = self._mount(mount).get(path)
+        if not secret or not secret['versions']:
+            self._error(404, '')
+            return
+        data = dict(secret['versions'][secret['current_version']]['data'])
+        for key, value in body.get('data', {}).items():
+            if value is None:
+                data.pop(key, None)
+            else:
+                data[key] = value
+        self._kv_store(mount, path, data, body.get('options', {}))
+
+    def _kv_metadata(self, mount: str, path: str, **_):
+        secret = self._mount(mount).get(path)
+        if not secret:
+            self._error(404, '')
+            return
+        self._send(200, {
+            'request_id': str(uuid.uuid4()),
+            'data': {
+                'current_version': secret['current_version'],
+                'oldest_version': min(secret['versions']) if secret['versions'] else 0,
+                'created_time': secret['created_time'],
+                'updated_time': secret.get('updated_time', secret['created_time']),
+                'max_versions': 0,
+                'cas_required': False,
+                'custom_metadata': secret.get('custom_metadata'),
+                'versions': {
+                    str(version): {'created_time': entry['created_time'], 'deletion_time': entry['deletion_time'], 'destroyed': entry['destroyed']}
+                    for version, entry in secret['versions'].items()
+                }
+            }
+        })
+
+    def _kv_write_metadata(self, mount: str, path: str, body: dict, **_):
+        secret = self._mount(mount).setdefault(path, {'versions': {}, 'current_version': 0, 'created_time': _now()})
+        if 'custom_metadata' in body:
+            secret['custom_metadata'] = body['custom_metadata']
+        self._send(204)
+
+    def _kv_list(self, mount: str, path: str, **_):
+        prefix = path.strip('/')
+        prefix = f"{prefix}/" if prefix else ''
+        keys = set()
+        for secret_path in self._mount(mount):
+            if secret_path.startswith(prefix):
+                rest = secret_path[len(prefix):]
+                keys.add(rest.split('/', 1)[0] + '/' if '/' in rest else rest)
+        if not keys:
+            self._error(404, '')
+            return
+        self._send(200, {'request_id': str(uuid.uuid4()), 'data': {'keys': sorted(keys)}})
+
+    def _kv_delete(self, mount: str, path: str, **_):
+        self._mount(mount).pop(path, None)
+        self._send(204)
+
+    # Transit engine
+    def _transit_items(self, body: dict, field: str) -> list:
+        if 'batch_input' in body:
+            return body['batch_input']
+        return [{field: body.get(field), 'context': body.get('context')}]
+
+    def _transit_reply(self, body: dict, results: list) -> None:
+        if 'batch_input' in body:
+            self._send(200, {'request_id': str(uuid.uuid4()), 'data': {'batch_results': results}})
+        elif 'error' in results[0]:
+            self._error(400, results[0]['error'])
+        else:
+            self._send(200, {'request_id': str(uuid.uuid4()), 'data': results[0]})
+
+    def _transit_encrypt(self, name: str, body: dict, **_):
+        results = []
+        for item in self._transit_items(body, 'plaintext'):
+            try:
+                base64.b64decode(item['plaintext'], validate=True)
+                results.append({'ciphertext': f"vault:v1:{name}:{item['plaintext']}", 'key_version': 1})
+            except (TypeError, ValueError):
+                results.append({'error': 'failed to base64-decode plaintext'})
+        self._transit_reply(body, results)
+
+    def _transit_decrypt(self, name: str, body: dict, **_):
+        results = []
+        for item in self._transit_items(body, 'ciphertext'):
+            prefix = f"vault:v1:{name}:"
+            if isinstance(item.get('ciphertext'), str) and item['ciphertext'].startswith(prefix):
+                results.append({'plaintext': item['ciphertext'][len(prefix):]})
+            else:
+                results.append({'error': 'invalid ciphertext: no prefix'})
+        self._transit_reply(body, results)
+
+    def _transit_rewrap(self, name: str, body: dict, **_):
+        results = []
+        for item in self._transit_items(body, 'ciphertext'):
+            prefix = f"vault:v1:{name}:"
+            if isinstance(item.get('ciphertext'), str) and item['ciphertext'].startswith(prefix):
+                results.append({'ciphertext': item['ciphertext'], 'key_version': 1})
+            else:
+                results.append({'error': 'invalid ciphertext: no prefix'})
+        self._transit_reply(body, results)
+
+    def _signature(self, name: str, data: str) -> str:
+        digest = hmac.new(name.encode(), data.encode(), hashlib.sha256).digest()
+        return f"vault:v1:{base64.b64encode(digest).decode()}"
+
+    def _transit_sign(self, name: str, body: dict, **_):
+        results = [{'signature': self._signature(name, item['input']), 'key_version': 1} for item in self._transit_items(body, 'input')]
+        self._transit_reply(body, results)
+
+    def _transit_verify(self, name: str, body: dict, **_):
+        items = body['batch_input'] if 'batch_input' in body else [{'input': body.get('input'), 'signature': body.get('signature')}]
+        results = [{'valid': self._signature(name, item['input']) == item.get('signature')} for item in items]
+        self._transit_reply(body, results)
+
+
+class FakeVaultServer(ThreadingHTTPServer):
+    """
+    Threading HTTP server with a listen backlog large enough for the concurrent benchmarks.
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class FakeVault:
+    """
+    In-process fake Vault server.
+
+    Args:
+        :param latency (float | callable): delay in seconds added to every request (or a callable returning it).
+        :param token_ttl (int): ttl of the tokens issued by the login endpoints.
+        :param lease_duration (int): lease duration of the database credentials.
+        :param lease_max_ttl (int): maximum ttl of the database credentials leases.
+        :param state (FakeVaultState): state shared with other servers to emulate the nodes of a cluster.
+        :param role (str): role reported by the health endpoint: active, standby, performance_standby or sealed.
+
+    Examples:
+        >>> with FakeVault(latency=0.005) as fake:
+        ...     client = VaultClient(url=fake.url, namespace='test', auth={'type': 'token', 'token': fake.root_token})
+        ...     fake.inject_failure(r'/data/', status=503, rate=0.1)
+        >>> with FakeVault() as active, FakeVault(state=active.state, role='performance_standby') as standby:
+        ...     client = VaultClient(url=[active.url, standby.url], namespace='test')
+    """
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(
+        self,
+        latency: float = 0.0,
+        token_ttl: int = 3600,
+        lease_duration: int = 3600,
+        lease_max_ttl: int = None,
+        state: FakeVaultState = None,
+        role: str = 'active'
+    ) -> None:
+        self.server = FakeVaultServer(('127.0.0.1', 0), FakeVaultHandler)
+        self.server.state = state or FakeVaultState(token_ttl=token_ttl, lease_duration=lease_duration, lease_max_ttl=lease_max_ttl)
+        self.server.role = role
+        self.server.counters = {}
+        self.server.last_index = None
+        self.server.latency = latency
+        self.server.failures = []
+        self.server.failure_rate = 1.0
+        self.server.login_checker = None
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        """Returns the base url of the server"""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def state(self) -> FakeVaultState:
+        """Returns the server state"""
+        return self.server.state
+
+    @property
+    def root_token(self) -> str:
+        """Returns a token that never expires"""
+        return self.state.root_token
+
+    @property
+    def last_index(self) -> str | None:
+        """Returns the last X-Vault-Index header received by the server"""
+        return self.server.last_index
+
+    def set_role(self, role: str) -> None:
+        """Changes the role reported by the health endpoint"""
+        self.server.role = role
+
+    def set_latency(self, latency) -> None:
+        """Sets the delay added to every request"""
+        self.server.latency = latency
+
+    def inject_failure(self, pattern: str, status: int = 503, rate: float = 1.0) -> None:
+        """Makes requests whose path matches the pattern fail with the status code"""
+        self.server.failures.append((pattern, status))
+        self.server.failure_rate = rate
+
+    def clear_failures(self) -> None:
+        """Removes all injected failures"""
+        self.server.failures = []
+
+    def expire_tokens(self) -> None:
+        """Expires all issued tokens except the root token"""
+        with self.state.lock:
+            for token, info in self.state.tokens.items():
+                if token != self.root_token:
+                    info['expires'] = time.time() - 1
+
+    def requests(self, name: str = None) -> int:
+        """Returns the number of requests sent to the endpoint (or to all endpoints) of this server"""
+        with self.state.lock:
+            if name:
+                return sum(value for key, value in self.server.counters.items() if re.search(name, key))
+            return sum(self.server.counters.values())
+
+    def start(self) -> 'FakeVault':
+        """Starts serving requests in a background thread"""
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stops the server"""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> 'FakeVault':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
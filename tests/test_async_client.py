@@ -0,0 +1,50 @@
+"""
+This test is necessary to check how the asyncio client works with the secrets of the vault instance.
+"""
+import asyncio
+import pytest
+from vault import AsyncVaultClient
+
+httpx = pytest.importorskip('httpx')
+
+
+@pytest.mark.order(13)
+def test_async_kv2engine(vault_url, namespace, prepare_vault, test_data):
+    """
+    Testing writing, reading, listing and deleting a secret with the asyncio client
+    """
+    async def scenario():
+        async with AsyncVaultClient(
+            url=vault_url,
+            namespace=namespace,
+            auth={'type': 'approle', 'approle': {'id': prepare_vault['id'], 'secret-id': prepare_vault['secret-id']}}
+        ) as client:
+            path = 'configuration/async'
+            response = await client.kv2engine.write_secrets(path=path, secrets=test_data)
+            assert response['request_id']
+            values = await asyncio.gather(*[client.kv2engine.read_secret(path=path, key=key) for key in test_data])
+            assert values == list(test_data.values())
+            assert 'async' in await client.kv2engine.list_secrets(path='configuration/')
+            assert await client.kv2engine.delete_secret(path=path) is True
+            assert await client.kv2engine.read_secret(path=path) is None
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.order(14)
+def test_async_generate_credentials(vault_url, namespace, prepare_vault):
+    """
+    Testing the generation of database credentials with the asyncio client
+    """
+    async def scenario():
+        async with AsyncVaultClient(
+            url=vault_url,
+            namespace=namespace,
+            auth={'type': 'approle', 'approle': {'id': prepare_vault['id'], 'secret-id': prepare_vault['secret-id']}},
+            dbengine={'mount_point': 'database'}
+        ) as client:
+            response = await client.dbengine.generate_credentials(role='test-role')
+            assert response['username'] is not None
+            assert response['password'] is not None
+
+    asyncio.run(scenario())
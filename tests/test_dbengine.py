@@ -1,7 +1,10 @@
 """
 This test is necessary to check how the module works with the secrets of the vault instance.
 """
+import time
 import pytest
+from fake_vault import FakeVault
+from vault import VaultClient
 
 
 @pytest.mark.order(8)
@@ -13,3 +16,55 @@ def test_generate_credentials(approle_client):
     assert isinstance(response, dict)
     assert response['username'] is not None
     assert response['password'] is not None
+
+
+@pytest.mark.order(16)
+def test_get_credentials(approle_client):
+    """
+    Testing reusing of database credentials while their lease is valid
+    """
+    first = approle_client.dbengine.get_credentials(role='test-role', on_rotate=lambda role, old, new: None)
+    second = approle_client.dbengine.get_credentials(role='test-role')
+    assert first == second
+    assert first['username'] is not None
+    leases = approle_client.dbengine.credentials.leases()
+    assert leases['test-role']['lease_id']
+    approle_client.dbengine.close()
+    assert approle_client.dbengine.credentials.leases() == {}
+
+
+@pytest.mark.order(33)
+def test_credential_pool():
+    """
+    Testing the credentials generated ahead of demand: refill, replacement of the unused sets and revocation on close
+    """
+    with FakeVault(latency=0.05, lease_duration=2) as fake:
+        client = VaultClient(
+            url=fake.url,
+            namespace='fake',
+            auth={'type': 'approle', 'approle': {'id': 'fake', 'secret-id': 'fake'}},
+            dbengine={'mount_point': 'database', 'pools': {'pooled': {'size': 3, 'workers': 3}}},
+            metrics=True
+        )
+        pool = client.dbengine.pool(role='pooled')
+        deadline = time.monotonic() + 5
+        while pool.stats()['ready'] < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        started = time.perf_counter()
+        users = [client.dbengine.take_credentials(role='pooled')['username'] for _ in range(3)]
+        assert time.perf_counter() - started < 0.05
+        assert len(set(users)) == 3
+        # the empty pool is refilled while the caller waits
+        assert client.dbengine.take_credentials(role='pooled', timeout=5)['username'] not in users
+        assert pool.stats()['waits'] == 1
+        assert 'vault_credential_pool_wait_seconds_count{role="pooled"} 4' in client.metrics.export_prometheus()
+
+        # the unused sets are replaced after the half of their lease
+        deadline = time.monotonic() + 5
+        while (pool.stats()['revoked'] < 1 or pool.stats()['ready'] < 3) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert pool.stats()['revoked'] >= 1
+        assert pool.stats()['ready'] == 3
+        # only the leases of the taken credentials are left
+        client.close()
+        assert len(fake.state.leases) == 4
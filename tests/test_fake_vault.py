@@ -0,0 +1,368 @@
+"""
+This test is necessary to check the fake vault server and the benchmarks running against it.
+"""
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import hvac
+from requests.exceptions import ConnectTimeout, ReadTimeout
+from benchmarks import run
+from fake_vault import FakeVault
+from vault import VaultClient
+from vault.agent import Agent
+from vault.exceptions import CircuitOpenError
+from vault.retry import is_transient
+
+
+@pytest.mark.order(20)
+def test_fake_vault_client(fake_vault):
+    """
+    Testing the client against the fake vault server with the injected failures
+    """
+    client = VaultClient(
+        url=fake_vault.url,
+        namespace='fake',
+        auth={'type': 'approle', 'approle': {'id': 'fake', 'secret-id': 'fake'}},
+        dbengine={'mount_point': 'database'}
+    )
+    client.kv2engine.write_secret(path='fake/secret', key='key', value='value')
+    assert client.kv2engine.read_secret(path='fake/secret', key='key') == 'value'
+    assert client.kv2engine.list_secrets(path='fake') == ['secret']
+    assert client.dbengine.generate_credentials(role='fake-role')['username']
+
+    fake_vault.inject_failure(pattern=r'^/v1/fake/data/', status=503)
+    with pytest.raises(hvac.exceptions.VaultDown):
+        client.kv2engine.read_secret(path='fake/secret', key='key')
+    fake_vault.clear_failures()
+    client.close()
+
+
+@pytest.mark.order(21)
+def test_benchmarks():
+    """
+    Testing the benchmarks of the hot paths
+    """
+    results = run(latency=0.001, operations=20, concurrency=[1, 4])
+    assert set(results) == {'read_secret', 'write_secret', 'list_secrets', 'generate_credentials', 'reauthenticate'}
+    for levels in results.values():
+        for result in levels.values():
+            assert result['errors'] == 0
+            assert result['throughput'] > 0
+            assert result['p50'] <= result['p99']
+
+
+@pytest.mark.order(25)
+def test_retry_and_circuit_breaker(fake_vault):
+    """
+    Testing the retries of the transient errors, the circuit breaker and the stale secrets from the cache
+    """
+    client = VaultClient(
+        url=fake_vault.url,
+        namespace='fake',
+        auth={'type': 'approle', 'approle': {'id': 'fake', 'secret-id': 'fake'}},
+        kv2engine={'cache': {'ttl': 0.1, 'serve_stale': True}},
+        retry={'max_attempts': 3, 'backoff': 0.01},
+        circuit_breaker={'failure_threshold': 3, 'recovery_timeout': 0.5}
+    )
+    client.kv2engine.write_secret(path='fake/resilient', key='key', value='value')
+    assert client.kv2engine.read_secret(path='fake/resilient', key='key') == 'value'
+    time.sleep(0.2)
+
+    fake_vault.inject_failure(pattern=r'^/v1/fake/', status=503)
+    assert client.kv2engine.read_secret(path='fake/resilient', key='key') == 'value'
+    assert client.circuit_breaker.state('KV2Engine.read_secret') == 'open'
+    with pytest.raises(hvac.exceptions.VaultDown):
+        client.kv2engine.list_secrets(path='fake')
+    with pytest.raises(CircuitOpenError):
+        client.kv2engine.list_secrets(path='fake')
+    fake_vault.clear_failures()
+
+    time.sleep(0.6)
+    assert client.kv2engine.list_secrets(path='fake')
+    assert client.circuit_breaker.state('KV2Engine.list_secrets') == 'closed'
+    client.close()
+
+
+@pytest.mark.order(25)
+def test_retry_not_idempotent(fake_vault, monkeypatch):
+    """
+    Testing that the generation of credentials is retried only if the request has not been executed
+    """
+    assert is_transient(ReadTimeout(), idempotent=True)
+    assert not is_transient(ReadTimeout(), idempotent=False)
+    assert is_transient(ConnectTimeout(), idempotent=False)
+    assert not is_transient(hvac.exceptions.InternalServerError(), idempotent=False)
+
+    client = VaultClient(
+        url=fake_vault.url,
+        namespace='fake',
+        auth={'type': 'approle', 'approle': {'id': 'fake', 'secret-id': 'fake'}},
+        dbengine={'mount_point': 'database'},
+        retry={'max_attempts': 3, 'backoff': 0.01}
+    )
+    calls = []
+    database = client.dbengine.client.secrets.database
+    generate_credentials = database.generate_credentials
+
+    def counting(**kwargs):
+        calls.append(kwargs['name'])
+        return generate_credentials(**kwargs)
+    monkeypatch.setattr(database, 'generate_credentials', counting)
+
+    fake_vault.inject_failure(pattern=r'^/v1/database/creds/', status=500)
+    with pytest.raises(hvac.exceptions.InternalServerError):
+        client.dbengine.generate_credentials(role='fake-role')
+    assert len(calls) == 1
+    fake_vault.clear_failures()
+
+    fake_vault.inject_failure(pattern=r'^/v1/database/creds/', status=503)
+    with pytest.raises(hvac.exceptions.VaultDown):
+        client.dbengine.generate_lease(role='fake-role')
+    assert len(calls) == 4
+    fake_vault.clear_failures()
+    assert client.dbengine.generate_credentials(role='fake-role')['username']
+    client.close()
+
+
+@pytest.mark.order(26)
+def test_cluster_routing():
+    """
+    Testing the routing of the reads to the performance standby, the writes to the active node and the failover
+    """
+    with FakeVault() as active, FakeVault(state=active.state, role='performance_standby') as standby:
+        client = VaultClient(
+            url=[active.url, standby.url],
+            namespace='fake',
+            auth={'type': 'approle', 'approle': {'id': 'fake', 'secret-id': 'fake'}},
+            cluster={'probe_interval': 0.1}
+        )
+        client.kv2engine.write_secret(path='fake/routed', key='key', value='value')
+        assert client.kv2engine.read_secret(path='fake/routed', key='key') == 'value'
+        assert client.kv2engine.list_secrets(path='fake') == ['routed']
+        assert active.requests(r'^(POST|PATCH|PUT) /v1/fake/data/') >= 1
+        assert active.requests(r'^(GET|LIST) /v1/fake/(data|metadata)/') == 0
+        assert standby.requests(r'^(GET|LIST) /v1/fake/(data|metadata)/') >= 2
+        assert client.cluster.index is not None
+        assert standby.last_index == client.cluster.index
+
+        # the standby is sealed, the reads fail over to the active node
+        standby.set_role('sealed')
+        assert client.kv2engine.read_secret(path='fake/routed', key='key') == 'value'
+        assert client.cluster.stats()[standby.url]['healthy'] == 0
+        standby.set_role('performance_standby')
+        time.sleep(0.3)
+        assert client.cluster.stats()[standby.url]['healthy'] == 1
+        client.close()
+
+
+@pytest.mark.order(26)
+def test_cluster_metrics():
+    """
+    Testing that the writes of the multi-node client keep the response hooks of the session, such as the traffic metrics
+    """
+    with FakeVault() as active, FakeVault(state=active.state, role='performance_standby') as standby:
+        client = VaultClient(
+            url=[active.url, standby.url],
+            namespace='fake',
+            auth={'type': 'approle', 'approle': {'id': 'fake', 'secret-id': 'fake'}},
+            cluster={'probe_interval': 0.1},
+            metrics=True
+        )
+        client.kv2engine.read_secret(path='fake/metered')
+        sent = client.metrics.snapshot()['counters'][('bytes_sent_total', ())]
+        client.kv2engine.write_secrets(path='fake/metered', secrets={'key': 'value'})
+        assert client.metrics.snapshot()['counters'][('bytes_sent_total', ())] > sent
+        assert client.cluster.index is not None
+        client.close()
+
+
+@pytest.mark.order(27)
+def test_request_coalescing(fake_vault):
+    """
+    Testing the coalescing of the concurrent identical reads and credential generations
+    """
+    client = VaultClient(
+        url=fake_vault.url,
+        namespace='fake',
+        auth={'type': 'approle', 'approle': {'id': 'fake', 'secret-id': 'fake'}},
+        dbengine={'mount_point': 'database', 'coalesce': True}
+    )
+    client.kv2engine.write_secret(path='fake/coalesced', key='key', value='value')
+    reads = fake_vault.requests(r'^GET /v1/fake/data/fake/coalesced$')
+    credentials = fake_vault.requests(r'^GET /v1/database/creds/')
+    fake_vault.set_latency(0.1)
+    try:
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            secrets = list(executor.map(lambda _: client.kv2engine.read_secret(path='fake/coalesced'), range(16)))
+            users = list(executor.map(lambda _: client.dbengine.generate_credentials(role='coalesced'), range(16)))
+    finally:
+        fake_vault.set_latency(0.0)
+    assert secrets == [{'key': 'value'}] * 16
+    assert len({id(secret) for secret in secrets}) == 16
+    assert fake_vault.requests(r'^GET /v1/fake/data/fake/coalesced$') - reads == 1
+    assert len({user['username'] for user in users}) == 1
+    assert fake_vault.requests(r'^GET /v1/database/creds/') - credentials == 1
+    client.close()
+
+
+@pytest.mark.order(32)
+def test_fork_safety(fake_vault):
+    """
+    Testing the client created before fork: new connections in the child processes and the token handoff
+    """
+    configuration = {
+        'url': fake_vault.url,
+        'namespace': 'fake',
+        'auth': {'type': 'approle', 'approle': {'id': 'fake', 'secret-id': 'fake'}}
+    }
+    shared = VaultClient(**configuration, token_handoff=True)
+    separate = VaultClient(**configuration)
+    shared.kv2engine.write_secret(path='fake/forked', key='key', value='value')
+    assert separate.kv2engine.read_secret(path='fake/forked', key='key') == 'value'
+    session = shared.transport.session
+
+    def worker(client, inherited):
+        forked = client.kv2engine.read_secret(path='fake/forked', key='key') == 'value' and client.transport.session is not inherited
+        os._exit(0 if forked else 1)  # pylint: disable=protected-access
+
+    for client, logins in ((shared, 0), (separate, 4)):
+        before = fake_vault.requests(r'^(POST|PUT) /v1/auth/fake/login$')
+        workers = [multiprocessing.get_context('fork').Process(target=worker, args=(client, client.transport.session)) for _ in range(4)]
+        for process in workers:
+            process.start()
+        for process in workers:
+            process.join(timeout=30)
+        assert [process.exitcode for process in workers] == [0] * 4
+        assert fake_vault.requests(r'^(POST|PUT) /v1/auth/fake/login$') - before == logins
+
+    # the parent process keeps its connections and token
+    assert shared.kv2engine.read_secret(path='fake/forked', key='key') == 'value'
+    assert shared.transport.session is session
+
+    # after the rollover of the parent token the children reuse the new token instead of logging in each
+    rollover = multiprocessing.get_context('fork').Event()
+
+    def rolled_over(client):
+        rollover.wait(timeout=10)
+        os._exit(0 if client.kv2engine.read_secret(path='fake/forked', key='key') == 'value' else 1)  # pylint: disable=protected-access
+
+    workers = [multiprocessing.get_context('fork').Process(target=rolled_over, args=(shared,)) for _ in range(4)]
+    for process in workers:
+        process.start()
+    before = fake_vault.requests(r'^(POST|PUT) /v1/auth/fake/login$')
+    fake_vault.expire_tokens()
+    assert shared.kv2engine.read_secret(path='fake/forked', key='key') == 'value'
+    rollover.set()
+    for process in workers:
+        process.join(timeout=30)
+    assert [process.exitcode for process in workers] == [0] * 4
+    assert fake_vault.requests(r'^(POST|PUT) /v1/auth/fake/login$') - before == 1
+    shared.close()
+    separate.close()
+
+
+@pytest.mark.order(35)
+def test_agent(tmp_path):
+    """
+    Testing the agent: the initial render, the render of only the changed templates and of the rotated database credentials
+    """
+    signals = []
+    previous = signal.signal(signal.SIGUSR1, lambda *_: signals.append(1))
+    with FakeVault(lease_duration=2, lease_max_ttl=1.5) as fake:
+        client = VaultClient(
+            url=fake.url,
+            namespace='fake',
+            auth={'type': 'approle', 'approle': {'id': 'fake', 'secret-id': 'fake'}},
+            dbengine={'mount_point': 'database', 'leases': {'revoke_on_exit': False}}
+        )
+        client.kv2engine.write_secrets(path='agent/db', secrets={'host': 'postgres', 'password': 'qwerty'})
+        client.kv2engine.write_secret(path='agent/api', key='token', value='first')
+        agent = Agent(
+            vault_client=client,
+            interval=0.1,
+            max_interval=0.2,
+            notify={'pid': os.getpid(), 'signal': 'SIGUSR1'},
+            templates=[
+                {'destination': str(tmp_path / 'db.env'), 'contents': 'HOST={{ kv agent/db host }}\nUSER={{ db readonly username }}\n'},
+                {'destination': str(tmp_path / 'api.json'), 'contents': '{{ kv agent/api }}', 'mode': '0640'}
+            ]
+        )
+        thread = threading.Thread(target=agent.run)
+        thread.start()
+        try:
+            deadline = time.monotonic() + 5
+            while agent.stats()['writes'] < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            user = (tmp_path / 'db.env').read_text().split('USER=')[1]
+            assert (tmp_path / 'api.json').read_text() == '{"token": "first"}'
+            assert os.stat(tmp_path / 'api.json').st_mode & 0o777 == 0o640
+            assert signals == [1]
+
+            # only the template of the changed secret is rendered again
+            client.kv2engine.write_secret(path='agent/api', key='token', value='second')
+            while agent.stats()['writes'] < 3 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert (tmp_path / 'api.json').read_text() == '{"token": "second"}'
+            assert agent.stats()['renders'] == 3
+
+            # the lease reaches max_ttl and the template with the new credentials is rendered again
+            while agent.stats()['writes'] < 4 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert (tmp_path / 'db.env').read_text().split('USER=')[1] != user
+            assert signals == [1, 1, 1]
+            assert sorted(os.listdir(tmp_path)) == ['api.json', 'db.env']
+        finally:
+            agent.stop()
+            thread.join(timeout=5)
+            client.close()
+            signal.signal(signal.SIGUSR1, previous)
+    assert not thread.is_alive()
+
+
+def _start_with_token_cache(url: str, file: str) -> None:
+    """Authenticates the client of a restarted process with the token cache"""
+    VaultClient(url=url, namespace='fake', auth={'type': 'approle', 'approle': {'id': 'fake', 'secret-id': 'fake'}}, token_cache={'file': file, 'encrypt': False})
+
+
+@pytest.mark.order(37)
+def test_token_cache(fake_vault, tmp_path):
+    """
+    Testing the reuse of the cached token by the restarted processes and the login when the cached token is rejected
+    """
+    file = str(tmp_path / 'token')
+    logins = fake_vault.requests('login')
+    processes = [multiprocessing.get_context('fork').Process(target=_start_with_token_cache, args=(fake_vault.url, file)) for _ in range(8)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+    # the processes started at the same time wait for one login
+    assert fake_vault.requests('login') - logins == 1
+    assert os.stat(file).st_mode & 0o777 == 0o600
+
+    client = VaultClient(
+        url=fake_vault.url,
+        namespace='fake',
+        auth={'type': 'approle', 'approle': {'id': 'fake', 'secret-id': 'fake'}},
+        token_cache={'file': file, 'encrypt': False, 'min_ttl': 60},
+        metrics=True
+    )
+    assert fake_vault.requests('login') - logins == 1
+    assert 'vault_token_cache_total{result="hit"} 1' in client.metrics.export_prometheus()
+
+    fake_vault.expire_tokens()
+    client.kv2engine.write_secret(path='token-cache/secret', key='key', value='value')
+    assert fake_vault.requests('login') - logins == 2
+    _start_with_token_cache(fake_vault.url, file)
+    assert fake_vault.requests('login') - logins == 2
+
+    # the cache file readable by other users is rejected and the client logs in instead
+    os.chmod(file, 0o644)
+    _start_with_token_cache(fake_vault.url, file)
+    assert fake_vault.requests('login') - logins == 3
+    assert os.stat(file).st_mode & 0o777 == 0o600
@@ -1,8 +1,16 @@
 """
 This test is necessary to check how the module works with the secrets of the vault instance.
 """
+import contextlib
+import io
+import multiprocessing
+import os
 import time
+from concurrent.futures import ThreadPoolExecutor
+import hvac
 import pytest
+from vault import FlushError, MetricsRegistry, Transport, VaultClient
+from vault.shared_cache import SharedSecretCache
 
 
 @pytest.mark.order(0)
@@ -107,3 +115,459 @@ def test_delete_secret(approle_client, test_data, secret_path):
         response = approle_client.kv2engine.delete_secret(path=secret_path)
         assert response is True
         assert isinstance(response, bool)
+
+
+@pytest.mark.order(9)
+def test_read_secret_cached(cached_client, test_data):
+    """
+    Testing reading a secret through the cache
+    """
+    path = 'configuration/cached'
+    for key, value in test_data.items():
+        _ = cached_client.kv2engine.write_secret(path=path, key=key, value=value)
+    first = cached_client.kv2engine.read_secret(path=path)
+    second = cached_client.kv2engine.read_secret(path=path)
+    stats = cached_client.kv2engine.cache.stats()
+    assert first == second == test_data
+    assert stats['hits'] >= 1
+
+
+@pytest.mark.order(10)
+def test_read_secret_cached_invalidation(cached_client):
+    """
+    Testing that writing and deleting a secret invalidates the cache
+    """
+    path = 'configuration/cached'
+    _ = cached_client.kv2engine.write_secret(path=path, key='username', value='user2')
+    assert cached_client.kv2engine.read_secret(path=path, key='username') == 'user2'
+    assert cached_client.kv2engine.delete_secret(path=path) is True
+    assert cached_client.kv2engine.read_secret(path=path) is None
+    assert cached_client.kv2engine.read_secret(path=path) is None
+    assert cached_client.kv2engine.cache.stats()['negative_hits'] >= 1
+
+
+@pytest.mark.order(10)
+def test_read_secret_cached_overlapping_write(cached_client, monkeypatch):
+    """
+    Testing that the refresh that has read the secret before an overlapping write does not store the old data in the cache
+    """
+    path = 'configuration/cached-overlap'
+    engine = cached_client.kv2engine
+    engine.write_secret(path=path, key='username', value='user1')
+    read = engine._read_secret_version  # pylint: disable=protected-access
+
+    def overlapping_read(path):
+        response = read(path=path)
+        engine.write_secret(path=path, key='username', value='user2')
+        return response
+
+    with monkeypatch.context() as patch:
+        patch.setattr(engine, '_read_secret_version', overlapping_read)
+        assert engine.read_secret(path=path, key='username') == 'user1'
+    assert engine.read_secret(path=path, key='username') == 'user2'
+    assert engine.delete_secret(path=path) is True
+
+
+@pytest.mark.order(11)
+def test_write_secrets(approle_client, test_data):
+    """
+    Testing writing several keys of a secret with a single request
+    """
+    path = 'configuration/multikey'
+    response = approle_client.kv2engine.write_secrets(path=path, secrets=test_data)
+    assert response['request_id']
+    response = approle_client.kv2engine.write_secrets(path=path, secrets={'password': 'new-password', 'url': None})
+    assert response['request_id']
+    secret = approle_client.kv2engine.read_secret(path=path)
+    assert secret == {'username': test_data['username'], 'password': 'new-password'}
+    assert approle_client.kv2engine.delete_secret(path=path) is True
+    # the value None removes the key both from the created secret (first write) and from the existing one
+    path = 'configuration/multikey-new'
+    for _ in range(2):
+        approle_client.kv2engine.write_secrets(path=path, secrets={'username': test_data['username'], 'url': None})
+        approle_client.kv2engine.write_secret(path=path, key='password', value=None)
+        assert approle_client.kv2engine.read_secret(path=path) == {'username': test_data['username']}
+    assert approle_client.kv2engine.delete_secret(path=path) is True
+
+
+@pytest.mark.order(12)
+def test_read_secrets(approle_client, test_data):
+    """
+    Testing reading several secrets concurrently
+    """
+    paths = [f"configuration/batch{index}" for index in range(5)]
+    for path in paths:
+        _ = approle_client.kv2engine.write_secrets(path=path, secrets=test_data)
+    response = approle_client.kv2engine.read_secrets(paths=paths + ['configuration/batch-invalid'], max_workers=4)
+    assert isinstance(response, dict)
+    assert all(response[path] == test_data for path in paths)
+    assert response['configuration/batch-invalid'] is None
+    response = approle_client.kv2engine.read_secrets(paths=paths, key='username')
+    assert all(response[path] == test_data['username'] for path in paths)
+    for path in paths:
+        assert approle_client.kv2engine.delete_secret(path=path) is True
+
+
+@pytest.mark.order(15)
+def test_walk(approle_client, test_data):
+    """
+    Testing the recursive walk through the tree of secrets
+    """
+    paths = ['configuration/tree/a', 'configuration/tree/b/c', 'configuration/tree/b/d/e']
+    for path in paths:
+        _ = approle_client.kv2engine.write_secrets(path=path, secrets=test_data)
+    assert sorted(approle_client.kv2engine.walk(path='configuration/tree/')) == paths
+    assert list(approle_client.kv2engine.walk(path='configuration/tree', depth=0)) == ['configuration/tree/a']
+    assert list(approle_client.kv2engine.walk(path='configuration/tree', prefix='configuration/tree/b/d')) == ['configuration/tree/b/d/e']
+    secrets = dict(approle_client.kv2engine.walk(path='configuration/tree', include_data=True, max_workers=2))
+    assert secrets == {path: test_data for path in paths}
+    for path in paths:
+        assert approle_client.kv2engine.delete_secret(path=path) is True
+
+
+@pytest.mark.order(17)
+def test_token_renewal(vault_url, namespace, prepare_vault, secret_path):
+    """
+    Testing the proactive renewal of the token before it expires
+    """
+    client = VaultClient(
+        url=vault_url,
+        namespace=namespace,
+        auth={'type': 'approle', 'approle': {'id': prepare_vault['id'], 'secret-id': prepare_vault['secret-id']}},
+        renewal={'enabled': True, 'threshold': 0.5}
+    )
+    token = client.client.token
+    expires_at = client.token_expires_at
+    assert client.token_ttl > 0
+    time.sleep(20)
+    assert client.client.token == token
+    assert client.token_expires_at > expires_at
+    assert isinstance(client.kv2engine.list_secrets(path=f"{secret_path.split('/')[0]}/"), list)
+    client.close()
+
+
+@pytest.mark.order(18)
+def test_shared_transport(vault_url, namespace, prepare_vault, secret_path):
+    """
+    Testing the connection pool shared by several clients and preserved across re-authentication
+    """
+    transport = Transport(pool_maxsize=4, timeout=10)
+    auth = {'type': 'approle', 'approle': {'id': prepare_vault['id'], 'secret-id': prepare_vault['secret-id']}}
+    client1 = VaultClient(url=vault_url, namespace=namespace, auth=auth, transport=transport)
+    client2 = VaultClient(url=vault_url, namespace=namespace, auth=auth, transport=transport)
+    assert client1.client.adapter.session is client2.client.adapter.session
+    _ = client1.reauthenticate(stale_client=client1.client)
+    assert client1.client.adapter.session is transport.session
+    _ = client2.kv2engine.list_secrets(path=f"{secret_path.split('/')[0]}/")
+    stats = transport.stats()
+    assert sum(pool['requests'] for pool in stats.values()) > 0
+    assert all(pool['maxsize'] == 4 for pool in stats.values())
+    client1.close()
+    client2.close()
+
+
+@pytest.mark.order(19)
+def test_lazy_client(vault_url, namespace, prepare_vault, secret_path):
+    """
+    Testing the lazy client that authenticates and creates the engines on the first use
+    """
+    client = VaultClient(
+        url=vault_url,
+        namespace=namespace,
+        auth={'type': 'approle', 'approle': {'id': prepare_vault['id'], 'secret-id': prepare_vault['secret-id']}},
+        kv2engine={'configure': False},
+        lazy=True
+    )
+    assert client._client is None  # pylint: disable=protected-access
+    response = client.kv2engine.list_secrets(path=f"{secret_path.split('/')[0]}/")
+    assert isinstance(response, list)
+    assert client.client.is_authenticated()
+    engine = client.kv2engine
+    assert client.kv2engine is engine
+    assert client.kv2engine.configure() is False
+    client.close()
+
+
+@pytest.mark.order(22)
+def test_metrics(vault_url, namespace, prepare_vault, secret_path):
+    """
+    Testing the metrics and the span hooks of the engine calls
+    """
+    spans = []
+    metrics = MetricsRegistry()
+    metrics.add_span_hook(lambda name, attributes: spans.append(name) or contextlib.nullcontext())
+    client = VaultClient(
+        url=vault_url,
+        namespace=namespace,
+        auth={'type': 'approle', 'approle': {'id': prepare_vault['id'], 'secret-id': prepare_vault['secret-id']}},
+        kv2engine={'configure': False, 'cache': {'ttl': 5}},
+        metrics=metrics
+    )
+    for _ in range(3):
+        _ = client.kv2engine.read_secret(path=secret_path)
+    counters = metrics.snapshot()['counters']
+    assert counters[('requests_total', (('method', 'KV2Engine.read_secret'),))] == 3
+    assert counters[('bytes_received_total', ())] > 0
+    assert spans.count('KV2Engine.read_secret') == 3
+    exported = metrics.export_prometheus()
+    assert 'vault_request_duration_seconds_count{method="KV2Engine.read_secret"} 3' in exported
+    assert f'vault_cache_hits{{mount_point="{namespace}"}} 2' in exported
+    client.close()
+
+
+@pytest.mark.order(23)
+def test_watch(approle_client, secret_path):
+    """
+    Testing the watcher that reads the secret only when its version has changed
+    """
+    changes = []
+    path = f"{secret_path}-watched"
+    approle_client.kv2engine.write_secret(path=path, key='watched', value='0')
+    watcher = approle_client.kv2engine.watch(
+        paths=[path],
+        callback=lambda path, old, new: changes.append((path, old, new)),
+        interval=0.5,
+        max_interval=1
+    )
+    time.sleep(1)
+    assert not changes
+    approle_client.kv2engine.write_secret(path=path, key='watched', value='1')
+    for _ in range(20):
+        if changes:
+            break
+        time.sleep(0.5)
+    assert changes[0] == (path, {'watched': '0'}, {'watched': '1'})
+    watcher.unwatch(paths=[path])
+    assert path not in watcher.watched()
+    approle_client.kv2engine.close()
+    approle_client.kv2engine.delete_secret(path=path)
+
+
+@pytest.mark.order(24)
+def test_export_import(approle_client, secret_path, tmp_path):
+    """
+    Testing the export of the secrets to JSON lines and the resumable import
+    """
+    paths = [f"{secret_path}-export/{index}" for index in range(5)]
+    for index, path in enumerate(paths):
+        approle_client.kv2engine.write_secret(path=path, key='index', value=str(index))
+    backup = io.StringIO()
+    results = approle_client.kv2engine.export(prefix=f"{secret_path}-export/", stream=backup)
+    assert results['exported'] == 5
+    assert not results['failed']
+    for path in paths:
+        approle_client.kv2engine.delete_secret(path=path)
+
+    checkpoint = str(tmp_path / 'import.checkpoint')
+    results = approle_client.kv2engine.import_(stream=io.StringIO(backup.getvalue()), dry_run=True)
+    assert results['imported'] == 5
+    assert approle_client.kv2engine.read_secret(path=paths[0]) is None
+    results = approle_client.kv2engine.import_(stream=io.StringIO(backup.getvalue()), checkpoint=checkpoint)
+    assert results['imported'] == 5
+    assert approle_client.kv2engine.read_secret(path=paths[3], key='index') == '3'
+    results = approle_client.kv2engine.import_(stream=io.StringIO(backup.getvalue()), checkpoint=checkpoint)
+    assert results == {'imported': 0, 'skipped': 5, 'failed': {}}
+    for path in paths:
+        approle_client.kv2engine.delete_secret(path=path)
+
+    # the import interrupted after the first version of the history has been written continues with the second one
+    path = paths[0]
+    approle_client.kv2engine.write_secret(path=path, key='index', value='1')
+    approle_client.kv2engine.write_secret(path=path, key='index', value='2')
+    backup = io.StringIO()
+    approle_client.kv2engine.export(prefix=path, stream=backup, versions=True)
+    approle_client.kv2engine.delete_secret(path=path)
+    approle_client.kv2engine.write_secrets(path=path, secrets={'index': '1'})
+    checkpoint = str(tmp_path / 'versions.checkpoint')
+    with open(checkpoint, 'w', encoding='UTF-8') as checkpoint_file:
+        checkpoint_file.write(f"{path}\t0\t0\n")
+    results = approle_client.kv2engine.import_(stream=io.StringIO(backup.getvalue()), checkpoint=checkpoint)
+    assert results['imported'] == 1
+    assert approle_client.kv2engine.read_metadata(paths=[path])[path]['current_version'] == 2
+    assert approle_client.kv2engine.read_secret(path=path, key='index') == '2'
+    approle_client.kv2engine.delete_secret(path=path)
+
+
+@pytest.mark.order(28)
+def test_delete_tree(approle_client, secret_path):
+    """
+    Testing the concurrent rate-limited deletion of the tree of secrets
+    """
+    paths = [f"{secret_path}-tree/{index % 2}/{index}" for index in range(6)]
+    for path in paths:
+        approle_client.kv2engine.write_secret(path=path, key='key', value='value')
+    results = approle_client.kv2engine.delete_tree(prefix=f"{secret_path}-tree/", dry_run=True)
+    assert sorted(results['deleted']) == sorted(paths)
+    assert approle_client.kv2engine.read_secret(path=paths[0], key='key') == 'value'
+    results = approle_client.kv2engine.delete_tree(prefix=f"{secret_path}-tree/", max_workers=4, rate=20)
+    assert sorted(results['deleted']) == sorted(paths)
+    assert not results['failed']
+    assert approle_client.kv2engine.read_secret(path=paths[0]) is None
+    with pytest.raises(ValueError):
+        approle_client.kv2engine.delete_tree(prefix='')
+
+
+@pytest.mark.order(29)
+def test_versions_history_diff(approle_client, secret_path):
+    """
+    Testing the versioned reads, the batched metadata, the history and the diffs of the secret
+    """
+    path = f"{secret_path}-versions"
+    approle_client.kv2engine.write_secrets(path=path, secrets={'username': 'user1', 'password': 'qwerty1'})
+    approle_client.kv2engine.write_secrets(path=path, secrets={'password': 'qwerty2'})
+    approle_client.kv2engine.write_secrets(path=path, secrets={'username': None, 'host': 'localhost'})
+    assert approle_client.kv2engine.read_secret(path=path, version=1) == {'username': 'user1', 'password': 'qwerty1'}
+    assert approle_client.kv2engine.read_secret(path=path, key='password', version=2) == 'qwerty2'
+    assert approle_client.kv2engine.version_cache.stats()['size'] == 2
+
+    metadata = approle_client.kv2engine.read_metadata(paths=[path, f"{path}-missing"])
+    assert metadata[path]['current_version'] == 3
+    assert metadata[f"{path}-missing"] is None
+
+    history = list(approle_client.kv2engine.history(path=path, reverse=True))
+    assert [version['version'] for version in history] == [3, 2, 1]
+    assert history[0]['data'] == {'password': 'qwerty2', 'host': 'localhost'}
+    assert approle_client.kv2engine.diff(path=path, version1=1) == {'added': ['host'], 'removed': ['username'], 'changed': ['password']}
+    assert approle_client.kv2engine.diff(path=path, version1=2, version2=2) == {'added': [], 'removed': [], 'changed': []}
+
+    # another client deletes and creates the secret again, the versions of the old secret are not returned from the cache
+    mount_point = approle_client.kv2engine.mount_point
+    approle_client.client.secrets.kv.v2.delete_metadata_and_all_versions(path=path, mount_point=mount_point)
+    approle_client.client.secrets.kv.v2.create_or_update_secret(path=path, secret={'username': 'user2'}, mount_point=mount_point)
+    approle_client.client.secrets.kv.v2.create_or_update_secret(path=path, secret={'username': 'user3'}, mount_point=mount_point)
+    assert [version['data'] for version in approle_client.kv2engine.history(path=path)] == [{'username': 'user2'}, {'username': 'user3'}]
+    assert approle_client.kv2engine.diff(path=path, version1=1) == {'added': [], 'removed': [], 'changed': ['username']}
+    hits = approle_client.kv2engine.version_cache.stats()['hits']
+    assert approle_client.kv2engine.diff(path=path, version1=1, version2=2) == {'added': [], 'removed': [], 'changed': ['username']}
+    assert approle_client.kv2engine.version_cache.stats()['hits'] - hits == 2
+    approle_client.kv2engine.delete_secret(path=path)
+    assert approle_client.kv2engine.version_cache.stats()['size'] == 0
+
+
+@pytest.mark.order(34)
+def test_write_buffer(approle_client, secret_path, monkeypatch):
+    """
+    Testing the write-behind buffer: merged writes of the same path, size threshold, flush errors and context manager exit
+    """
+    path = f"{secret_path}-buffered"
+    with approle_client.kv2engine.write_buffer(max_keys=10, interval=None) as buffer:
+        for step in range(50):
+            buffer.write_secret(path=path, key='progress', value=str(step))
+        buffer.write_secrets(path=path, secrets={'state': 'running'})
+        assert approle_client.kv2engine.read_secret(path=path) is None
+        buffer.flush()
+        assert approle_client.kv2engine.read_secret(path=path) == {'progress': '49', 'state': 'running'}
+
+        # the pending keys are written by the writing thread when the threshold is reached
+        for step in range(10):
+            buffer.write_secret(path=path, key=f"step-{step}", value='done')
+        assert buffer.stats()['pending_keys'] == 0
+
+        # the failed updates are kept and written by the next flush
+        def unavailable(**_):
+            raise hvac.exceptions.InternalServerError()
+
+        with monkeypatch.context() as patch:
+            patch.setattr(approle_client.kv2engine, 'write_secrets', unavailable)
+            buffer.write_secret(path=path, key='state', value='failed')
+            with pytest.raises(FlushError):
+                buffer.flush()
+        assert buffer.stats()['pending_keys'] == 1
+        buffer.write_secret(path=path, key='state', value='done')
+    assert approle_client.kv2engine.read_secret(path=path, key='state') == 'done'
+    assert approle_client.kv2engine.read_metadata(paths=[path])[path]['current_version'] == 3
+    assert buffer.stats()['writes'] == 63
+
+    # the write that reports the failed background flush is buffered too
+    with monkeypatch.context() as patch:
+        patch.setattr(approle_client.kv2engine, 'write_secrets', unavailable)
+        with approle_client.kv2engine.write_buffer(interval=0.05) as buffer:
+            buffer.write_secret(path=path, key='state', value='failed')
+            deadline = time.monotonic() + 5
+            while buffer.stats()['failures'] == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            with pytest.raises(FlushError):
+                buffer.write_secret(path=path, key='attempt', value='2')
+            patch.undo()
+    assert approle_client.kv2engine.read_secret(path=path) == {'progress': '49', 'state': 'failed', 'attempt': '2', **{f"step-{step}": 'done' for step in range(10)}}
+    approle_client.kv2engine.delete_secret(path=path)
+
+
+@pytest.mark.order(30)
+def test_shared_cache(fake_vault, tmp_path):
+    """
+    Testing the cache shared by the processes through the memory-mapped file and the single refresh of the expired secret
+    """
+    configuration = {
+        'url': fake_vault.url,
+        'namespace': 'fake',
+        'auth': {'type': 'approle', 'approle': {'id': 'fake', 'secret-id': 'fake'}},
+        'kv2engine': {'cache': {'ttl': 1, 'shared': {'file': str(tmp_path / 'vault.cache'), 'encrypt': False}}}
+    }
+    client = VaultClient(**configuration)
+    client.kv2engine.write_secret(path='fake/shared', key='key', value='value')
+    reads = fake_vault.requests(r'^GET /v1/fake/data/fake/shared$')
+    assert client.kv2engine.read_secret(path='fake/shared', key='key') == 'value'
+    other = VaultClient(**configuration)
+    assert other.kv2engine.read_secret(path='fake/shared', key='key') == 'value'
+    assert fake_vault.requests(r'^GET /v1/fake/data/fake/shared$') - reads == 1
+    assert other.kv2engine.cache.stats()['hits'] == 1
+
+    def worker():
+        worker_client = VaultClient(**configuration)
+        os._exit(0 if worker_client.kv2engine.read_secret(path='fake/shared', key='key') == 'value' else 1)  # pylint: disable=protected-access
+
+    # the expired secret is revalidated by one process, the others wait for it
+    time.sleep(1.1)
+    revalidations = fake_vault.requests(r'^GET /v1/fake/metadata/fake/shared$')
+    fake_vault.set_latency(0.2)
+    try:
+        workers = [multiprocessing.get_context('fork').Process(target=worker) for _ in range(4)]
+        for process in workers:
+            process.start()
+        for process in workers:
+            process.join(timeout=30)
+    finally:
+        fake_vault.set_latency(0.0)
+    assert [process.exitcode for process in workers] == [0] * 4
+    assert fake_vault.requests(r'^GET /v1/fake/metadata/fake/shared$') - revalidations == 1
+    assert fake_vault.requests(r'^GET /v1/fake/data/fake/shared$') - reads == 1
+
+    # the threads of one process that do not coalesce the reads wait for each other on the refresh lock
+    threaded = VaultClient(**{**configuration, 'kv2engine': {**configuration['kv2engine'], 'coalesce': False}})
+    time.sleep(1.1)
+    revalidations = fake_vault.requests(r'^GET /v1/fake/metadata/fake/shared$')
+    fake_vault.set_latency(0.2)
+    try:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            values = list(executor.map(lambda _: threaded.kv2engine.read_secret(path='fake/shared', key='key'), range(4)))
+    finally:
+        fake_vault.set_latency(0.0)
+    assert values == ['value'] * 4
+    assert fake_vault.requests(r'^GET /v1/fake/metadata/fake/shared$') - revalidations == 1
+    assert threaded.kv2engine.cache.stats()['refresh_waits'] == 3
+    threaded.close()
+
+    # the write invalidates the entry in the shared file for the other clients
+    client.kv2engine.write_secret(path='fake/shared', key='key', value='updated')
+    assert other.kv2engine.read_secret(path='fake/shared', key='key') == 'updated'
+    other.close()
+    client.close()
+
+
+@pytest.mark.order(31)
+def test_shared_cache_encryption(tmp_path):
+    """
+    Testing the encryption of the entries of the shared cache
+    """
+    pytest.importorskip('cryptography')
+    key = SharedSecretCache.generate_key()
+    cache = SharedSecretCache(file=str(tmp_path / 'vault.cache'), key=key, max_size=16)
+    cache.set(path='configuration/db', data={'password': 'plaintext-password'}, version=1)
+    assert cache.get('configuration/db').data == {'password': 'plaintext-password'}
+    with open(tmp_path / 'vault.cache', 'rb') as file:
+        assert b'plaintext-password' not in file.read()
+    other = SharedSecretCache(file=str(tmp_path / 'vault.cache'), key=SharedSecretCache.generate_key(), max_size=16)
+    assert other.get('configuration/db') is None
+    other.close()
+    cache.close()
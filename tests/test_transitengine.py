@@ -0,0 +1,42 @@
+"""
+This test is necessary to check how the module works with the transit engine of the vault instance.
+"""
+import pytest
+from vault import TransitError, VaultClient
+
+
+@pytest.mark.order(36)
+def test_transit_engine(fake_vault):
+    """
+    Testing the batched transit operations: the order of the results, the errors of the items and the re-authentication
+    """
+    client = VaultClient(
+        url=fake_vault.url,
+        namespace='fake',
+        auth={'type': 'approle', 'approle': {'id': 'fake', 'secret-id': 'fake'}},
+        transitengine={'mount_point': 'transit', 'batch_size': 100, 'max_workers': 4}
+    )
+    records = [f"record-{index}".encode() for index in range(1000)]
+    requests = fake_vault.requests('POST /v1/transit/encrypt/records')
+    ciphertexts = list(client.transitengine.encrypt(name='records', plaintexts=iter(records)))
+    assert fake_vault.requests('POST /v1/transit/encrypt/records') - requests == 10
+    assert all(ciphertext.startswith('vault:v1:') for ciphertext in ciphertexts)
+
+    # the invalid item does not affect the other items of its batch
+    ciphertexts[150] = 'invalid'
+    plaintexts = list(client.transitengine.decrypt(name='records', ciphertexts=ciphertexts))
+    assert isinstance(plaintexts[150], TransitError) and plaintexts[150].index == 150
+    assert plaintexts[:150] + plaintexts[151:] == records[:150] + records[151:]
+
+    signatures = list(client.transitengine.sign(name='records', inputs=records[:10], hash_algorithm='sha2-256'))
+    signatures[3] = signatures[4]
+    assert list(client.transitengine.verify(name='records', inputs=records[:10], signatures=signatures)) == [True] * 3 + [False] + [True] * 6
+    # the items without a pair are reported instead of being dropped
+    results = list(client.transitengine.verify(name='records', inputs=records[:12], signatures=signatures, batch_size=5))
+    assert results[:10] == [True] * 3 + [False] + [True] * 6
+    assert [result.index for result in results[10:]] == [10, 11] and all(isinstance(result, TransitError) for result in results[10:])
+    assert isinstance(next(client.transitengine.verify(name='records', inputs=[], signatures=signatures[:1])), TransitError)
+
+    fake_vault.expire_tokens()
+    assert len(list(client.transitengine.rewrap(name='records', ciphertexts=ciphertexts[:10]))) == 10
+    client.close()
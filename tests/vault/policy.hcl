@@ -13,6 +13,11 @@ path "auth/token/lookup-self" {
   capabilities = ["read"]
 }
 
+# To renew the token before it expires
+path "auth/token/renew-self" {
+  capabilities = ["update"]
+}
+
 # To read and update the namespace configuration
 path "testapp-1/config" {
   capabilities = ["read", "list", "update"]
@@ -23,17 +28,26 @@ path "database/config/postgresql"{
   capabilities = ["create", "read", "update", "list", "delete"]
 }
 
-# To get a list of secrets
+# To get a list of secrets and import their custom metadata
 path "testapp-1/metadata/configuration/*" {
-  capabilities = ["read", "list", "delete"]
+  capabilities = ["create", "read", "update", "list", "delete"]
 }
 
 # To work with secret apllication data
 path "testapp-1/data/configuration/*" {
-  capabilities = ["create", "read", "update", "list", "delete"]
+  capabilities = ["create", "read", "update", "patch", "list", "delete"]
 }
 
 # To work with database engine
 path "database/creds/*" {
   capabilities = ["create", "read", "update", "list", "delete"]
 }
+
+# To renew and revoke the leases of database credentials
+path "sys/leases/renew" {
+  capabilities = ["update"]
+}
+
+path "sys/leases/revoke" {
+  capabilities = ["update"]
+}
@@ -4,15 +4,31 @@ No need to add anything here. Feel free to delete this line when you make your o
 Leave it empty
 """
 from .client import VaultClient
+from .async_client import AsyncVaultClient
 from .kv2_engine import KV2Engine
 from .db_engine import DBEngine
-from .exceptions import WrongKV2Configuration
+from .transit_engine import TransitEngine
+from .transport import Transport
+from .metrics import MetricsRegistry
+from .retry import CircuitBreaker, RetryPolicy
+from .singleflight import SingleFlight
+from .exceptions import CircuitOpenError, FlushError, TransitError, WrongKV2Configuration
 from .decorators import reauthenticate_on_forbidden
 
 __all__ = [
     'VaultClient',
+    'AsyncVaultClient',
     'KV2Engine',
     'DBEngine',
+    'TransitEngine',
+    'Transport',
+    'MetricsRegistry',
+    'RetryPolicy',
+    'CircuitBreaker',
+    'SingleFlight',
+    'CircuitOpenError',
+    'FlushError',
+    'TransitError',
     'WrongKV2Configuration',
     'reauthenticate_on_forbidden'
 ]
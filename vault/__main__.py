@@ -0,0 +1,6 @@
+"""Entrypoint for running the command line interface with python -m vault"""
+import sys
+
+from .cli import main
+
+sys.exit(main())
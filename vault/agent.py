@@ -0,0 +1,323 @@
+"""This module contains the agent that renders the secrets to files and keeps them up to date"""
+import json
+import os
+import re
+import signal
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from logger import log
+
+# {{ kv configuration/db password }} or {{ db readonly username }}, the whole secret is rendered as JSON without the key
+PLACEHOLDER = re.compile(r'\{\{\s*(kv|db)\s+([^\s}]+)(?:\s+([^\s}]+))?\s*\}\}')
+
+
+# pylint: disable=too-few-public-methods
+class Template:
+    """
+    A file rendered by the agent.
+
+    Attributes:
+        destination (str): the path of the rendered file.
+        contents (str): the template with the placeholders.
+        mode (int): the permissions of the rendered file.
+        secrets (set): the paths of the secrets of the KV2 Engine referenced by the template.
+        roles (set): the database roles referenced by the template.
+    """
+    __slots__ = ('destination', 'contents', 'mode', 'secrets', 'roles')
+
+    def __init__(self, destination: str, contents: str = None, source: str = None, mode: str | int = 0o600) -> None:
+        if contents is None:
+            with open(source, 'r', encoding='UTF-8') as template:
+                contents = template.read()
+        self.destination = destination
+        self.contents = contents
+        self.mode = int(mode, 8) if isinstance(mode, str) else mode
+        self.secrets = {name for kind, name, _ in PLACEHOLDER.findall(contents) if kind == 'kv'}
+        self.roles = {name for kind, name, _ in PLACEHOLDER.findall(contents) if kind == 'db'}
+
+
+def load_config(path: str) -> dict:
+    """
+    A function for reading the configuration of the agent from the JSON file.
+    The relative paths of the template sources are resolved against the directory of the configuration file.
+
+    Args:
+        :param path (str): the path to the configuration file.
+
+    Returns:
+        (dict) the configuration with the keyword arguments of the Agent and the optional 'dbengine' configuration of the client
+
+    Examples:
+        >>> config = load_config('agent.json')
+        {'templates': [{'source': '/etc/agent/app.conf.tpl', 'destination': '/etc/app/app.conf', 'mode': '0640'}], 'interval': 30}
+    """
+    with open(path, 'r', encoding='UTF-8') as source:
+        config = json.load(source)
+    directory = os.path.dirname(os.path.abspath(path))
+    for template in config.get('templates', []):
+        if 'source' in template:
+            template['source'] = os.path.join(directory, template['source'])
+    return config
+
+
+# pylint: disable=too-many-instance-attributes
+class Agent:
+    """
+    This class is responsible for rendering the secrets to files for the applications that read them locally.
+    Features:
+        - only the secrets and the database roles referenced by the templates are read, concurrently
+        - the files are replaced atomically and are not rewritten when the rendered contents are the same
+        - only the templates whose secrets have a new version or whose database lease has been rotated are rendered again
+        - the application process is signalled once per refresh that has changed some files
+    """
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(
+        self,
+        vault_client: object = None,
+        templates: list = None,
+        interval: float = 30,
+        max_interval: float = 300,
+        notify: dict = None,
+        max_workers: int = 8
+    ) -> None:
+        """
+        A method for creating an instance of the agent.
+
+        Args:
+            :param vault_client (VaultClient): the client used to read the secrets and to generate the database credentials.
+            :param templates (list): the templates [{'destination': '...', 'source': '...' or 'contents': '...', 'mode': '0600'}].
+            :param interval (float): polling interval of the versions of the secrets in seconds.
+            :param max_interval (float): maximum polling interval in seconds when the secrets do not change.
+            :param notify (dict): the process signalled after the files have changed {'pid_file': '...' or 'pid': 1, 'signal': 'SIGHUP'}.
+            :param max_workers (int): maximum number of concurrent requests of the initial render.
+
+        Returns:
+            None
+
+        Examples:
+            >>> agent = Agent(
+            ...     vault_client=client,
+            ...     templates=[{'destination': '/etc/app/db.env', 'contents': 'PASSWORD={{ kv configuration/db password }}\\n'}],
+            ...     notify={'pid_file': '/run/app.pid', 'signal': 'SIGHUP'}
+            ... )
+            >>> agent.run()
+        """
+        self.vault_client = vault_client
+        self.templates = [Template(**template) for template in templates or []]
+        self.interval = interval
+        self.max_interval = max_interval
+        self.notify = notify
+        self.max_workers = max_workers
+        self._secrets = {}
+        self._versions = {}
+        self._credentials = {}
+        self._dirty = set()
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._counters = {'renders': 0, 'writes': 0, 'signals': 0, 'failures': 0}
+
+    @property
+    def paths(self) -> set:
+        """The paths of the secrets referenced by the templates"""
+        return set().union(*(template.secrets for template in self.templates))
+
+    @property
+    def roles(self) -> set:
+        """The database roles referenced by the templates"""
+        return set().union(*(template.roles for template in self.templates))
+
+    def render(self) -> dict:
+        """
+        A method for reading all referenced secrets and credentials and rendering all templates.
+
+        Returns:
+            (dict) {'written': ['/etc/app/db.env'], 'unchanged': 1, 'failed': {'/etc/app/app.conf': KeyError(...)}}
+        """
+        paths, roles = sorted(self.paths), sorted(self.roles)
+        with ThreadPoolExecutor(max_workers=len(roles) + 1) as executor:
+            secrets = executor.submit(self._read_secrets, paths=paths)
+            credentials = {role: executor.submit(self.vault_client.dbengine.get_credentials, role=role, on_rotate=self._rotated) for role in roles}
+        # an error of a secret or a role fails only the templates that reference it
+        credentials = {role: future.exception() or future.result() for role, future in credentials.items()}
+        with self._condition:
+            self._secrets.update(secrets.result())
+            self._credentials.update(credentials)
+            self._dirty.clear()
+        return self._render(self.templates)
+
+    def run(self, once: bool = False) -> dict:
+        """
+        A method for rendering the templates and keeping them up to date until stop() is called.
+        The versions of the secrets are polled by the watcher of the KV2 Engine, the database leases are renewed
+        by the credential manager of the database engine and their rotation triggers the render of the dependent templates.
+
+        Args:
+            :param once (bool): render the templates once and return.
+
+        Returns:
+            (dict) the results of the initial render
+        """
+        results = self.render()
+        if results['written']:
+            self._signal()
+        if once or self._stopped.is_set():
+            return results
+        paths = sorted(self.paths)
+        watcher = None
+        if paths:
+            watcher = self.vault_client.kv2engine.watch(
+                paths=paths,
+                callback=self._changed,
+                interval=self.interval,
+                max_interval=self.max_interval,
+                versions=self._versions
+            )
+        log.info('[VaultClient] the agent is watching %s secrets and %s database roles of %s templates', len(paths), len(self.roles), len(self.templates))
+        try:
+            while True:
+                with self._condition:
+                    while not self._dirty and not self._stopped.is_set():
+                        self._condition.wait()
+                    if self._stopped.is_set():
+                        break
+                    dirty, self._dirty = self._dirty, set()
+                templates = [
+                    template for template in self.templates
+                    if any(('kv', path) in dirty for path in template.secrets) or any(('db', role) in dirty for role in template.roles)
+                ]
+                if self._render(templates)['written']:
+                    self._signal()
+        finally:
+            if watcher is not None:
+                watcher.unwatch(paths=paths)
+        return results
+
+    def stop(self) -> None:
+        """
+        A method for stopping run(), it is safe to call from a signal handler.
+
+        Returns:
+            None
+        """
+        self._stopped.set()
+        # the lock of the condition is reentrant, so the handler can notify while the interrupted thread holds it
+        with self._condition:
+            self._condition.notify_all()
+
+    def stats(self) -> dict:
+        """
+        A method for getting the counters of the agent.
+
+        Returns:
+            (dict) {'templates': 2, 'renders': 5, 'writes': 3, 'signals': 2, 'failures': 0}
+        """
+        with self._condition:
+            return {'templates': len(self.templates), **self._counters}
+
+    def _read_secrets(self, paths: list) -> dict:
+        """Reads the current versions of the secrets and then the data of these versions, the versions are the baseline of the watcher"""
+        if not paths:
+            return {}
+        kv2engine = self.vault_client.kv2engine
+        metadata = kv2engine.read_metadata(paths=paths, max_workers=self.max_workers)
+        self._versions = {path: meta['current_version'] if meta else None for path, meta in metadata.items() if not isinstance(meta, Exception)}
+
+        def read(path: str) -> dict | Exception | None:
+            if path not in self._versions:
+                return metadata[path]
+            if self._versions[path] is None:
+                return None
+            try:
+                return kv2engine.read_secret(path=path, version=self._versions[path])
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                return error
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return dict(zip(paths, executor.map(read, paths)))
+
+    def _changed(self, path: str, _old: dict | None, new: dict | None) -> None:
+        """The callback of the watcher, it is called with the data of the new version of the secret"""
+        with self._condition:
+            self._secrets[path] = new
+            self._dirty.add(('kv', path))
+            self._condition.notify_all()
+
+    def _rotated(self, role: str, _old: dict, new: dict) -> None:
+        """The callback of the credential manager, it is called when the lease of the role can no longer be renewed"""
+        with self._condition:
+            self._credentials[role] = new
+            self._dirty.add(('db', role))
+            self._condition.notify_all()
+
+    def _render(self, templates: list) -> dict:
+        results = {'written': [], 'unchanged': 0, 'failed': {}}
+        for template in templates:
+            try:
+                with self._condition:
+                    contents = PLACEHOLDER.sub(self._value, template.contents)
+                    self._counters['renders'] += 1
+                if self._write(template=template, contents=contents):
+                    results['written'].append(template.destination)
+                else:
+                    results['unchanged'] += 1
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                log.error('[VaultClient] failed to render the template %s: %s', template.destination, error)
+                results['failed'][template.destination] = error
+                with self._condition:
+                    self._counters['failures'] += 1
+        return results
+
+    def _value(self, match: re.Match) -> str:
+        kind, name, key = match.groups()
+        value = self._secrets.get(name) if kind == 'kv' else self._credentials.get(name)
+        if isinstance(value, Exception):
+            raise value
+        if value is None:
+            raise KeyError(f"the {'secret' if kind == 'kv' else 'database role'} {name} does not exist")
+        if key is None:
+            return json.dumps(value)
+        if key not in value:
+            raise KeyError(f"the key {key} does not exist in the {'secret' if kind == 'kv' else 'database role'} {name}")
+        return str(value[key])
+
+    def _write(self, template: Template, contents: str) -> bool:
+        """Replaces the file atomically if the rendered contents have changed, returns True if the file has been written"""
+        try:
+            with open(template.destination, 'r', encoding='UTF-8') as current:
+                if current.read() == contents:
+                    return False
+        except FileNotFoundError:
+            pass
+        directory, name = os.path.split(os.path.abspath(template.destination))
+        descriptor, temporary = tempfile.mkstemp(dir=directory, prefix=f".{name}.")
+        try:
+            with os.fdopen(descriptor, 'w', encoding='UTF-8') as output:
+                output.write(contents)
+                output.flush()
+                os.fchmod(output.fileno(), template.mode)
+                os.fsync(output.fileno())
+            os.replace(temporary, template.destination)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        log.info('[VaultClient] rendered the template %s', template.destination)
+        with self._condition:
+            self._counters['writes'] += 1
+        return True
+
+    def _signal(self) -> None:
+        if not self.notify:
+            return
+        try:
+            pid = self.notify.get('pid')
+            if pid is None:
+                with open(self.notify['pid_file'], 'r', encoding='UTF-8') as pid_file:
+                    pid = int(pid_file.read().strip())
+            os.kill(pid, getattr(signal, self.notify.get('signal', 'SIGHUP')))
+            log.info('[VaultClient] sent %s to the process %s', self.notify.get('signal', 'SIGHUP'), pid)
+            with self._condition:
+                self._counters['signals'] += 1
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            log.error('[VaultClient] failed to signal the application process: %s', error)
@@ -0,0 +1,480 @@
+"""This module contains an asyncio implementation of the Vault client and engines on top of the httpx module"""
+import asyncio
+import os
+
+import hvac
+import hvac.exceptions
+from hvac import utils
+
+from logger import log
+from .client import extract_configuration
+from .decorators import async_reauthenticate_on_forbidden
+from .exceptions import WrongKV2Configuration
+from .kv2_engine import create_request, deletion_result, patch_request, retry_cas_mismatch
+from .metrics import MetricsRegistry
+from .retry import resilience
+from .singleflight import SingleFlight
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+# pylint: disable=too-many-instance-attributes
+class AsyncVaultClient:
+    """
+    This class contains an asyncio client and engines for working with Vault Engines:
+    - KV2 Engine
+    - Database Engine
+    All coroutines share one pooled HTTP client with keep-alive connections.
+    """
+    def __init__(
+        self,
+        url: str = None,
+        namespace: str = None,
+        auth: dict = None,
+        **kwargs
+    ) -> None:
+        """
+        A method for create a new asyncio Vault Client instance.
+        The authentication is performed on the first request or when entering the async context manager.
+
+        Args:
+            :param url (str): base URL for the Vault instance.
+            :param namespace (str): the name of the namespace in the Vault instance.
+            :param auth (dict): dictionary with authentication data (the same as for VaultClient).
+
+        Keyword Args:
+            :param kv2engine (dict): dictionary with kv2 engine configuration.
+                :param cas_retries (int): number of write retries when the cas parameter does not match the current version
+                :param coalesce (bool): concurrent read_secret() calls of the same path share one request (default True)
+            :param dbengine (dict): dictionary with database engine configuration.
+                :param mount_point (str): the path where the database engine is mounted.
+                :param coalesce (bool): concurrent generate_credentials() calls of the same role share one request (default False)
+            :param transport (dict): dictionary with the HTTP connection pool configuration.
+                :param max_connections (int): maximum number of concurrent connections (default 100)
+                :param max_keepalive_connections (int): maximum number of idle keep-alive connections (default 20)
+                :param keepalive_expiry (float): time in seconds to keep an idle connection (default 30)
+                :param timeout (float): timeout of the requests in seconds (default 30)
+                :param verify (bool | str): TLS verification or path to the CA bundle (default True)
+            :param metrics (MetricsRegistry | bool): registry for the latency, request, error and traffic metrics,
+                True creates a registry for the client (disabled by default)
+            :param retry (RetryPolicy | dict): retries of the transient errors (429, 5xx, connection errors) of all engine methods.
+                :param max_attempts (int): maximum number of attempts including the first one (default 3)
+                :param backoff (float): delay before the first retry, doubled for every next retry (default 0.1)
+                :param max_backoff (float): maximum delay between the attempts (default 5)
+                :param jitter (bool): randomize the delays (default True)
+                :param retry_on (tuple): HTTP status codes to retry (default (429, 500, 502, 503))
+                :param deadline (float): maximum time in seconds for all attempts of the call (default None)
+            :param circuit_breaker (CircuitBreaker | dict): fail fast while an endpoint returns transient errors.
+                :param failure_threshold (int): number of consecutive transient errors that opens the circuit (default 5)
+                :param recovery_timeout (float): time in seconds after which a probe call is allowed (default 30)
+                :param half_open_calls (int): number of concurrent probe calls (default 1)
+
+        Returns:
+            None
+
+        Examples:
+            >>> from vault import AsyncVaultClient
+            >>> async with AsyncVaultClient(
+            ...     url='http://vault:8200',
+            ...     namespace='test',
+            ...     auth={'type': 'approle', 'approle': {'id': 'approle_id', 'secret-id': 'approle_secret_id'}}
+            ... ) as client:
+            ...     secret_data = await client.kv2engine.read_secret(path='path/to/secret')
+            ...     pg_credentials = await client.dbengine.generate_credentials(role='readonly')
+        """
+        if httpx is None:
+            raise ImportError("The httpx module is required for AsyncVaultClient, install the package with the 'async' extra")
+
+        self.url, self.namespace, self.auth = extract_configuration(url=url, namespace=namespace, auth=auth)
+        transport = kwargs.get('transport', {})
+        self.http = httpx.AsyncClient(
+            base_url=self.url,
+            timeout=transport.get('timeout', 30),
+            verify=transport.get('verify', True),
+            limits=httpx.Limits(
+                max_connections=transport.get('max_connections', 100),
+                max_keepalive_connections=transport.get('max_keepalive_connections', 20),
+                keepalive_expiry=transport.get('keepalive_expiry', 30)
+            )
+        )
+        self.token = None
+        self._auth_lock = asyncio.Lock()
+        metrics = kwargs.get('metrics')
+        self.metrics = MetricsRegistry() if metrics is True else metrics or None
+        self.retry, self.circuit_breaker = resilience(kwargs)
+        self.kv2engine = AsyncKV2Engine(vault_client=self, **kwargs.get('kv2engine', {}))
+        self.dbengine = AsyncDBEngine(vault_client=self, **kwargs.get('dbengine', {}))
+
+    async def __aenter__(self) -> 'AsyncVaultClient':
+        await self.reauthenticate(stale_token=None)
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """
+        A method for closing the connections of the HTTP client.
+
+        Returns:
+            None
+        """
+        await self.http.aclose()
+
+    async def authentication(self) -> str:
+        """
+        This method is used to authenticate in the Vault Server.
+        Supported authentication methods:
+            - Token
+            - AppRole
+            - Kubernetes
+
+        Returns:
+            (str) token
+        """
+        log.info('[VaultClient]: authenticating in the vault server using the %s...', self.auth['type'].upper())
+        try:
+            # Root token authentication
+            if self.auth['type'] == 'token':
+                token = self.auth['token']
+                await self.request(method='GET', url='/v1/auth/token/lookup-self', token=token)
+
+            # AppRole authentication
+            elif self.auth['type'] == 'approle':
+                response = await self.request(
+                    method='POST',
+                    url=utils.format_url('/v1/auth/{mount_point}/login', mount_point=self.namespace),
+                    json={'role_id': self.auth['approle']['id'], 'secret_id': self.auth['approle']['secret-id']},
+                    token=False
+                )
+                token = response['auth']['client_token']
+
+            # Kubernetes service account token authentication
+            elif self.auth['type'] == 'kubernetes':
+                if not os.path.exists(self.auth['kubernetes']):
+                    log.error('[VaultClient]: not found the kubernetes service account token: %s', self.auth['kubernetes'])
+                    raise FileNotFoundError
+                with open(self.auth['kubernetes'], 'r', encoding='UTF-8') as kubernetes_token:
+                    jwt = kubernetes_token.read()
+                response = await self.request(
+                    method='POST',
+                    url='/v1/auth/kubernetes/login',
+                    json={'role': self.namespace, 'jwt': jwt},
+                    token=False
+                )
+                token = response['auth']['client_token']
+
+            else:
+                raise hvac.exceptions.InvalidRequest(f"unsupported authentication type {self.auth['type']}")
+
+        except hvac.exceptions.Forbidden as forbidden:
+            log.error('[VaultClient]: failed to authenticate in the vault server: %s\nplease, check the authentication data', forbidden)
+            raise hvac.exceptions.Forbidden from forbidden
+
+        log.info('[VaultClient]: successfully authenticated in the vault server with the %s', self.auth['type'].upper())
+        if self.metrics is not None:
+            self.metrics.inc('authentications_total', auth=self.auth['type'])
+        return token
+
+    async def reauthenticate(self, stale_token: str = None) -> str:
+        """
+        A method for replacing the token that has been rejected by the vault server.
+        Concurrent coroutines wait for a single login instead of authenticating each on its own.
+
+        Args:
+            :param stale_token (str): the token that has been rejected.
+
+        Returns:
+            (str) the current token
+        """
+        async with self._auth_lock:
+            if self.token is None or self.token == stale_token:
+                self.token = await self.authentication()
+                if self.metrics is not None and stale_token is not None:
+                    self.metrics.inc('reauthentications_total')
+            return self.token
+
+    async def request(self, method: str, url: str, token: str | bool = None, **kwargs) -> dict | object:
+        """
+        A method for sending a request to the vault server.
+        The errors are raised as the same hvac exceptions that are raised by the synchronous client.
+
+        Args:
+            :param method (str): HTTP method.
+            :param url (str): path of the vault api endpoint.
+            :param token (str | bool): token to use instead of the client token, False to send the request without a token.
+
+        Keyword Args:
+            Additional arguments for httpx.AsyncClient.request()
+
+        Returns:
+            (dict) the JSON response
+                or
+            (object) https://www.python-httpx.org/api/#response for responses without a body
+        """
+        if token is None:
+            token = self.token or await self.reauthenticate(stale_token=None)
+        headers = kwargs.pop('headers', {})
+        headers['X-Vault-Request'] = 'true'
+        if token:
+            headers['X-Vault-Token'] = token
+        if self.namespace:
+            headers['X-Vault-Namespace'] = self.namespace
+
+        response = await self.http.request(method=method, url=url, headers=headers, **kwargs)
+        if self.metrics is not None:
+            self.metrics.record_bytes(sent=len(response.request.content), received=len(response.content))
+        body = None
+        if response.headers.get('Content-Type') == 'application/json':
+            try:
+                body = response.json()
+            except ValueError:
+                pass
+        if not response.is_success:
+            utils.raise_for_error(
+                method,
+                url,
+                response.status_code,
+                response.text if body is None else None,
+                errors=body.get('errors') if body else None,
+                text=response.text,
+                json=body
+            )
+        if response.status_code == 200 and body is not None:
+            return body
+        return response
+
+
+class AsyncKV2Engine:
+    """
+    This class is responsible for working with the kv v2 engine in the vault from asyncio code.
+    Supported methods for:
+        - read secret
+        - create or update secret
+        - create or update several keys of the secret
+        - list secrets
+        - delete secret
+    """
+    def __init__(self, vault_client: AsyncVaultClient = None, **kwargs) -> None:
+        """
+        A method for creating an instance of the asyncio kv v2 engine.
+        The mount configuration is not changed on creation, use configure() to apply it.
+
+        Args:
+            :param vault_client (AsyncVaultClient): asyncio vault client instance.
+
+        Keyword Args:
+            :param max_versions (int): maximum number of versions of the secret available for storage (default 10)
+            :param cas_required (bool): all keys will require the cas parameter to be set on all write requests (default False)
+            :param cas_retries (int): number of write retries when the cas parameter does not match the current version (default 3)
+            :param coalesce (bool): concurrent read_secret() calls of the same path share one request (default True)
+
+        Returns:
+            None
+        """
+        self.vault_client = vault_client
+        self.mount_point = vault_client.namespace
+        self.max_versions = kwargs.get('max_versions', 10)
+        self.cas_required = kwargs.get('cas_required', False)
+        self.cas_retries = kwargs.get('cas_retries', 3)
+        self.singleflight = SingleFlight(enabled=kwargs.get('coalesce', True))
+        if not self.mount_point:
+            raise WrongKV2Configuration("Mount point not specified, KV2 Engine configuration error. Please set the argument mount_point=<mount_point_name>.")
+
+    def _url(self, prefix: str, path: str) -> str:
+        return utils.format_url(f"/v1/{{mount_point}}/{prefix}/{{path}}", mount_point=self.mount_point, path=path)
+
+    @async_reauthenticate_on_forbidden
+    async def configure(self) -> object:
+        """
+        A method for applying max_versions and cas_required to the mount configuration.
+
+        Returns:
+            (object) https://www.python-httpx.org/api/#response
+        """
+        return await self.vault_client.request(
+            method='POST',
+            url=utils.format_url('/v1/{mount_point}/config', mount_point=self.mount_point),
+            json={'max_versions': self.max_versions, 'cas_required': self.cas_required}
+        )
+
+    @async_reauthenticate_on_forbidden
+    async def read_secret(self, path: str = None, key: str = None) -> str | dict | None:
+        """
+        A method for read secret from KV2 Engine.
+        Concurrent calls for the same path share one request to the vault server unless coalesce is disabled.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+            :param key (str): specify the key if you want to get only the value of a specific key.
+
+        Returns:
+            (str) 'value'
+                or
+            (dict) {'key': 'value'}
+                or
+            None
+        """
+        try:
+            response = await self.singleflight.do_async(
+                ('read_secret', self.mount_point, path),
+                lambda: self.vault_client.request(method='GET', url=self._url('data', path))
+            )
+            if key:
+                return response['data']['data'][key]
+            return dict(response['data']['data'])
+        except hvac.exceptions.InvalidPath as invalid_path:
+            log.warning('[VaultClient] the path %s/%s does not exist: %s', path, key, invalid_path)
+            return None
+
+    @async_reauthenticate_on_forbidden
+    async def write_secret(self, path: str = None, key: str = None, value: str = None) -> dict:
+        """
+        A method for create or update secret in KV2 Engine with a single PATCH request.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+            :param key (str): the key to write to the secret.
+            :param value (str): the value of the key to write to the secret, None removes the key (also when the secret is created).
+
+        Returns:
+            (dict) the JSON response
+        """
+        return await self._patch_secret(path=path, secrets={key: value})
+
+    @async_reauthenticate_on_forbidden
+    async def write_secrets(self, path: str = None, secrets: dict = None) -> dict:
+        """
+        A method for create or update several keys of the secret in KV2 Engine with a single request.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+            :param secrets (dict): the keys and values to write to the secret, a key with the value None is removed.
+
+        Returns:
+            (dict) the JSON response
+        """
+        return await self._patch_secret(path=path, secrets=secrets)
+
+    async def _patch_secret(self, path: str = None, secrets: dict = None) -> dict:
+        cas = await self._current_version(path=path) if self.cas_required else None
+        create_cas = 0
+        for attempt in range(self.cas_retries + 1):
+            try:
+                return await self.vault_client.request(method='PATCH', url=self._url('data', path), **patch_request(secrets=secrets, cas=cas))
+            except hvac.exceptions.InvalidPath:
+                # if the secret doesn't exist, create it only if no one else has created it yet
+                try:
+                    return await self.vault_client.request(method='POST', url=self._url('data', path), **create_request(secrets=secrets, cas=create_cas))
+                except hvac.exceptions.InvalidRequest as invalid_request:
+                    if not retry_cas_mismatch(path=path, error=invalid_request, attempt=attempt, retries=self.cas_retries):
+                        raise
+                    create_cas = await self._current_version(path=path)
+                    cas = create_cas if self.cas_required else None
+            except hvac.exceptions.InvalidRequest as invalid_request:
+                if not retry_cas_mismatch(path=path, error=invalid_request, attempt=attempt, retries=self.cas_retries):
+                    raise
+                cas = await self._current_version(path=path)
+        return None
+
+    async def _current_version(self, path: str = None) -> int:
+        try:
+            response = await self.vault_client.request(method='GET', url=self._url('metadata', path))
+            return response['data']['current_version']
+        except hvac.exceptions.InvalidPath:
+            return 0
+
+    @async_reauthenticate_on_forbidden
+    async def list_secrets(self, path: str = None) -> list:
+        """
+        A method for list secrets from KV2 Engine.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+
+        Returns:
+            (list) ['key1','key2','key3']
+                or
+            (list) []
+        """
+        try:
+            response = await self.vault_client.request(method='GET', url=self._url('metadata', path), params={'list': 'true'})
+            return response['data']['keys']
+        except hvac.exceptions.InvalidPath as invalid_path:
+            log.error('[VaultClient] the path %s does not exist: %s', path, invalid_path)
+            return []
+
+    @async_reauthenticate_on_forbidden
+    async def delete_secret(self, path: str = None) -> bool:
+        """
+        A method for delete secret from KV2 Engine.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+
+        Returns:
+            (bool) True
+                or
+            (bool) False
+        """
+        try:
+            response = await self.vault_client.request(method='DELETE', url=self._url('metadata', path))
+        except hvac.exceptions.InvalidPath as invalid_path:
+            return deletion_result(path=path, error=invalid_path)
+        return deletion_result(path=path, response=response)
+
+
+# pylint: disable=too-few-public-methods
+class AsyncDBEngine:
+    """
+    This class is responsible for working with the database engine in the vault from asyncio code.
+    Supported methods for:
+        - generate credentials
+    """
+    def __init__(self, vault_client: AsyncVaultClient = None, mount_point: str = None, **kwargs) -> None:
+        """
+        A method for creating an instance of the asyncio database engine.
+
+        Args:
+            :param vault_client (AsyncVaultClient): asyncio vault client instance.
+            :param mount_point (str): the path where the database engine is mounted.
+
+        Keyword Args:
+            :param coalesce (bool): concurrent generate_credentials() calls of the same role share one request
+                and receive the same database user (default False)
+
+        Returns:
+            None
+        """
+        self.vault_client = vault_client
+        self.mount_point = mount_point or f"{vault_client.namespace}-database"
+        self.singleflight = SingleFlight(enabled=kwargs.get('coalesce', False))
+
+    @async_reauthenticate_on_forbidden(idempotent=False)
+    async def generate_credentials(self, role: str) -> dict | None:
+        """
+        A method for generating database credentials.
+        With coalesce enabled the concurrent calls for the same role receive the credentials of one request.
+
+        Args:
+            :param role (str): database role
+
+        Returns:
+            dict: database credentials
+        """
+        try:
+            response = await self.singleflight.do_async(
+                ('generate_credentials', self.mount_point, role),
+                lambda: self.vault_client.request(
+                    method='GET',
+                    url=utils.format_url('/v1/{mount_point}/creds/{role}', mount_point=self.mount_point, role=role)
+                )
+            )
+        except hvac.exceptions.InvalidPath as error:
+            log.error('[VaultClient] database role %s does not exist: %s', role, error)
+            return None
+        log.info('[VaultClient] generated database credentials for role %s', role)
+        return dict(response['data'])
@@ -0,0 +1,393 @@
+"""This module contains the in-process cache for the secrets read from the KV2 Engine"""
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class CacheEntry:
+    """
+    A single cached secret.
+
+    Attributes:
+        data (dict | None): the secret data or None if the path does not exist (negative entry).
+        version (int | None): the version of the secret in the KV2 Engine.
+        expires_at (float): monotonic time after which the entry has to be revalidated.
+    """
+    __slots__ = ('data', 'version', 'expires_at')
+
+    def __init__(self, data: dict | None, version: int | None, expires_at: float) -> None:
+        self.data = data
+        self.version = version
+        self.expires_at = expires_at
+
+    @property
+    def missing(self) -> bool:
+        """True if the entry records a path that does not exist"""
+        return self.data is None
+
+    def expired(self, now: float = None) -> bool:
+        """True if the ttl of the entry has passed"""
+        return (now if now is not None else time.monotonic()) >= self.expires_at
+
+
+# pylint: disable=too-many-instance-attributes
+class SecretCache:
+    """
+    This class is responsible for caching secrets read from the KV2 Engine.
+    Features:
+        - ttl per path prefix
+        - lru eviction when the size limit is reached
+        - negative caching of paths that do not exist
+        - serving expired secrets while the vault server is unavailable
+        - hit/miss/eviction counters
+        - generations of the paths, so a refresh that overlaps a write does not store the data read before the write
+    """
+    def __init__(
+        self,
+        ttl: float = 60,
+        max_size: int = 1024,
+        negative_ttl: float = 10,
+        path_ttl: dict = None,
+        serve_stale: bool = False
+    ) -> None:
+        """
+        A method for creating an instance of the secrets cache.
+
+        Args:
+            :param ttl (float): default time in seconds during which a cached secret is returned without requests to the vault.
+            :param max_size (int): maximum number of cached paths, the least recently used paths are evicted first.
+            :param negative_ttl (float): time in seconds during which a missing path is cached (0 disables negative caching).
+            :param path_ttl (dict): ttl overrides by path prefix, the longest matching prefix wins.
+            :param serve_stale (bool): return the expired secret when the vault server is unavailable.
+
+        Returns:
+            None
+
+        Examples:
+            >>> from vault.cache import SecretCache
+            >>> cache = SecretCache(ttl=60, max_size=1024, negative_ttl=10, path_ttl={'configuration/': 300})
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.negative_ttl = negative_ttl
+        self.serve_stale = serve_stale
+        self.path_ttl = sorted((path_ttl or {}).items(), key=lambda item: len(item[0]), reverse=True)
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'negative_hits': 0, 'revalidations': 0, 'evictions': 0, 'invalidations': 0}
+
+    def ttl_for(self, path: str) -> float:
+        """
+        A method for getting the ttl of the specified path.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+
+        Returns:
+            (float) ttl in seconds
+        """
+        for prefix, ttl in self.path_ttl:
+            if path.startswith(prefix):
+                return ttl
+        return self.ttl
+
+    def get(self, path: str) -> CacheEntry | None:
+        """
+        A method for getting a fresh entry from the cache.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+
+        Returns:
+            (CacheEntry) the entry if it exists and has not expired
+                or
+            None
+        """
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry.expired():
+                self._counters['misses'] += 1
+                return None
+            self._entries.move_to_end(path)
+            self._counters['hits'] += 1
+            if entry.missing:
+                self._counters['negative_hits'] += 1
+            return entry
+
+    def get_stale(self, path: str) -> CacheEntry | None:
+        """
+        A method for getting an entry regardless of its ttl (used for revalidation).
+
+        Args:
+            :param path (str): the path to the secret in vault.
+
+        Returns:
+            (CacheEntry) the entry
+                or
+            None
+        """
+        with self._lock:
+            return self._entries.get(path)
+
+    def generation(self, path: str) -> int:
+        """
+        A method for getting the generation of the path, it is increased by every invalidation of the path.
+        The refresh reads the generation before the request and passes it to set(), set_missing() and revalidate(),
+        so the data read before a concurrent write is not stored after the write has invalidated the path.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+
+        Returns:
+            (int) the generation
+        """
+        with self._lock:
+            return self._generations.get(path, 0)
+
+    def set(self, path: str, data: dict, version: int = None, generation: int = None) -> None:
+        """
+        A method for storing a secret in the cache.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+            :param data (dict): the secret data.
+            :param version (int): the version of the secret.
+            :param generation (int): the generation of the path before the secret was read, the secret is not stored if it has changed.
+
+        Returns:
+            None
+        """
+        self._store(path, CacheEntry(data=data, version=version, expires_at=time.monotonic() + self.ttl_for(path)), generation)
+
+    def set_missing(self, path: str, generation: int = None) -> None:
+        """
+        A method for storing a negative entry for a path that does not exist.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+            :param generation (int): the generation of the path before the secret was read, the entry is not stored if it has changed.
+
+        Returns:
+            None
+        """
+        if self.negative_ttl:
+            self._store(path, CacheEntry(data=None, version=None, expires_at=time.monotonic() + self.negative_ttl), generation)
+
+    def revalidate(self, path: str, generation: int = None) -> CacheEntry | None:
+        """
+        A method for extending the ttl of an entry whose version has not changed.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+            :param generation (int): the generation of the path before the version was read, the entry is not extended if it has changed.
+
+        Returns:
+            (CacheEntry) the revalidated entry
+                or
+            None
+        """
+        with self._lock:
+            entry = self._entries.get(path) if self._current(path, generation) else None
+            if entry is not None:
+                entry.expires_at = time.monotonic() + self.ttl_for(path)
+                self._entries.move_to_end(path)
+                self._counters['revalidations'] += 1
+            return entry
+
+    def invalidate(self, path: str) -> None:
+        """
+        A method for removing a path from the cache.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._generations[path] = self._generations.get(path, 0) + 1
+            if self._entries.pop(path, None) is not None:
+                self._counters['invalidations'] += 1
+
+    def clear(self) -> None:
+        """
+        A method for removing all entries from the cache.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def after_fork(self) -> None:
+        """
+        A method for resetting the lock in the child process.
+
+        Returns:
+            None
+        """
+        self._lock = threading.Lock()
+
+    # pylint: disable=unused-argument
+    @contextmanager
+    def refreshing(self, path: str) -> Iterator[CacheEntry | None]:
+        """
+        A context manager around the refresh of the entry of the path.
+        The refreshes of the in-process cache are coalesced by the engine, so nothing is locked here.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+
+        Yields:
+            None, the caller has to refresh the entry
+        """
+        yield None
+
+    def stats(self) -> dict:
+        """
+        A method for getting the cache counters.
+
+        Returns:
+            (dict) {'hits': 10, 'misses': 2, 'negative_hits': 0, 'revalidations': 1, 'evictions': 0, 'invalidations': 1, 'size': 2}
+        """
+        with self._lock:
+            return {**self._counters, 'size': len(self._entries)}
+
+    def _current(self, path: str, generation: int | None) -> bool:
+        """Checks that the path has not been invalidated since the generation, the caller holds the lock"""
+        return generation is None or self._generations.get(path, 0) == generation
+
+    def _store(self, path: str, entry: CacheEntry, generation: int = None) -> None:
+        with self._lock:
+            if not self._current(path, generation):
+                return
+            self._entries[path] = entry
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+
+class VersionCache:
+    """
+    This class is responsible for caching the data of the versions of the secrets.
+    The data of a version never changes, so the entries do not expire: they are evicted by the size limit (lru)
+    and removed when the secret or the version is deleted through the engine.
+    The version numbers start again from 1 when the secret is deleted and created again by another client,
+    so an entry is returned only for the created_time of the version it has been stored with.
+    """
+    def __init__(self, max_size: int = 256) -> None:
+        """
+        A method for creating an instance of the versions cache.
+
+        Args:
+            :param max_size (int): maximum number of cached versions (0 disables the cache).
+
+        Returns:
+            None
+
+        Examples:
+            >>> from vault.cache import VersionCache
+            >>> cache = VersionCache(max_size=256)
+            >>> cache.set(path='configuration/db', version=3, data={'password': 'qwerty'}, created_time='2024-10-17T10:00:00.000000Z')
+        """
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, path: str, version: int, created_time: str) -> dict | None:
+        """
+        A method for getting the data of the version.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+            :param version (int): the version of the secret.
+            :param created_time (str): the created_time of the version from the metadata of the secret.
+
+        Returns:
+            (dict) the data of the version shared with the cache
+                or
+            None if the version is not cached or has been cached for another secret created at the same path
+        """
+        with self._lock:
+            entry = self._entries.get((path, version))
+            if entry is None or entry[0] != created_time:
+                if entry is not None:
+                    del self._entries[(path, version)]
+                    self._discard(path, version)
+                self._counters['misses'] += 1
+                return None
+            self._entries.move_to_end((path, version))
+            self._counters['hits'] += 1
+            return entry[1]
+
+    def set(self, path: str, version: int, data: dict, created_time: str) -> None:
+        """
+        A method for storing the data of the version.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+            :param version (int): the version of the secret.
+            :param data (dict): the data of the version.
+            :param created_time (str): the created_time of the version.
+
+        Returns:
+            None
+        """
+        if not self.max_size:
+            return
+        with self._lock:
+            self._entries[(path, version)] = (created_time, data)
+            self._entries.move_to_end((path, version))
+            self._versions.setdefault(path, set()).add(version)
+            while len(self._entries) > self.max_size:
+                (evicted_path, evicted_version), _ = self._entries.popitem(last=False)
+                self._discard(evicted_path, evicted_version)
+                self._counters['evictions'] += 1
+
+    def invalidate(self, path: str, version: int = None) -> None:
+        """
+        A method for removing the version or all versions of the secret from the cache.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+            :param version (int): the version of the secret (all versions by default).
+
+        Returns:
+            None
+        """
+        with self._lock:
+            for cached in [version] if version is not None else list(self._versions.get(path, ())):
+                if self._entries.pop((path, cached), None) is not None:
+                    self._discard(path, cached)
+
+    def after_fork(self) -> None:
+        """
+        A method for resetting the lock in the child process.
+
+        Returns:
+            None
+        """
+        self._lock = threading.Lock()
+
+    def stats(self) -> dict:
+        """
+        A method for getting the cache counters.
+
+        Returns:
+            (dict) {'hits': 10, 'misses': 2, 'evictions': 0, 'size': 2}
+        """
+        with self._lock:
+            return {**self._counters, 'size': len(self._entries)}
+
+    def _discard(self, path: str, version: int) -> None:
+        versions = self._versions.get(path)
+        if versions is not None:
+            versions.discard(version)
+            if not versions:
+                del self._versions[path]
@@ -0,0 +1,193 @@
+"""This module contains the command line interface of the vault package"""
+import argparse
+import json
+import signal
+import sys
+
+from .agent import Agent, load_config
+from .client import VaultClient
+
+
+def _client(args: argparse.Namespace, **kwargs) -> VaultClient:
+    """
+    A function for creating the vault client from the arguments and the environment variables.
+
+    Args:
+        :param args (argparse.Namespace): the parsed arguments.
+
+    Keyword Args:
+        :param dbengine (dict): configuration of the database engine.
+
+    Returns:
+        (VaultClient) client
+    """
+    return VaultClient(
+        url=args.url,
+        namespace=args.namespace,
+        transport={'pool_maxsize': max(args.workers, 10)},
+        kv2engine={'configure': False},
+        lazy=True,
+        **kwargs
+    )
+
+
+def _summary(results: dict) -> int:
+    """
+    A function for printing the results of the command.
+
+    Args:
+        :param results (dict): the results with the failed paths.
+
+    Returns:
+        (int) exit code, 1 if some secrets have failed
+    """
+    failed = results.get('failed', {})
+    print(json.dumps({**results, 'failed': {path: str(error) for path, error in failed.items()}}, indent=2), file=sys.stderr)
+    return 1 if failed else 0
+
+
+def export_command(args: argparse.Namespace) -> int:
+    """
+    The command for exporting the secrets to the JSON lines file.
+
+    Args:
+        :param args (argparse.Namespace): the parsed arguments.
+
+    Returns:
+        (int) exit code
+    """
+    client = _client(args)
+    try:
+        if args.output == '-':
+            results = client.kv2engine.export(prefix=args.prefix, stream=sys.stdout, versions=args.versions, max_workers=args.workers)
+        else:
+            with open(args.output, 'w', encoding='UTF-8') as output:
+                results = client.kv2engine.export(prefix=args.prefix, stream=output, versions=args.versions, max_workers=args.workers)
+    finally:
+        client.close()
+    return _summary(results)
+
+
+def import_command(args: argparse.Namespace) -> int:
+    """
+    The command for importing the secrets from the JSON lines file.
+
+    Args:
+        :param args (argparse.Namespace): the parsed arguments.
+
+    Returns:
+        (int) exit code
+    """
+    client = _client(args)
+    try:
+        if args.input == '-':
+            results = client.kv2engine.import_(stream=sys.stdin, max_workers=args.workers, checkpoint=args.checkpoint, dry_run=args.dry_run)
+        else:
+            with open(args.input, 'r', encoding='UTF-8') as source:
+                results = client.kv2engine.import_(stream=source, max_workers=args.workers, checkpoint=args.checkpoint, dry_run=args.dry_run)
+    finally:
+        client.close()
+    return _summary(results)
+
+
+def delete_command(args: argparse.Namespace) -> int:
+    """
+    The command for deleting the secrets under the prefix.
+
+    Args:
+        :param args (argparse.Namespace): the parsed arguments.
+
+    Returns:
+        (int) exit code
+    """
+    client = _client(args)
+    try:
+        results = client.kv2engine.delete_tree(prefix=args.prefix, max_workers=args.workers, rate=args.rate, dry_run=args.dry_run)
+    finally:
+        client.close()
+    return _summary({'deleted': len(results['deleted']), 'dry_run': args.dry_run, 'failed': results['failed']})
+
+
+def agent_command(args: argparse.Namespace) -> int:
+    """
+    The command for rendering the secrets to files and keeping them up to date until SIGTERM or SIGINT.
+
+    Args:
+        :param args (argparse.Namespace): the parsed arguments.
+
+    Returns:
+        (int) exit code, 1 if some templates of the single render have failed
+    """
+    config = load_config(args.config)
+    client = _client(args, **({'dbengine': config.pop('dbengine')} if 'dbengine' in config else {}))
+    try:
+        agent = Agent(vault_client=client, max_workers=args.workers, **config)
+        signal.signal(signal.SIGTERM, lambda *_: agent.stop())
+        signal.signal(signal.SIGINT, lambda *_: agent.stop())
+        results = agent.run(once=args.once)
+    finally:
+        client.close()
+    return _summary({'written': len(results['written']), 'unchanged': results['unchanged'], 'failed': results['failed']}) if args.once else 0
+
+
+def parser() -> argparse.ArgumentParser:
+    """
+    A function for creating the parser of the command line arguments.
+    The connection and authentication are configured with the environment variables of VaultClient.
+
+    Returns:
+        (argparse.ArgumentParser) parser
+    """
+    root = argparse.ArgumentParser(prog='vault', description='Tools for the vault package')
+    root.add_argument('--url', help='URL of the vault server (VAULT_ADDR by default)')
+    root.add_argument('--namespace', help='namespace and mount point of the KV2 Engine (VAULT_NAMESPACE by default)')
+    root.add_argument('--workers', type=int, default=8, help='maximum number of concurrent requests')
+    commands = root.add_subparsers(dest='command', required=True)
+
+    export = commands.add_parser('export', help='export the secrets of the KV2 Engine as JSON lines')
+    export.add_argument('--prefix', help='export only the secrets whose paths start with the prefix')
+    export.add_argument('--output', default='-', help='output file (stdout by default)')
+    export.add_argument('--versions', action='store_true', help='export all versions and the metadata of the secrets')
+    export.set_defaults(handler=export_command)
+
+    restore = commands.add_parser('import', help='import the secrets from JSON lines to the KV2 Engine')
+    restore.add_argument('--input', default='-', help='input file (stdin by default)')
+    restore.add_argument('--checkpoint', help='file with the imported paths to resume an interrupted import')
+    restore.add_argument('--dry-run', action='store_true', help='only validate the records and count the secrets')
+    restore.set_defaults(handler=import_command)
+
+    delete = commands.add_parser('delete', help='delete all versions and the metadata of the secrets under the prefix')
+    delete.add_argument('--prefix', required=True, help='delete the secrets whose paths start with the prefix')
+    delete.add_argument('--rate', type=float, help='maximum number of delete requests per second')
+    delete.add_argument('--dry-run', action='store_true', help='only count the secrets that would be deleted')
+    delete.set_defaults(handler=delete_command)
+
+    agent = commands.add_parser('agent', help='render the secrets to files and re-render them when the secrets or the database credentials change')
+    agent.add_argument('--config', required=True, help='JSON file with the templates, the polling intervals and the process to signal')
+    agent.add_argument('--once', action='store_true', help='render the templates once and exit')
+    agent.set_defaults(handler=agent_command)
+    return root
+
+
+def main(argv: list = None) -> int:
+    """
+    Entrypoint of the command line interface.
+
+    Args:
+        :param argv (list): command line arguments.
+
+    Returns:
+        (int) exit code
+
+    Examples:
+        $ vault export --prefix configuration/ --versions --output backup.jsonl
+        $ vault --namespace project2 import --input backup.jsonl --checkpoint backup.checkpoint --workers 32
+        $ vault delete --prefix environments/pr-123/ --rate 50
+        $ vault agent --config /etc/vault-agent/agent.json
+    """
+    args = parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
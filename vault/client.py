@@ -1,16 +1,79 @@
 """This module contains an implementation over the hvac module for interacting with the Vault Engines"""
+import contextlib
+import functools
 import os
+import threading
+import time
 
 import hvac
 import hvac.exceptions
+from hvac.adapters import JSONAdapter
 from hvac.api.auth_methods import Kubernetes
 
 from logger import log
+from .cluster import Cluster, ClusterAdapter
 from .kv2_engine import KV2Engine
 from .db_engine import DBEngine
+from .transit_engine import TransitEngine
+from .metrics import MetricsRegistry
+from .retry import resilience
+from .token_cache import AESGCM, FileTokenCache
+from .transport import Transport
 
 
-# pylint: disable=too-few-public-methods
+_FORK_LOCK = threading.Lock()
+
+
+def _reset_fork_lock() -> None:
+    """Replaces the lock inherited from the parent process, it may have been held by its threads"""
+    global _FORK_LOCK  # pylint: disable=global-statement
+    _FORK_LOCK = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_fork_lock)
+
+
+def extract_configuration(url: str = None, namespace: str = None, auth: dict = None) -> tuple:
+    """
+    A function for extracting the vault client configuration from the arguments or the environment variables.
+
+    Args:
+        :param url (str): base URL for the Vault instance.
+        :param namespace (str): the name of the namespace in the Vault instance.
+        :param auth (dict): dictionary with authentication data.
+
+    Returns:
+        (tuple) url, namespace, auth
+    """
+    try:
+        log.info('[VaultClient]: extracting the configuration for the vault client...')
+        if not url:
+            url = os.environ.get('VAULT_ADDR')
+
+        if not namespace:
+            namespace = os.environ.get('VAULT_NAMESPACE')
+
+        if not auth:
+            auth = {'type': os.environ.get('VAULT_AUTH_TYPE')}
+            if auth['type'] == 'approle':
+                auth['approle'] = {'id': os.environ.get('VAULT_APPROLE_ID'), 'secret-id': os.environ.get('VAULT_APPROLE_SECRET_ID')}
+            elif auth['type'] == 'token':
+                auth['token'] = os.environ.get('VAULT_TOKEN')
+            elif auth['type'] == 'kubernetes':
+                auth['kubernetes'] = os.environ.get('VAULT_KUBERNETES_SA_TOKEN', '/var/run/secrets/kubernetes.io/serviceaccount/token')
+
+        log.info('[VaultClient]: configuration has been successfully extracted: auth: %s, url: %s, namespace: %s', auth['type'], url, namespace)
+
+    except KeyError as keyerror:
+        raise KeyError(
+            "Failed to extract the value of the Environment Variable. "
+            "You need to set an Environment Variable or pass an argument when creating an instance of VaultClient(arg=value)"
+        ) from keyerror
+
+    return url, namespace, auth
+
+
+# pylint: disable=too-many-instance-attributes
 class VaultClient:
     """
     This class contains classes and methods for working with Vault Engines:
@@ -28,7 +91,7 @@ class VaultClient:
         A method for create a new Vault Client instance.
 
         Args:
-            :param url (str): base URL for the Vault instance.
+            :param url (str | list): base URL for the Vault instance or the URLs of the nodes of the Vault cluster.
             :param namespace (str): the name of the namespace in the Vault instance.
             :param auth (dict): dictionary with authentication data.
                 :param type (str): type of authentication. Supported values: 'approle', 'token', 'kubernetes'.
@@ -42,18 +105,72 @@ class VaultClient:
             :param kv2engine (dict): dictionary with kv2 engine configuration.
                 :param cas_required (bool): all keys will require the cas parameter to be set on all write requests
                 :param max_versions (int): maximum number of versions of the secret available for storage
+                :param cas_retries (int): number of write retries when the cas parameter does not match the current version
                 :param raise_on_deleted_version (bool): changes the behavior when the requested version is deleted
+                :param cache (dict): enables the read-through cache for read_secret(): ttl, max_size, negative_ttl, path_ttl
+                :param configure (bool): True - always write the mount configuration, False - never, None - only if it differs
+                :param coalesce (bool): concurrent read_secret() calls of the same path share one request (default True)
             :param dbengine (dict): dictionary with database engine configuration.
                 :param mount_point (str): the path where the database engine is mounted.
+                :param leases (dict): configuration of the lease renewal for get_credentials(): renew_threshold, increment, revoke_on_exit
+                :param coalesce (bool): concurrent generate_credentials() calls of the same role share one request (default False)
+                :param pools (dict): credential pools for take_credentials() by role: size, expire_threshold, workers, revoke_on_exit
+            :param transitengine (dict): dictionary with transit engine configuration.
+                :param mount_point (str): the path where the transit engine is mounted.
+                :param batch_size (int): number of items in one batch_input request (default 250)
+                :param max_workers (int): maximum number of concurrent batch requests of one call (default 4)
+            :param lazy (bool): authenticate on the first request and create the engines on the first access (default False)
+            :param token_handoff (bool): the child processes forked after the authentication reuse the token of the parent process
+                instead of authenticating again, the token is renewed by the parent process and its new token after the rollover
+                is shared with the children through the token cache (a private file on tmpfs if token_cache is not set) (default False)
+            :param transport (Transport | dict): HTTP transport shared with other clients or its configuration.
+                :param pool_connections (int): number of connection pools (one per vault host) to keep (default 10)
+                :param pool_maxsize (int): maximum number of connections kept per host (default 10)
+                :param pool_block (bool): wait for a free connection when the pool is exhausted (default False)
+                :param timeout (float): timeout of the requests in seconds (default 30)
+                :param keepalive (bool): keep the connections open between requests (default True)
+                :param tcp_keepalive (bool): enable TCP keep-alive probes on the sockets (default True)
+                :param verify (bool | str): TLS verification or path to the CA bundle (default True)
+                :param cert (tuple): client certificate and key for TLS authentication
+            :param renewal (dict): dictionary with the proactive token renewal configuration.
+                :param enabled (bool): renew the token in the background before it expires (default False)
+                :param threshold (float): the part of the token ttl after which the token is renewed (default 0.67)
+                :param increment (int): requested token ttl extension in seconds (default the ttl received at login)
+            :param metrics (MetricsRegistry | bool): registry for the latency, request, error and traffic metrics,
+                True creates a registry for the client (disabled by default)
+            :param retry (RetryPolicy | dict): retries of the transient errors (429, 5xx, connection errors) of all engine methods.
+                :param max_attempts (int): maximum number of attempts including the first one (default 3)
+                :param backoff (float): delay before the first retry, doubled for every next retry (default 0.1)
+                :param max_backoff (float): maximum delay between the attempts (default 5)
+                :param jitter (bool): randomize the delays (default True)
+                :param retry_on (tuple): HTTP status codes to retry (default (429, 500, 502, 503))
+                :param deadline (float): maximum time in seconds for all attempts of the call (default None)
+            :param circuit_breaker (CircuitBreaker | dict): fail fast while an endpoint returns transient errors.
+                :param failure_threshold (int): number of consecutive transient errors that opens the circuit (default 5)
+                :param recovery_timeout (float): time in seconds after which a probe call is allowed (default 30)
+                :param half_open_calls (int): number of concurrent probe calls (default 1)
+            :param token_cache (TokenCache | dict): reuse the token of the previous start of the process instead of the login
+                (approle and kubernetes), the cached token is checked with one lookup-self request and refreshed on renewal.
+                :param file (str): path to the cache file (default a file in /dev/shm derived from the url, namespace and authentication)
+                :param key (str | bytes): the encryption key (default VAULT_TOKEN_CACHE_KEY)
+                :param encrypt (bool): encrypt the token, requires the 'crypto' extra (default True)
+                :param min_ttl (float): the minimum remaining ttl of the cached token in seconds (default 300)
+            :param cluster (dict): routing between the nodes when the url is a list.
+                :param probe_interval (float): interval of the health checks of the nodes in seconds (default 10)
+                :param probe_timeout (float): timeout of the health check in seconds (default 2)
+                :param smoothing (float): weight of the last health check in the smoothed latency of the node (default 0.3)
+                :param read_from_standby (bool): send the reads to the performance standby with the lowest latency (default True)
+                :param consistency (bool): send the X-Vault-Index of the last write with the reads (default True)
 
         Environment Variables:
-            VAULT_ADDR: URL of the vault server.
+            VAULT_ADDR: URL of the vault server or comma-separated URLs of the nodes of the cluster.
             VAULT_NAMESPACE: Namespace in the vault server.
             VAULT_AUTH_TYPE: Type of authentication in the vault server. Supported values: 'approle', 'token', 'kubernetes'.
             VAULT_TOKEN: Root token with full access rights.
             VAULT_APPROLE_ID: Approle ID for authentication in the vault server.
             VAULT_APPROLE_SECRET_ID: Approle Secret ID for authentication in the vault server.
             VAULT_KUBERNETES_SA_TOKEN: Path to the kubernetes service account token.
+            VAULT_TOKEN_CACHE_KEY: Encryption key of the token cache file.
 
         Returns:
             None
@@ -85,48 +202,161 @@ class VaultClient:
             ...     }
             >>> secret_data = vault_client.kv2engine.read_secret(path='path/to/secret')
             >>> pg_credentials = vault_client.dbengine.generate_credentials(role='readonly')
+            >>> ciphertexts = list(vault_client.transitengine.encrypt(name='records', plaintexts=[b'data1', b'data2']))
         """
-        try:
-            log.info('[VaultClient]: extracting the configuration for the vault client...')
-            if url:
-                self.url = url
-            else:
-                self.url = os.environ.get('VAULT_ADDR')
-
-            if namespace:
-                self.namespace = namespace
-            else:
-                self.namespace = os.environ.get('VAULT_NAMESPACE')
+        self.url, self.namespace, self.auth = extract_configuration(url=url, namespace=namespace, auth=auth)
+        transport = kwargs.get('transport')
+        self._owns_transport = not isinstance(transport, Transport)
+        self.transport = Transport(**(transport or {})) if self._owns_transport else transport
+        self.cluster = None
+        self._adapter = JSONAdapter
+        if isinstance(self.url, (list, tuple)) or ',' in (self.url or ''):
+            urls = self.url if isinstance(self.url, (list, tuple)) else self.url.split(',')
+            self.cluster = Cluster(urls=[node.strip() for node in urls], transport=self.transport, **kwargs.get('cluster', {}))
+            self.url = self.cluster.nodes[0].url
+            self._adapter = functools.partial(ClusterAdapter, cluster=self.cluster)
+        self.renewal = {'enabled': False, 'threshold': 0.67, 'increment': None, **kwargs.get('renewal', {})}
+        self.token_ttl = None
+        self.token_renewable = False
+        self.token_expires_at = None
+        self._token_initial_ttl = None
+        self._renewal_timer = None
+        self._auth_lock = threading.RLock()
+        self._pid = os.getpid()
+        self.token_handoff = kwargs.get('token_handoff', False)
+        metrics = kwargs.get('metrics')
+        self.metrics = MetricsRegistry() if metrics is True else metrics or None
+        self.retry, self.circuit_breaker = resilience(kwargs)
+        token_cache = kwargs.get('token_cache')
+        self.token_cache = FileTokenCache(**token_cache) if isinstance(token_cache, dict) else token_cache
+        self._handoff_file = None
+        self._handoff_pid = os.getpid()
+        if self.token_handoff and self.token_cache is None:
+            # the forked children pick up the token of the parent after its rollover from the file instead of logging in each,
+            # the random key is inherited only by the children, so no other process can read the token
+            self._handoff_file = os.path.join(FileTokenCache.directory(), f"vault-handoff-{os.getuid()}-{os.getpid()}-{id(self):x}")
+            self.token_cache = FileTokenCache(file=self._handoff_file, key=FileTokenCache.generate_key() if AESGCM else None, encrypt=AESGCM is not None, min_ttl=0)
+        if self.metrics is not None:
+            self.metrics.add_collector('pool', self.transport.stats, label='host')
+            if self.cluster is not None:
+                self.metrics.add_collector('node', self.cluster.stats, label='node')
+            if self.metrics.record_response not in self.transport.session.hooks['response']:
+                self.transport.session.hooks['response'].append(self.metrics.record_response)
+        self._client = None
+        self._engines = {}
+        self._engines_configuration = {
+            'kv2engine': (KV2Engine, kwargs.get('kv2engine', {})),
+            'dbengine': (DBEngine, kwargs.get('dbengine', {})),
+            'transitengine': (TransitEngine, kwargs.get('transitengine', {}))
+        }
 
-            if auth:
-                self.auth = auth
-            else:
-                self.auth = {'type': os.environ.get('VAULT_AUTH_TYPE')}
-                if self.auth['type'] == 'approle':
-                    self.auth['approle'] = {'id': os.environ.get('VAULT_APPROLE_ID'), 'secret-id': os.environ.get('VAULT_APPROLE_SECRET_ID')}
-                elif self.auth['type'] == 'token':
-                    self.auth['token'] = os.environ.get('VAULT_TOKEN')
-                elif self.auth['type'] == 'kubernetes':
-                    self.auth['kubernetes'] = os.environ.get('VAULT_KUBERNETES_SA_TOKEN', '/var/run/secrets/kubernetes.io/serviceaccount/token')
-
-            log.info('[VaultClient]: configuration has been successfully extracted: auth: %s, url: %s, namespace: %s', self.auth['type'], self.url, self.namespace)
-
-        except KeyError as keyerror:
-            raise KeyError(
-                "Failed to extract the value of the Environment Variable. "
-                "You need to set an Environment Variable or pass an argument when creating an instance of VaultClient(arg=value)"
-            ) from keyerror
+        if kwargs.get('lazy', False):
+            log.info('[VaultClient]: the client will be authenticated on the first request')
+            return
 
         try:
             log.info('[VaultClient]: preparing the client for the vault server...')
             self.client = self.authentication()
-            self.kv2engine = KV2Engine(vault_client=self, **kwargs.get('kv2engine', {}))
-            self.dbengine = DBEngine(vault_client=self, **kwargs.get('dbengine', {}))
+            for name in self._engines_configuration:
+                self._engine(name)
 
         except hvac.exceptions.InvalidRequest as invalid_request:
             log.error('[VaultClient]: failed to initialize the vault client: %s', invalid_request)
             raise hvac.exceptions.InvalidRequest
 
+    @property
+    def client(self) -> hvac.Client:
+        """Returns the authenticated hvac client, the authentication is performed on the first access"""
+        if self._pid != os.getpid():
+            self._after_fork()
+        if self._client is None:
+            with self._auth_lock:
+                if self._client is None:
+                    self._client = self.authentication()
+        return self._client
+
+    @client.setter
+    def client(self, client: hvac.Client) -> None:
+        self._client = client
+
+    @property
+    def kv2engine(self) -> KV2Engine:
+        """Returns the KV2 Engine, it is created on the first access"""
+        return self._engine('kv2engine')
+
+    @property
+    def dbengine(self) -> DBEngine:
+        """Returns the Database Engine, it is created on the first access"""
+        return self._engine('dbengine')
+
+    @property
+    def transitengine(self) -> TransitEngine:
+        """Returns the Transit Engine, it is created on the first access"""
+        return self._engine('transitengine')
+
+    def _engine(self, name: str) -> object:
+        """
+        This method is used to create the engine once and return the same instance on the next calls.
+
+        Args:
+            :param name (str): the name of the engine attribute.
+
+        Returns:
+            (object) the engine instance
+        """
+        if self._pid != os.getpid():
+            self._after_fork()
+        engine = self._engines.get(name)
+        if engine is None:
+            with self._auth_lock:
+                engine = self._engines.get(name)
+                if engine is None:
+                    engine_class, configuration = self._engines_configuration[name]
+                    engine = engine_class(vault_client=self, **configuration)
+                    self._engines[name] = engine
+        return engine
+
+    def _after_fork(self) -> None:
+        """
+        This method is used to make the client inherited from the parent process usable in the child process.
+        The connections of the parent are not reused, the locks and the background threads are recreated,
+        and the child authenticates again on the first request or reuses the token of the parent with token_handoff.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        with _FORK_LOCK:
+            if self._pid == os.getpid():
+                return
+            log.info('[VaultClient]: the process has been forked (%s -> %s), resetting the connections of the client', self._pid, os.getpid())
+            self._pid = os.getpid()
+            self._auth_lock = threading.RLock()
+            # the renewal thread exists only in the parent process
+            self._renewal_timer = None
+            self.transport.after_fork()
+            for component in (self.cluster, self.metrics, self.circuit_breaker, *self._engines.values()):
+                if component is not None:
+                    component.after_fork()
+            if self._client is not None and self.token_handoff:
+                log.info('[VaultClient]: the token of the parent process is reused, it is renewed by the parent process')
+                self._client = self._hvac_client(token=self._client.token)
+            else:
+                self._client = None
+
+    def _hvac_client(self, token: str = None) -> hvac.Client:
+        """Returns a new hvac client that uses the transport of the vault client"""
+        return hvac.Client(
+            url=self.url,
+            token=token,
+            namespace=self.namespace,
+            session=self.transport.session,
+            timeout=self.transport.timeout,
+            adapter=self._adapter
+        )
+
     def authentication(self) -> hvac.Client:
         """
         This method is used to authenticate in the Vault Server.
@@ -134,6 +364,97 @@ class VaultClient:
             - Token
             - AppRole
             - Kubernetes
+        With the token cache the token of the previous start is reused while its remaining ttl is at least min_ttl,
+        the processes of the host sharing the cache file wait for one login instead of logging in at the same time.
+
+        Args:
+            None
+
+        Returns:
+            (hvac.Client) client
+        """
+        if self.token_cache is None or self.auth['type'] == 'token':
+            return self._login()
+        identity = self._token_identity()
+        with contextlib.ExitStack() as stack:
+            try:
+                stack.enter_context(self.token_cache.locked(identity))
+            except OSError as error:
+                log.warning('[VaultClient]: failed to lock the token cache, authenticating without the lock: %s', error)
+            client = self._cached_client(identity)
+            if client is None:
+                client = self._login()
+                self._save_token(client)
+        return client
+
+    def _token_identity(self) -> str:
+        """Returns the url, the namespace and the authentication of the client that identify its cached token"""
+        credentials = self.auth['approle']['id'] if self.auth['type'] == 'approle' else self.auth.get(self.auth['type'])
+        return f"{self.url}|{self.namespace}|{self.auth['type']}|{credentials}"
+
+    def _cached_client(self, identity: str) -> hvac.Client | None:
+        """
+        This method is used to reuse the cached token after checking it with one lookup-self request.
+
+        Args:
+            :param identity (str): the identity of the cached token.
+
+        Returns:
+            (hvac.Client) client with the cached token
+                or
+            None if there is no usable token
+        """
+        try:
+            entry = self.token_cache.load(identity)
+        except OSError as error:
+            # the cache is optional, a cache file that can not be read or is rejected is a miss
+            log.warning('[VaultClient]: failed to load the token from the token cache: %s', error)
+            entry = None
+        # the token that is being replaced has been rejected or can not be renewed anymore
+        replaced = entry is not None and self._client is not None and entry['token'] == self._client.token
+        if entry is None or replaced or (entry['expires_at'] is not None and entry['expires_at'] - time.time() < self.token_cache.min_ttl):
+            if self.metrics is not None:
+                self.metrics.inc('token_cache_total', result='miss')
+            return None
+        client = self._hvac_client(token=entry['token'])
+        try:
+            token = client.auth.token.lookup_self()['data']
+        except (hvac.exceptions.Forbidden, hvac.exceptions.InvalidRequest) as error:
+            log.info('[VaultClient]: the cached token has been rejected by the vault server: %s', error)
+            self.token_cache.clear(identity)
+            if self.metrics is not None:
+                self.metrics.inc('token_cache_total', result='rejected')
+            return None
+        ttl = token.get('ttl', 0)
+        if ttl and ttl < self.token_cache.min_ttl:
+            if self.metrics is not None:
+                self.metrics.inc('token_cache_total', result='miss')
+            return None
+        self._track_token(client=client, lease_duration=ttl, renewable=token.get('renewable', False), login=True)
+        self._token_initial_ttl = token.get('creation_ttl') or ttl
+        log.info('[VaultClient]: reused the cached token, it expires in %ss', ttl or 'never')
+        if self.metrics is not None:
+            self.metrics.inc('token_cache_total', result='hit')
+        return client
+
+    def _save_token(self, client: hvac.Client) -> None:
+        """
+        This method is used to store the token after the login or the renewal, an error of the cache does not fail the client.
+
+        Args:
+            :param client (hvac.Client): the client that owns the token.
+
+        Returns:
+            None
+        """
+        try:
+            self.token_cache.save(identity=self._token_identity(), token=client.token, expires_at=time.time() + self.token_ttl if self.token_ttl else None)
+        except OSError as error:
+            log.warning('[VaultClient]: failed to save the token to the token cache: %s', error)
+
+    def _login(self) -> hvac.Client:
+        """
+        This method is used to receive a new token with the configured authentication method.
 
         Args:
             None
@@ -142,16 +463,19 @@ class VaultClient:
             (hvac.Client) client
         """
         log.info('[VaultClient]: authenticating in the vault server using the %s...', self.auth['type'].upper())
-        client = hvac.Client(url=self.url, namespace=self.namespace)
+        client = self._hvac_client()
+        token_auth = {}
         try:
 
             # Root token authentication
             if self.auth['type'] == 'token':
-                client = hvac.Client(url=self.url, token=self.auth['token'], namespace=self.namespace)
+                client = self._hvac_client(token=self.auth['token'])
+                token = client.auth.token.lookup_self()['data']
+                token_auth = {'lease_duration': token.get('ttl', 0), 'renewable': token.get('renewable', False)}
 
             # AppRole authentication
             elif self.auth['type'] == 'approle':
-                _ = client.auth.approle.login(
+                token_auth = client.auth.approle.login(
                             role_id=self.auth['approle']['id'],
                             secret_id=self.auth['approle']['secret-id'],
                             mount_point=self.namespace
@@ -162,13 +486,13 @@ class VaultClient:
                 if os.path.exists(self.auth['kubernetes']):
                     with open(self.auth['kubernetes'], 'r', encoding='UTF-8') as kubernetes_token:
                         jwt = kubernetes_token.read()
-                        Kubernetes(self.client.adapter).login(role=self.namespace, jwt=jwt)
+                        token_auth = Kubernetes(client.adapter).login(role=self.namespace, jwt=jwt)['auth']
                 else:
                     log.error('[VaultClient]: not found the kubernetes service account token: %s', self.auth['kubernetes'])
                     raise FileNotFoundError
 
             # Check the authentication status (Maybe it only works with the root token ???)
-            if client.is_authenticated():
+            if self.auth['type'] == 'token' or client.is_authenticated():
                 log.info('[VaultClient]: successfully authenticated in the vault server with the %s', self.auth['type'].upper())
             else:
                 log.error('[VaultClient]: failed to authenticate in the vault server: %s\nplease, check the authentication data', client.is_authenticated())
@@ -178,4 +502,120 @@ class VaultClient:
             log.error('[VaultClient]: failed to authenticate in the vault server: %s\nplease, check the authentication data', forbidden)
             raise hvac.exceptions.Forbidden from forbidden
 
+        self._track_token(client=client, lease_duration=token_auth.get('lease_duration', 0), renewable=token_auth.get('renewable', False), login=True)
+        if self.metrics is not None:
+            self.metrics.inc('authentications_total', auth=self.auth['type'])
         return client
+
+    def reauthenticate(self, stale_client: hvac.Client = None) -> hvac.Client:
+        """
+        This method is used to replace the client whose token has been rejected by the Vault Server.
+        Only one authentication is performed when several threads have received Forbidden with the same client,
+        the other threads wait for it and get the new client.
+
+        Args:
+            :param stale_client (hvac.Client): the client whose token has been rejected.
+
+        Returns:
+            (hvac.Client) client
+        """
+        with self._auth_lock:
+            if stale_client is None or self._client is None or self._client is stale_client:
+                self._client = self.authentication()
+                if self.metrics is not None and stale_client is not None:
+                    self.metrics.inc('reauthentications_total')
+            return self._client
+
+    def _track_token(self, client: hvac.Client = None, lease_duration: int = 0, renewable: bool = False, login: bool = False) -> None:
+        """
+        This method is used to remember the ttl of the token and schedule its renewal.
+
+        Args:
+            :param client (hvac.Client): the client that owns the token.
+            :param lease_duration (int): the ttl of the token in seconds (0 - the token never expires).
+            :param renewable (bool): True if the token can be renewed.
+            :param login (bool): True if the token has just been received.
+
+        Returns:
+            None
+        """
+        self.token_ttl = lease_duration
+        self.token_renewable = renewable
+        self.token_expires_at = time.monotonic() + lease_duration if lease_duration else None
+        if login:
+            self._token_initial_ttl = lease_duration
+        if self._renewal_timer is not None:
+            self._renewal_timer.cancel()
+            self._renewal_timer = None
+        if self.renewal['enabled'] and lease_duration:
+            self._renewal_timer = threading.Timer(lease_duration * self.renewal['threshold'], self._renew_token, kwargs={'client': client})
+            self._renewal_timer.daemon = True
+            self._renewal_timer.start()
+
+    def _renew_token(self, client: hvac.Client = None) -> None:
+        """
+        This method is used to renew the token in the background before it expires.
+        If the token cannot be renewed anymore, a new token is received with the authentication.
+
+        Args:
+            :param client (hvac.Client): the client whose token has to be renewed.
+
+        Returns:
+            None
+        """
+        if client is not self._client:
+            return
+        requested = self.renewal['increment'] or self._token_initial_ttl
+        try:
+            if not self.token_renewable:
+                raise ValueError('the token is not renewable')
+            token_auth = client.auth.token.renew_self(increment=requested)['auth']
+            # the token has reached its max_ttl and cannot be extended anymore
+            if token_auth['lease_duration'] < requested * (1 - self.renewal['threshold']):
+                raise ValueError(f"the granted token ttl {token_auth['lease_duration']}s is close to max_ttl")
+            self._track_token(client=client, lease_duration=token_auth['lease_duration'], renewable=token_auth.get('renewable', False))
+            log.info('[VaultClient]: the token has been renewed for %ss', token_auth['lease_duration'])
+            if self.token_cache is not None and self.auth['type'] != 'token':
+                self._save_token(client)
+            if self.metrics is not None:
+                self.metrics.inc('token_renewals_total')
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            log.warning('[VaultClient]: failed to renew the token, re-authenticating: %s', error)
+            try:
+                self.reauthenticate(stale_client=client)
+            except Exception as auth_error:  # pylint: disable=broad-exception-caught
+                log.error('[VaultClient]: failed to re-authenticate in the background: %s', auth_error)
+                self._renewal_timer = threading.Timer(10, self._renew_token, kwargs={'client': client})
+                self._renewal_timer.daemon = True
+                self._renewal_timer.start()
+
+    def close(self) -> None:
+        """
+        This method is used to release the resources of the client: stop the background renewals and watchers,
+        revoke the leases of the managed database credentials and close the HTTP transport if it is not shared.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        if self._pid != os.getpid():
+            self._after_fork()
+        if self._renewal_timer is not None:
+            self._renewal_timer.cancel()
+        if self.cluster is not None:
+            self.cluster.stop()
+        if 'kv2engine' in self._engines:
+            self.kv2engine.close()
+        if 'dbengine' in self._engines:
+            self.dbengine.close()
+        if self._handoff_file is not None and self._pid == self._handoff_pid:
+            # the files of the handoff belong to this process only
+            for file in (self._handoff_file, f"{self._handoff_file}.lock"):
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(file)
+        if self._owns_transport:
+            self.transport.close()
+        elif self.metrics is not None and self.metrics.record_response in self.transport.session.hooks['response']:
+            self.transport.session.hooks['response'].remove(self.metrics.record_response)
@@ -0,0 +1,332 @@
+"""This module contains the routing of the requests between the nodes of the Vault cluster"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import hvac.exceptions
+import requests
+from hvac.adapters import JSONAdapter
+
+from logger import log
+from .retry import unreachable
+from .transport import Transport
+
+
+# https://developer.hashicorp.com/vault/api-docs/system/health
+HEALTH_ROLES = {200: 'active', 429: 'standby', 473: 'performance_standby', 503: 'sealed'}
+READ_METHODS = ('GET', 'LIST')
+
+
+# pylint: disable=too-few-public-methods
+class Node:
+    """
+    A node of the vault cluster.
+
+    Attributes:
+        url (str): base URL of the node.
+        role (str): role reported by the health endpoint: active, standby, performance_standby, sealed or unknown.
+        healthy (bool): False if the last health check or request has failed.
+        latency (float | None): smoothed latency of the health checks in seconds.
+        checked_at (float | None): monotonic time of the last health check.
+        requests (int): number of requests sent to the node.
+        failures (int): number of failed health checks and requests.
+    """
+    __slots__ = ('url', 'role', 'healthy', 'latency', 'checked_at', 'requests', 'failures')
+
+    def __init__(self, url: str) -> None:
+        self.url = url.rstrip('/')
+        self.role = 'unknown'
+        self.healthy = True
+        self.latency = None
+        self.checked_at = None
+        self.requests = 0
+        self.failures = 0
+
+
+# pylint: disable=too-many-instance-attributes
+class Cluster:
+    """
+    This class is responsible for choosing the node of the vault cluster for every request.
+    Features:
+        - the nodes are probed with the health endpoint in the background
+        - reads are sent to the performance standby with the lowest latency, writes to the active node
+        - the requests fail over to the next node when the chosen one is unreachable or sealed
+        - read-after-write consistency with the X-Vault-Index header of the last write
+    """
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(
+        self,
+        urls: list = None,
+        transport: Transport = None,
+        probe_interval: float = 10,
+        probe_timeout: float = 2,
+        smoothing: float = 0.3,
+        read_from_standby: bool = True,
+        consistency: bool = True
+    ) -> None:
+        """
+        A method for creating an instance of the cluster.
+
+        Args:
+            :param urls (list): base URLs of the nodes.
+            :param transport (Transport): the HTTP transport used for the health checks.
+            :param probe_interval (float): interval of the health checks in seconds.
+            :param probe_timeout (float): timeout of the health check in seconds.
+            :param smoothing (float): weight of the last health check in the smoothed latency of the node.
+            :param read_from_standby (bool): send the reads to the performance standbys.
+            :param consistency (bool): send the index of the last write with the reads, so the client sees its own writes.
+
+        Returns:
+            None
+
+        Examples:
+            >>> client = VaultClient(
+            ...     url=['https://vault-0:8200', 'https://vault-1:8200', 'https://vault-2:8200'],
+            ...     namespace='app',
+            ...     cluster={'probe_interval': 5}
+            ... )
+            >>> client.cluster.stats()
+        """
+        self.nodes = [Node(url) for url in urls]
+        self.transport = transport
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.smoothing = smoothing
+        self.read_from_standby = read_from_standby
+        self.consistency = consistency
+        self.index = None
+        self._lock = threading.Lock()
+        self._probe_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        """
+        A method for starting the background health checks.
+
+        Returns:
+            None
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='vault-cluster', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """
+        A method for stopping the background health checks.
+
+        Returns:
+            None
+        """
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(timeout=self.probe_interval)
+            self._wakeup.clear()
+            if not self._stopped.is_set():
+                self.probe()
+
+    def after_fork(self) -> None:
+        """
+        A method for resetting the locks in the child process, the health checks are restarted by the next request.
+
+        Returns:
+            None
+        """
+        self._lock = threading.Lock()
+        self._probe_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def probe(self) -> None:
+        """
+        A method for checking the health and the latency of all nodes concurrently.
+
+        Returns:
+            None
+        """
+        with self._probe_lock:
+            self._probe_all()
+
+    def _probe_all(self) -> None:
+        with ThreadPoolExecutor(max_workers=len(self.nodes)) as executor:
+            list(executor.map(self._probe, self.nodes))
+
+    def _probe(self, node: Node) -> None:
+        started = time.perf_counter()
+        try:
+            response = self.transport.session.get(f"{node.url}/v1/sys/health", timeout=self.probe_timeout)
+            role = HEALTH_ROLES.get(response.status_code, 'unknown')
+            error = None if role in ('active', 'performance_standby', 'standby') else f"status code {response.status_code}"
+        except requests.exceptions.RequestException as request_error:
+            role, error = 'unknown', request_error
+        latency = time.perf_counter() - started
+        with self._lock:
+            node.checked_at = time.monotonic()
+            if error is not None:
+                if node.healthy:
+                    log.warning('[VaultClient]: the vault node %s is unhealthy: %s', node.url, error)
+                node.role, node.healthy = role, False
+                node.failures += 1
+                return
+            if not node.healthy or node.role != role:
+                log.info('[VaultClient]: the vault node %s is healthy: %s', node.url, role)
+            node.role, node.healthy = role, True
+            node.latency = latency if node.latency is None else self.smoothing * latency + (1 - self.smoothing) * node.latency
+
+    def route(self, read: bool = False) -> list:
+        """
+        A method for ordering the nodes for the request: the preferred node first and the fallbacks after it.
+
+        Args:
+            :param read (bool): True for the requests that do not change the state of vault.
+
+        Returns:
+            (list) nodes
+        """
+        if self._thread is None:
+            # the first request waits for the health checks of the nodes
+            with self._probe_lock:
+                if self._thread is None:
+                    self._probe_all()
+                    self.start()
+        preferred = ('performance_standby', 'active', 'standby') if read and self.read_from_standby else ('active', 'performance_standby', 'standby')
+
+        def rank(node: Node) -> tuple:
+            role = preferred.index(node.role) if node.role in preferred else len(preferred)
+            return (not node.healthy, role, node.latency if node.latency is not None else float('inf'))
+
+        with self._lock:
+            return sorted(self.nodes, key=rank)
+
+    def succeeded(self, node: Node) -> None:
+        """
+        A method for recording the successful request to the node.
+
+        Args:
+            :param node (Node): the node.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            node.requests += 1
+
+    def failed(self, node: Node, error: Exception) -> None:
+        """
+        A method for recording the failed request to the node, the node is excluded until the next successful health check.
+
+        Args:
+            :param node (Node): the node.
+            :param error (Exception): the error of the request.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            node.requests += 1
+            node.failures += 1
+            if node.healthy:
+                log.warning('[VaultClient]: the request to the vault node %s has failed, failing over: %s', node.url, error)
+            node.healthy = False
+        self._wakeup.set()
+
+    def record_index(self, response: requests.Response, *_, **__) -> requests.Response:
+        """
+        The response hook for remembering the X-Vault-Index header of the last write.
+
+        Args:
+            :param response (requests.Response): the response of the vault server.
+
+        Returns:
+            (requests.Response) the same response
+        """
+        index = response.headers.get('X-Vault-Index')
+        if index:
+            self.index = index
+        return response
+
+    def stats(self) -> dict:
+        """
+        A method for getting the state of the nodes.
+
+        Returns:
+            (dict) {'https://vault-1:8200': {'healthy': 1, 'performance_standby': 1, 'latency_seconds': 0.002, 'requests': 120, 'failures': 0}}
+        """
+        with self._lock:
+            return {
+                node.url: {
+                    'healthy': int(node.healthy),
+                    'active': int(node.role == 'active'),
+                    'performance_standby': int(node.role == 'performance_standby'),
+                    'latency_seconds': node.latency or 0.0,
+                    'requests': node.requests,
+                    'failures': node.failures
+                }
+                for node in self.nodes
+            }
+
+
+class ClusterAdapter(JSONAdapter):
+    """
+    The hvac adapter that sends every request to the node chosen by the cluster.
+    The base URL of the adapter is replaced for the duration of the request in the current thread only,
+    so one hvac client can be shared by the threads.
+    """
+    def __init__(self, *args, cluster: Cluster = None, **kwargs) -> None:
+        self.cluster = cluster
+        self._target = threading.local()
+        super().__init__(*args, **kwargs)
+
+    @property
+    def base_uri(self) -> str:
+        """Returns the URL of the node chosen for the current request"""
+        return getattr(self._target, 'url', None) or self._base_uri
+
+    @base_uri.setter
+    def base_uri(self, value: str) -> None:
+        self._base_uri = value
+
+    # pylint: disable=arguments-differ
+    def request(self, method, url, headers=None, raise_exception=True, **kwargs):
+        """
+        A method for sending the request to the node chosen by the cluster and failing over to the next one.
+
+        Returns:
+            (dict | requests.Response) the response of the node
+        """
+        read = method.upper() in READ_METHODS
+        headers = dict(headers or {})
+        if read and self.cluster.consistency and self.cluster.index:
+            # the standby forwards the request to the active node if it has not replicated the write yet
+            headers['X-Vault-Index'] = self.cluster.index
+            headers['X-Vault-Inconsistent'] = 'forward-active-node'
+        if not read:
+            # the hooks of the request replace the hooks of the session with the same key, so they are kept explicitly
+            hooks = dict(kwargs.get('hooks') or {})
+            hooks['response'] = [*self.session.hooks.get('response', []), *hooks.get('response', []), self.cluster.record_index]
+            kwargs['hooks'] = hooks
+        nodes = self.cluster.route(read=read)
+        for number, node in enumerate(nodes, start=1):
+            self._target.url = node.url
+            try:
+                response = super().request(method, url, headers=headers, raise_exception=raise_exception, **kwargs)
+            except (requests.exceptions.ConnectionError, hvac.exceptions.VaultDown) as error:
+                self.cluster.failed(node, error)
+                # the writes are repeated only if they have not reached the node
+                if number == len(nodes) or not (read or isinstance(error, hvac.exceptions.VaultDown) or unreachable(error)):
+                    raise
+                continue
+            finally:
+                self._target.url = None
+            self.cluster.succeeded(node)
+            return response
+        return None
@@ -0,0 +1,477 @@
+"""This module contains the lease-aware management of the credentials generated by the database engine"""
+import atexit
+import os
+import threading
+import time
+from collections import deque
+
+from logger import log
+
+
+# pylint: disable=too-few-public-methods
+class Lease:
+    """
+    Credentials of a database role together with the lease issued by the vault.
+
+    Attributes:
+        role (str): the database role.
+        data (dict): the credentials {'username': '...', 'password': '...'}.
+        lease_id (str): the lease id in the vault.
+        lease_duration (int): the last granted duration of the lease in seconds.
+        initial_duration (int): the duration of the lease when the credentials were generated.
+        renewable (bool): True if the lease can be renewed.
+        expires_at (float): monotonic time when the lease expires.
+    """
+    __slots__ = ('role', 'data', 'lease_id', 'lease_duration', 'initial_duration', 'renewable', 'expires_at')
+
+    def __init__(self, role: str, response: dict) -> None:
+        self.role = role
+        self.data = response['data']
+        self.lease_id = response['lease_id']
+        self.renewable = response.get('renewable', False)
+        self.lease_duration = response.get('lease_duration', 0)
+        self.initial_duration = self.lease_duration
+        self.expires_at = time.monotonic() + self.lease_duration
+
+    @property
+    def remaining(self) -> float:
+        """Seconds left until the lease expires"""
+        return self.expires_at - time.monotonic()
+
+
+# pylint: disable=too-many-instance-attributes
+class CredentialManager:
+    """
+    This class is responsible for reusing the database credentials while their lease is valid.
+    Features:
+        - one set of credentials per role instead of a new database user per call
+        - background renewal of the lease before it expires
+        - rotation with a callback when the lease can no longer be renewed
+        - revocation of the leases on shutdown
+    """
+    def __init__(
+        self,
+        dbengine: object = None,
+        renew_threshold: float = 0.67,
+        increment: int = None,
+        revoke_on_exit: bool = True
+    ) -> None:
+        """
+        A method for creating an instance of the credential manager.
+
+        Args:
+            :param dbengine (DBEngine): the database engine used to generate, renew and revoke the credentials.
+            :param renew_threshold (float): the part of the lease duration after which the lease is renewed.
+            :param increment (int): requested lease extension in seconds (the lease duration of the role by default).
+            :param revoke_on_exit (bool): revoke all leases when the interpreter exits.
+
+        Returns:
+            None
+
+        Examples:
+            >>> manager = CredentialManager(dbengine=client.dbengine, renew_threshold=0.67)
+            >>> credentials = manager.get(role='readonly', on_rotate=lambda role, old, new: pool.rotate(new))
+        """
+        self.dbengine = dbengine
+        self.renew_threshold = renew_threshold
+        self.increment = increment
+        self.revoke_on_exit = revoke_on_exit
+        self._leases = {}
+        self._callbacks = {}
+        self._timers = {}
+        self._lock = threading.RLock()
+        self._role_locks = {}
+        self._exit_registered = False
+        self._pid = os.getpid()
+
+    def get(self, role: str, on_rotate: callable = None) -> dict | None:
+        """
+        A method for getting the credentials of the role, new credentials are generated only if there is no valid lease.
+
+        Args:
+            :param role (str): database role.
+            :param on_rotate (callable): callback(role, old_credentials, new_credentials) called when the credentials are rotated.
+
+        Returns:
+            (dict) {'username': '...', 'password': '...'}
+                or
+            None if the role does not exist
+        """
+        with self._lock:
+            if on_rotate is not None and on_rotate not in self._callbacks.setdefault(role, []):
+                self._callbacks[role].append(on_rotate)
+        with self._role_lock(role):
+            lease = self._leases.get(role)
+            if self._usable(lease):
+                return lease.data
+            lease = self._issue(role=role)
+            return lease.data if lease else None
+
+    def _role_lock(self, role: str) -> threading.RLock:
+        """Returns the lock of the role, the requests of one role do not block the other roles"""
+        with self._lock:
+            return self._role_locks.setdefault(role, threading.RLock())
+
+    def _usable(self, lease: Lease | None) -> bool:
+        """
+        A renewable lease is renewed by its timer and is replaced only when it has expired,
+        a lease that can not be renewed is replaced after the renew threshold of its duration.
+        """
+        if lease is None or lease.remaining <= 0:
+            return False
+        return lease.renewable or lease.remaining > lease.lease_duration * (1 - self.renew_threshold)
+
+    def leases(self) -> dict:
+        """
+        A method for getting the managed leases.
+
+        Returns:
+            (dict) {'role': {'lease_id': '...', 'lease_duration': 3600, 'renewable': True, 'remaining': 2400.0}}
+        """
+        with self._lock:
+            return {
+                role: {'lease_id': lease.lease_id, 'lease_duration': lease.lease_duration, 'renewable': lease.renewable, 'remaining': lease.remaining}
+                for role, lease in self._leases.items()
+            }
+
+    def after_fork(self) -> None:
+        """
+        A method for forgetting the leases of the parent process in the child process.
+        The parent renews and revokes its leases, the child generates its own credentials on the next get().
+
+        Returns:
+            None
+        """
+        self._pid = os.getpid()
+        self._lock = threading.RLock()
+        self._role_locks = {}
+        self._leases = {}
+        self._timers = {}
+        if self._exit_registered:
+            atexit.unregister(self.close)
+            self._exit_registered = False
+
+    def close(self) -> None:
+        """
+        A method for stopping the renewals and revoking all managed leases.
+
+        Returns:
+            None
+        """
+        if self._pid != os.getpid():
+            # the exit handler has been inherited by the child process, the leases belong to the parent
+            self.after_fork()
+            return
+        with self._lock:
+            for timer in self._timers.values():
+                timer.cancel()
+            self._timers.clear()
+            leases, self._leases = self._leases, {}
+            if self._exit_registered:
+                atexit.unregister(self.close)
+                self._exit_registered = False
+        for lease in leases.values():
+            self._revoke(lease)
+
+    def _issue(self, role: str) -> Lease | None:
+        """Generates the credentials of the role, the caller holds the lock of the role"""
+        response = self.dbengine.generate_lease(role=role)
+        if response is None:
+            return None
+        lease = Lease(role=role, response=response)
+        with self._lock:
+            previous = self._leases.get(role)
+            self._leases[role] = lease
+            self._schedule(lease)
+            if self.revoke_on_exit and not self._exit_registered:
+                atexit.register(self.close)
+                self._exit_registered = True
+            callbacks = list(self._callbacks.get(role, []))
+        if previous is not None:
+            log.info('[VaultClient] rotated the credentials of the database role %s', role)
+            for callback in callbacks:
+                try:
+                    callback(role, previous.data, lease.data)
+                except Exception as error:  # pylint: disable=broad-exception-caught
+                    log.error('[VaultClient] the rotation callback for the database role %s failed: %s', role, error)
+            # the callbacks have switched to the new credentials, the database user of the replaced lease is dropped
+            self._revoke(previous)
+        return lease
+
+    def _revoke(self, lease: Lease) -> None:
+        try:
+            self.dbengine.revoke_lease(lease_id=lease.lease_id)
+            log.info('[VaultClient] revoked the lease %s of the database role %s', lease.lease_id, lease.role)
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            log.error('[VaultClient] failed to revoke the lease %s of the database role %s: %s', lease.lease_id, lease.role, error)
+
+    def _schedule(self, lease: Lease, delay: float = None) -> None:
+        with self._lock:
+            timer = self._timers.pop(lease.role, None)
+            if timer is not None:
+                timer.cancel()
+            if delay is None:
+                if not lease.renewable and not self._callbacks.get(lease.role):
+                    return
+                delay = max(lease.lease_duration * self.renew_threshold - (lease.lease_duration - lease.remaining), 0)
+            timer = threading.Timer(delay, self._renew, kwargs={'role': lease.role, 'lease_id': lease.lease_id})
+            timer.daemon = True
+            self._timers[lease.role] = timer
+            timer.start()
+
+    def _renew(self, role: str, lease_id: str) -> None:
+        with self._role_lock(role):
+            lease = self._leases.get(role)
+            if lease is None or lease.lease_id != lease_id:
+                return
+            requested = self.increment or lease.initial_duration
+            try:
+                if not lease.renewable:
+                    raise ValueError('the lease is not renewable')
+                response = self.dbengine.renew_lease(lease_id=lease.lease_id, increment=requested)
+                granted = response.get('lease_duration', 0)
+                # the lease has reached max_ttl of the role and cannot be extended anymore
+                if granted < requested * (1 - self.renew_threshold):
+                    raise ValueError(f"the granted lease duration {granted}s is close to max_ttl")
+                lease.lease_duration = granted
+                lease.expires_at = time.monotonic() + granted
+                log.info('[VaultClient] renewed the lease of the database role %s for %ss', role, granted)
+                self._schedule(lease)
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                log.warning('[VaultClient] the lease of the database role %s can no longer be renewed, generating new credentials: %s', role, error)
+                try:
+                    self._issue(role=role)
+                except Exception as issue_error:  # pylint: disable=broad-exception-caught
+                    log.error('[VaultClient] failed to rotate the credentials of the database role %s: %s', role, issue_error)
+                    if lease.remaining > 0:
+                        self._schedule(lease, delay=min(30, lease.remaining / 2))
+
+
+# pylint: disable=too-many-instance-attributes
+class CredentialPool:
+    """
+    This class is responsible for keeping the credentials of the database role generated ahead of demand,
+    so the callers receive them without waiting for the vault to create the database user.
+    Features:
+        - size unused credential sets are kept ready and refilled in the background as they are taken
+        - the unused sets are revoked and replaced before their lease runs low
+        - the unused sets are revoked on shutdown
+        - depth, taken, generated, revoked counters and the wait time histogram
+    """
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(
+        self,
+        dbengine: object = None,
+        role: str = None,
+        size: int = 4,
+        expire_threshold: float = 0.5,
+        workers: int = 1,
+        revoke_on_exit: bool = True
+    ) -> None:
+        """
+        A method for creating an instance of the credential pool, the refill starts immediately.
+
+        Args:
+            :param dbengine (DBEngine): the database engine used to generate and revoke the credentials.
+            :param role (str): database role.
+            :param size (int): number of unused credential sets kept ready.
+            :param expire_threshold (float): the part of the lease duration after which an unused set is revoked and replaced.
+            :param workers (int): number of background threads generating the credentials concurrently.
+            :param revoke_on_exit (bool): revoke the unused sets when the interpreter exits.
+
+        Returns:
+            None
+
+        Examples:
+            >>> pool = CredentialPool(dbengine=client.dbengine, role='readonly', size=8)
+            >>> credentials = pool.take()
+        """
+        if size < 1:
+            raise ValueError('the size of the credential pool must be greater than 0')
+        self.dbengine = dbengine
+        self.role = role
+        self.size = size
+        self.expire_threshold = expire_threshold
+        self.workers = max(workers, 1)
+        self.revoke_on_exit = revoke_on_exit
+        self._ready = deque()
+        self._pending = 0
+        self._missing = False
+        self._error = None
+        self._closed = False
+        self._threads = []
+        self._condition = threading.Condition()
+        self._counters = {'taken': 0, 'generated': 0, 'revoked': 0, 'waits': 0, 'failures': 0}
+        self._pid = os.getpid()
+        self._start()
+
+    def _start(self) -> None:
+        self._threads = [
+            threading.Thread(target=self._run, name=f"vault-pool-{self.role}", daemon=True)
+            for _ in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        if self.revoke_on_exit:
+            atexit.register(self.close)
+
+    def _usable(self, lease: Lease) -> bool:
+        """True if the unused set has not reached the expire threshold of its lease"""
+        return lease.remaining > lease.lease_duration * (1 - self.expire_threshold)
+
+    def take(self, timeout: float = 30) -> dict | None:
+        """
+        A method for taking the ready credentials, the caller waits for the refill only when the pool is empty.
+        The taken credentials belong to the caller: they are not renewed or revoked by the pool and expire with their lease.
+
+        Args:
+            :param timeout (float): maximum time in seconds to wait for the credentials when the pool is empty.
+
+        Returns:
+            (dict) {'username': '...', 'password': '...'}
+                or
+            None if the role does not exist
+
+        Raises:
+            TimeoutError: the credentials have not been generated within the timeout, chained with the last error of the refill.
+        """
+        started = time.perf_counter()
+        with self._condition:
+            deadline = time.monotonic() + timeout
+            waited = False
+            while True:
+                # the sets that have reached the expire threshold are left to the refill threads for revocation
+                lease = next((candidate for candidate in self._ready if self._usable(candidate)), None)
+                if lease is not None:
+                    self._ready.remove(lease)
+                    self._counters['taken'] += 1
+                    # the takers and the refill threads wait on the same condition, a single wakeup may miss the refill threads
+                    self._condition.notify_all()
+                    break
+                if self._missing or self._closed:
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"no credentials of the database role {self.role} within {timeout}s") from self._error
+                if not waited:
+                    waited = True
+                    self._counters['waits'] += 1
+                self._condition.wait(timeout=remaining)
+        metrics = getattr(self.dbengine.vault_client, 'metrics', None)
+        if metrics is not None:
+            metrics.observe('credential_pool_wait_seconds', time.perf_counter() - started, role=self.role)
+        return dict(lease.data)
+
+    def _run(self) -> None:
+        backoff = 1.0
+        while True:
+            with self._condition:
+                while True:
+                    if self._closed:
+                        return
+                    stale = [lease for lease in self._ready if not self._usable(lease)]
+                    if stale or (not self._missing and len(self._ready) + self._pending < self.size):
+                        break
+                    self._condition.wait(timeout=self._next_check())
+                for lease in stale:
+                    self._ready.remove(lease)
+                generate = not self._missing and len(self._ready) + self._pending < self.size
+                if generate:
+                    self._pending += 1
+            for lease in stale:
+                self._revoke(lease)
+            if generate:
+                backoff = 1.0 if self._generate() else min(backoff * 2, 30)
+                if backoff > 1.0:
+                    with self._condition:
+                        self._condition.wait(timeout=backoff)
+
+    def _next_check(self) -> float | None:
+        """Returns the time in seconds until the first unused set reaches the expire threshold"""
+        if not self._ready:
+            return None
+        return max(min(lease.remaining - lease.lease_duration * (1 - self.expire_threshold) for lease in self._ready), 0) + 0.01
+
+    def _generate(self) -> bool:
+        """Generates one set of credentials and returns False if it has failed"""
+        lease, error = None, None
+        try:
+            response = self.dbengine.generate_lease(role=self.role)
+            lease = Lease(role=self.role, response=response) if response is not None else None
+        except Exception as generate_error:  # pylint: disable=broad-exception-caught
+            log.error('[VaultClient] failed to generate the credentials of the database role %s for the pool: %s', self.role, generate_error)
+            error = generate_error
+        with self._condition:
+            self._pending -= 1
+            keep = lease is not None and not self._closed
+            if keep:
+                self._ready.append(lease)
+                self._counters['generated'] += 1
+                self._error = None
+            elif error is not None:
+                self._error = error
+                self._counters['failures'] += 1
+            elif lease is None:
+                log.error('[VaultClient] the database role %s does not exist, the pool is not refilled', self.role)
+                self._missing = True
+            self._condition.notify_all()
+        if lease is not None and not keep:
+            self._revoke(lease)
+        return error is None
+
+    def _revoke(self, lease: Lease) -> None:
+        try:
+            self.dbengine.revoke_lease(lease_id=lease.lease_id)
+            with self._condition:
+                self._counters['revoked'] += 1
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            log.error('[VaultClient] failed to revoke the unused lease %s of the database role %s: %s', lease.lease_id, self.role, error)
+
+    def stats(self) -> dict:
+        """
+        A method for getting the depth and the counters of the pool.
+
+        Returns:
+            (dict) {'size': 4, 'ready': 3, 'pending': 1, 'taken': 10, 'generated': 13, 'revoked': 0, 'waits': 1, 'failures': 0}
+        """
+        with self._condition:
+            return {'size': self.size, 'ready': len(self._ready), 'pending': self._pending, **self._counters}
+
+    def after_fork(self) -> None:
+        """
+        A method for forgetting the unused sets of the parent process in the child process and restarting the refill.
+
+        Returns:
+            None
+        """
+        if self.revoke_on_exit:
+            atexit.unregister(self.close)
+        self._pid = os.getpid()
+        self._condition = threading.Condition()
+        self._ready = deque()
+        self._pending = 0
+        if not self._closed:
+            self._start()
+
+    def close(self) -> None:
+        """
+        A method for stopping the refill and revoking the unused sets.
+
+        Returns:
+            None
+        """
+        if self._pid != os.getpid():
+            # the exit handler has been inherited by the child process, the unused sets belong to the parent
+            self._pid, self._ready, self._closed = os.getpid(), deque(), True
+            return
+        with self._condition:
+            self._closed = True
+            leases, self._ready = list(self._ready), deque()
+            self._condition.notify_all()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join()
+        if self.revoke_on_exit:
+            atexit.unregister(self.close)
+        for lease in leases:
+            self._revoke(lease)
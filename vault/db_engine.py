@@ -1,10 +1,14 @@
 """This module contains the class and methods for working with the database engine in the Vault"""
+import threading
+
 from logger import log
 
 import hvac
 import hvac.exceptions
 
+from .credentials import CredentialManager, CredentialPool
 from .decorators import reauthenticate_on_forbidden
+from .singleflight import SingleFlight
 
 
 # pylint: disable=too-few-public-methods
@@ -13,8 +17,11 @@ class DBEngine:
     This class is responsible for working with the database engine in the vault.
     Supported methods for:
         - generate credentials
+        - get credentials with the lease renewal
+        - take pre-generated credentials from the pool of the role
+        - revoke the managed leases
     """
-    def __init__(self, vault_client: object = None, mount_point: str = None) -> None:
+    def __init__(self, vault_client: object = None, mount_point: str = None, **kwargs) -> None:
         """
         A method for creating an instance of the database engine.
 
@@ -22,6 +29,19 @@ class DBEngine:
             :param vault_client (object): vault client instance with VaultClient class and attribute hvac.Client
             :param mount_point (str): the path where the database engine is mounted.
 
+        Keyword Args:
+            :param leases (dict): configuration of the credential manager used by get_credentials().
+                :param renew_threshold (float): the part of the lease duration after which the lease is renewed (default 0.67)
+                :param increment (int): requested lease extension in seconds (default the lease duration of the role)
+                :param revoke_on_exit (bool): revoke the managed leases when the interpreter exits (default True)
+            :param coalesce (bool): concurrent generate_credentials() calls of the same role share one request
+                and receive the same database user (default False)
+            :param pools (dict): the credential pools created with the engine by role, e.g. {'readonly': {'size': 8}}
+                :param size (int): number of unused credential sets kept ready (default 4)
+                :param expire_threshold (float): the part of the lease duration after which an unused set is replaced (default 0.5)
+                :param workers (int): number of background threads generating the credentials (default 1)
+                :param revoke_on_exit (bool): revoke the unused sets when the interpreter exits (default True)
+
         Returns:
             None
 
@@ -29,18 +49,30 @@ class DBEngine:
             >>> from vault import DBEngine
             >>> db_engine = DBEngine(vault_client=client, mount_point='database')
         """
-        log.info('[VaultClient] configuration Database Engine for client %s', vault_client.client)
-        self.client = vault_client.client
+        log.info('[VaultClient] configuration Database Engine for the vault client %s', vault_client.url)
         self.vault_client = vault_client
         if mount_point:
             self.mount_point = mount_point
         else:
             self.mount_point = f"{vault_client.namespace}-database"
+        self.credentials = CredentialManager(dbengine=self, **kwargs.get('leases', {}))
+        self.singleflight = SingleFlight(enabled=kwargs.get('coalesce', False))
+        self.pools_configuration = kwargs.get('pools', {})
+        self._pools = {}
+        self._pools_lock = threading.Lock()
+        for role in self.pools_configuration:
+            self.pool(role=role)
 
-    @reauthenticate_on_forbidden
+    @property
+    def client(self) -> hvac.Client:
+        """Returns the current hvac client of the vault client, it is replaced on re-authentication"""
+        return self.vault_client.client
+
+    @reauthenticate_on_forbidden(idempotent=False)
     def generate_credentials(self, role: str) -> dict | None:
         """
         A method for generating database credentials.
+        With coalesce enabled the concurrent calls for the same role receive the credentials of one request.
 
         Args:
             :param role (str): database role
@@ -52,9 +84,155 @@ class DBEngine:
             >>> credentials = dbengine.generate_credentials(role='readonly')
         """
         try:
-            response = self.client.secrets.database.generate_credentials(name=role, mount_point=self.mount_point)
+            response = self.singleflight.do(
+                ('generate_credentials', self.mount_point, role),
+                lambda: self.client.secrets.database.generate_credentials(name=role, mount_point=self.mount_point)
+            )
             log.info('[VaultClient] generated database credentials for role %s', role)
-            return response['data']
+            return dict(response['data'])
         except hvac.exceptions.InvalidPath as error:
             log.error('[VaultClient] database role %s does not exist: %s', role, error)
             return None
+
+    @reauthenticate_on_forbidden(idempotent=False)
+    def generate_lease(self, role: str) -> dict | None:
+        """
+        A method for generating database credentials together with the lease information.
+
+        Args:
+            :param role (str): database role
+
+        Returns:
+            dict: {'lease_id': '...', 'lease_duration': 3600, 'renewable': True, 'data': {'username': '...', 'password': '...'}}
+
+        Examples:
+            >>> lease = dbengine.generate_lease(role='readonly')
+        """
+        try:
+            response = self.client.secrets.database.generate_credentials(name=role, mount_point=self.mount_point)
+            log.info('[VaultClient] generated database credentials for role %s with lease %s', role, response['lease_id'])
+            return response
+        except hvac.exceptions.InvalidPath as error:
+            log.error('[VaultClient] database role %s does not exist: %s', role, error)
+            return None
+
+    @reauthenticate_on_forbidden
+    def renew_lease(self, lease_id: str, increment: int = None) -> dict:
+        """
+        A method for renewing the lease of the database credentials.
+
+        Args:
+            :param lease_id (str): the lease id.
+            :param increment (int): requested lease extension in seconds.
+
+        Returns:
+            dict: {'lease_id': '...', 'lease_duration': 3600, 'renewable': True}
+        """
+        return self.client.sys.renew_lease(lease_id=lease_id, increment=increment)
+
+    @reauthenticate_on_forbidden
+    def revoke_lease(self, lease_id: str) -> object:
+        """
+        A method for revoking the lease of the database credentials, the database user is dropped by the vault.
+
+        Args:
+            :param lease_id (str): the lease id.
+
+        Returns:
+            (object) https://www.w3schools.com/python/ref_requests_response.asp
+        """
+        return self.client.sys.revoke_lease(lease_id=lease_id)
+
+    def get_credentials(self, role: str, on_rotate: callable = None) -> dict | None:
+        """
+        A method for getting database credentials that are reused while their lease is valid.
+        The lease is renewed in the background before it expires and new credentials are generated
+        only when the lease can no longer be renewed, in this case the on_rotate callback is called.
+
+        Args:
+            :param role (str): database role
+            :param on_rotate (callable): callback(role, old_credentials, new_credentials) to rotate the connection pools.
+
+        Returns:
+            dict: database credentials
+
+        Examples:
+            >>> credentials = dbengine.get_credentials(role='readonly', on_rotate=lambda role, old, new: pool.reconnect(**new))
+        """
+        return self.credentials.get(role=role, on_rotate=on_rotate)
+
+    def pool(self, role: str, **kwargs) -> CredentialPool:
+        """
+        A method for getting the credential pool of the role, the pool is created and filled on the first call.
+
+        Args:
+            :param role (str): database role.
+
+        Keyword Args:
+            the arguments of CredentialPool overriding the pools configuration of the engine: size, expire_threshold, workers, revoke_on_exit.
+
+        Returns:
+            (CredentialPool) the pool of the role
+
+        Examples:
+            >>> dbengine.pool(role='readonly', size=8).stats()
+        """
+        pool = self._pools.get(role)
+        if pool is None:
+            with self._pools_lock:
+                pool = self._pools.get(role)
+                if pool is None:
+                    pool = CredentialPool(dbengine=self, role=role, **{**self.pools_configuration.get(role, {}), **kwargs})
+                    if not self._pools and getattr(self.vault_client, 'metrics', None) is not None:
+                        self.vault_client.metrics.add_collector('credential_pool', self._pool_stats, label='role')
+                    self._pools[role] = pool
+        return pool
+
+    def take_credentials(self, role: str, timeout: float = 30) -> dict | None:
+        """
+        A method for taking database credentials generated ahead of demand by the pool of the role.
+        The credentials are returned without a request to the vault while the pool is not empty,
+        the pool is refilled in the background. The credentials expire with their lease.
+
+        Args:
+            :param role (str): database role
+            :param timeout (float): maximum time in seconds to wait for the credentials when the pool is empty.
+
+        Returns:
+            dict: database credentials
+                or
+            None if the role does not exist
+
+        Examples:
+            >>> credentials = dbengine.take_credentials(role='readonly')
+        """
+        return self.pool(role=role).take(timeout=timeout)
+
+    def _pool_stats(self) -> dict:
+        """Returns the depth and the counters of the credential pools for the metrics registry"""
+        return {role: pool.stats() for role, pool in list(self._pools.items())}
+
+    def after_fork(self) -> None:
+        """
+        A method for resetting the state of the engine inherited from the parent process in the child process.
+
+        Returns:
+            None
+        """
+        self.singleflight.after_fork()
+        self.credentials.after_fork()
+        self._pools_lock = threading.Lock()
+        for pool in self._pools.values():
+            pool.after_fork()
+
+    def close(self) -> None:
+        """
+        A method for stopping the lease renewals and revoking the leases of the credentials from get_credentials()
+        and the unused credentials of the pools.
+
+        Returns:
+            None
+        """
+        self.credentials.close()
+        for pool in list(self._pools.values()):
+            pool.close()
@@ -1,19 +1,126 @@
 """This module contains decorators for the VaultClient class"""
+import functools
+
 from logger import log
 import hvac
 import hvac.exceptions
 
+from .retry import is_transient
+
 
-def reauthenticate_on_forbidden(method):
+def reauthenticate_on_forbidden(method: callable = None, idempotent: bool = True):
     """
     Decorator for re-authenticate in the Vault Server when a Forbidden exception is caught.
+    Only one re-authentication is performed for concurrent calls that have received Forbidden with the same client.
+    The transient errors are retried and the circuit breaker is checked when they are configured in the vault client.
+    The calls with side effects are declared with idempotent=False, they are retried only if they have not been executed.
+    The call is measured when the metrics are enabled in the vault client.
+
+    Examples:
+        >>> @reauthenticate_on_forbidden(idempotent=False)
+        ... def generate_credentials(self, role: str) -> dict | None:
     """
-    def wrapper(self, *args, **kwargs):
+    if method is None:
+        return functools.partial(reauthenticate_on_forbidden, idempotent=idempotent)
+    name = method.__qualname__
+
+    def call(self, *args, **kwargs):
+        client = self.vault_client.client
         try:
             return method(self, *args, **kwargs)
         except hvac.exceptions.Forbidden:
             log.warning('[VaultClient]: Forbidden exception caught, re-authenticating...')
-            self.vault_client.client = self.vault_client.authentication()
-            self.client = self.vault_client.client
+            self.vault_client.reauthenticate(stale_client=client)
+            return method(self, *args, **kwargs)
+
+    def resilient_call(self, metrics, *args, **kwargs):
+        retry = getattr(self.vault_client, 'retry', None)
+        if retry is None:
+            return call(self, *args, **kwargs)
+        return retry.run(
+            lambda: call(self, *args, **kwargs),
+            endpoint=name,
+            breaker=self.vault_client.circuit_breaker,
+            metrics=metrics,
+            idempotent=idempotent
+        )
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        metrics = getattr(self.vault_client, 'metrics', None)
+        if metrics is None:
+            return resilient_call(self, None, *args, **kwargs)
+        with metrics.measure(name=name, namespace=self.vault_client.namespace):
+            return resilient_call(self, metrics, *args, **kwargs)
+    return wrapper
+
+
+def async_reauthenticate_on_forbidden(method: callable = None, idempotent: bool = True):
+    """
+    Decorator for re-authenticate in the Vault Server when a Forbidden exception is caught in the coroutine.
+    Only one re-authentication is performed for concurrent coroutines that have received Forbidden with the same token.
+    The transient errors are retried and the circuit breaker is checked when they are configured in the vault client.
+    The coroutines with side effects are declared with idempotent=False, they are retried only if they have not been executed.
+    The call is measured when the metrics are enabled in the vault client.
+    """
+    if method is None:
+        return functools.partial(async_reauthenticate_on_forbidden, idempotent=idempotent)
+    name = method.__qualname__
+
+    async def call(self, *args, **kwargs):
+        token = self.vault_client.token
+        try:
+            return await method(self, *args, **kwargs)
+        except hvac.exceptions.Forbidden:
+            log.warning('[VaultClient]: Forbidden exception caught, re-authenticating...')
+            await self.vault_client.reauthenticate(stale_token=token)
+            return await method(self, *args, **kwargs)
+
+    async def resilient_call(self, metrics, *args, **kwargs):
+        retry = getattr(self.vault_client, 'retry', None)
+        if retry is None:
+            return await call(self, *args, **kwargs)
+        return await retry.run_async(
+            lambda: call(self, *args, **kwargs),
+            endpoint=name,
+            breaker=self.vault_client.circuit_breaker,
+            metrics=metrics,
+            idempotent=idempotent
+        )
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        metrics = getattr(self.vault_client, 'metrics', None)
+        if metrics is None:
+            return await resilient_call(self, None, *args, **kwargs)
+        with metrics.measure(name=name, namespace=self.vault_client.namespace):
+            return await resilient_call(self, metrics, *args, **kwargs)
+    return wrapper
+
+
+def serve_stale_on_error(method):
+    """
+    Decorator for returning the secret from the cache when the vault server is unavailable.
+    The decorated method has to accept the path and the key of the secret. The stale secret is returned only if the
+    cache of the engine is configured with serve_stale and the error is transient (after the retries of the call).
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
             return method(self, *args, **kwargs)
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            cache = self.cache
+            version = kwargs['version'] if 'version' in kwargs else (args[2] if len(args) > 2 else None)
+            # only the current version of the secret is kept in the cache
+            if cache is None or not cache.serve_stale or version or not is_transient(error):
+                raise
+            path = kwargs['path'] if 'path' in kwargs else args[0]
+            key = kwargs['key'] if 'key' in kwargs else (args[1] if len(args) > 1 else None)
+            entry = cache.get_stale(path)
+            if entry is None:
+                raise
+            log.warning('[VaultClient]: the vault server is unavailable, returning the stale secret %s from the cache: %s', path, error)
+            if entry.missing:
+                return None
+            return entry.data[key] if key else dict(entry.data)
     return wrapper
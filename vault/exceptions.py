@@ -18,3 +18,67 @@ class WrongKV2Configuration(Exception):
     def __init__(self, message):
         self.message = message
         super().__init__(message)
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised when the call is rejected because the circuit of the endpoint is open after repeated transient errors.
+
+    Args:
+        endpoint (str): The name of the endpoint, for example KV2Engine.read_secret.
+        retry_in (float): The time in seconds after which a probe call is allowed.
+
+    Example:
+        >>> try:
+        ...     client.kv2engine.read_secret(path='configuration/db')
+        ... except CircuitOpenError as e:
+        ...     print(e)
+        the circuit of KV2Engine.read_secret is open, retry in 12.5s
+    """
+    def __init__(self, endpoint, retry_in=0.0):
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+        self.message = f"the circuit of {endpoint} is open, retry in {retry_in:.1f}s"
+        super().__init__(self.message)
+
+
+class FlushError(Exception):
+    """
+    Raised when the buffered writes of some paths have not been written to the vault.
+    The updates of the failed paths are kept in the buffer and written again by the next flush.
+
+    Args:
+        errors (dict): The exceptions of the failed writes by path.
+
+    Example:
+        >>> try:
+        ...     buffer.flush()
+        ... except FlushError as e:
+        ...     print(e)
+        failed to flush 1 path(s): jobs/42: InternalServerError
+    """
+    def __init__(self, errors):
+        self.errors = errors
+        self.message = f"failed to flush {len(errors)} path(s): " + ', '.join(f"{path}: {error.__class__.__name__}" for path, error in errors.items())
+        super().__init__(self.message)
+
+
+class TransitError(Exception):
+    """
+    Returned in place of the result of a single item of the batch that has been rejected by the Transit Engine.
+    The other items of the same batch are not affected.
+
+    Args:
+        message (str): The error message of the item from the vault.
+        index (int): The position of the item in the input.
+
+    Example:
+        >>> for result in client.transitengine.decrypt(name='records', ciphertexts=ciphertexts):
+        ...     if isinstance(result, TransitError):
+        ...         print(result)
+        item 7: invalid ciphertext: no prefix
+    """
+    def __init__(self, message, index=None):
+        self.index = index
+        self.message = f"item {index}: {message}" if index is not None else message
+        super().__init__(self.message)
@@ -1,21 +1,122 @@
 """This module contains the class and methods for working with the kv v2 engine in the vault"""
+# pylint: disable=too-many-lines
+import json
+import os
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import IO, Iterator
+
 from logger import log
 
 import hvac
 import hvac.exceptions
+from hvac import utils
 
+from .cache import SecretCache, VersionCache
 from .exceptions import WrongKV2Configuration
-from .decorators import reauthenticate_on_forbidden
+from .decorators import reauthenticate_on_forbidden, serve_stale_on_error
+from .ratelimit import RateLimiter
+from .shared_cache import SharedSecretCache
+from .singleflight import SingleFlight
+from .watcher import Watcher
+from .write_buffer import WriteBuffer
+
+
+def patch_request(secrets: dict = None, cas: int = None) -> dict:
+    """
+    A function for building the PATCH request that merges the keys into the secret, used by the sync and async engines.
+
+    Args:
+        :param secrets (dict): the keys and values to write to the secret, a key with the value None is removed.
+        :param cas (int): the version of the secret expected by check-and-set, None writes without the check.
+
+    Returns:
+        (dict) the json and the headers arguments of the request
+    """
+    return {
+        'json': {'data': secrets, 'options': {'cas': cas} if cas is not None else {}},
+        'headers': {'Content-Type': 'application/merge-patch+json'}
+    }
+
+
+def create_request(secrets: dict = None, cas: int = 0) -> dict:
+    """
+    A function for building the POST request that creates the secret when the PATCH has not found it.
+    The keys with the value None are not written, so the result is the same as the PATCH of an existing secret.
+
+    Args:
+        :param secrets (dict): the keys and values to write to the secret.
+        :param cas (int): the version of the secret expected by check-and-set, 0 if no one else has created it yet.
+
+    Returns:
+        (dict) the json argument of the request
+    """
+    return {'json': {'data': {key: value for key, value in secrets.items() if value is not None}, 'options': {'cas': cas}}}
+
+
+def is_cas_mismatch(error: Exception) -> bool:
+    """Checks if the error is caused by the cas parameter that does not match the current version of the secret"""
+    return 'check-and-set' in str(error)
+
+
+def retry_cas_mismatch(path: str = None, error: Exception = None, attempt: int = 0, retries: int = 0) -> bool:
+    """
+    A function for checking if the write rejected by check-and-set can be retried against the new version of the secret.
+
+    Args:
+        :param path (str): the path to the secret in vault.
+        :param error (Exception): the error of the write.
+        :param attempt (int): the number of the failed attempt starting from 0.
+        :param retries (int): the maximum number of retries.
+
+    Returns:
+        (bool) True if another writer has changed the secret and the write has to be retried
+    """
+    if not is_cas_mismatch(error) or attempt >= retries:
+        return False
+    log.warning('[VaultClient] the secret %s has been changed by another writer, retrying: %s', path, error)
+    return True
+
+
+def deletion_result(path: str = None, response: object = None, error: Exception = None) -> bool:
+    """
+    A function for logging the result of the request that deletes the secret with all its versions.
+
+    Args:
+        :param path (str): the path to the secret in vault.
+        :param response (object): the response of the request.
+        :param error (Exception): the InvalidPath error of the request if the path does not exist.
+
+    Returns:
+        (bool) True if the secret has been deleted
+    """
+    if error is not None:
+        log.error('[VaultClient] it looks like the path %s does not exist: %s', path, error)
+        return False
+    if response.status_code == 204:
+        log.info('[VaultClient] the secret %s has been deleted: %s', path, response)
+        return True
+    log.error("[VaultClient] failed to delete secret %s: %s", path, response)
+    return False
 
 
+# pylint: disable=too-many-instance-attributes
 class KV2Engine:
     """
     This class is responsible for working with the kv v2 engine in the vault.
     Supported methods for:
         - read secret
+        - read several secrets concurrently
+        - read the versions, the metadata, the history and the diffs of the secrets
         - create or update secret
+        - create or update several keys of the secret
         - list secrets
+        - walk the tree of secrets recursively
+        - export and import the tree of secrets as JSON lines
+        - watch the secrets for changes
         - delete secret
+        - delete the tree of secrets concurrently
     """
     def __init__(self, vault_client: object = None, **kwargs) -> None:
         """
@@ -27,10 +128,34 @@ class KV2Engine:
         Keyword Args:
             :param max_versions (int): maximum number of versions of the secret available for storage (default 10)
             :param cas_required (bool): all keys will require the cas parameter to be set on all write requests (default False)
+            :param cas_retries (int): number of write retries when the cas parameter does not match the current version (default 3)
+            :param configure (bool): how to apply max_versions and cas_required to the mount configuration (default None)
+                if True the configuration is always written
+                if False the configuration is never changed
+                if None the configuration is written only if it differs from the current one
             :param raise_on_deleted_version (bool): changes the behavior when the requested version is deleted (default True)
                 if True an exception will be raised
                 if False, some metadata about the deleted secret is returned
                 if None (pre-v3), a default of True will be used and a warning will be issued
+            :param cache (dict): enables the in-process read-through cache for read_secret() (disabled by default)
+                :param ttl (float): time in seconds during which a cached secret is returned without requests (default 60)
+                :param max_size (int): maximum number of cached paths, least recently used are evicted (default 1024)
+                :param negative_ttl (float): time in seconds during which a missing path is cached (default 10)
+                :param path_ttl (dict): ttl overrides by path prefix, e.g. {'configuration/': 300}
+                :param serve_stale (bool): return the expired secret while the vault server is unavailable (default False)
+                :param shared (dict): stores the cache in a memory-mapped file shared by the processes of the host (disabled by default)
+                    :param file (str): path to the cache file (default: a file in /dev/shm derived from the url and the mount point)
+                    :param key (str): urlsafe base64 AES key of the entries (default VAULT_CACHE_KEY)
+                    :param encrypt (bool): encrypt the entries, requires the 'crypto' extra (default True)
+                    :param slot_size (int): maximum size of the cached secret in bytes (default 4096)
+            :param coalesce (bool): concurrent read_secret() calls of the same path share one request (default True)
+            :param version_cache (dict): the cache of the versions read with read_secret(version=...), history() and diff()
+                :param max_size (int): maximum number of cached versions, 0 disables the cache (default 256)
+            :param watcher (dict): configuration of the background watcher used by watch()
+                :param jitter (float): random deviation of the polling intervals (default 0.1)
+                :param backoff (float): multiplier of the polling interval of a secret that has not changed (default 2.0)
+                :param batch_size (int): maximum number of polls before the schedule is checked for new paths (default 100)
+                :param discovery_interval (float): interval of listing the watched prefixes for new secrets (default 300)
 
         Returns:
             None
@@ -43,94 +168,513 @@ class KV2Engine:
             ...     mount_point='secret',
             ...     max_versions=10,
             ...     cas_required=False,
-            ...     raise_on_deleted_version=True
+            ...     raise_on_deleted_version=True,
+            ...     cache={'ttl': 60, 'max_size': 1024, 'negative_ttl': 10}
             ... )
         """
-        log.info('[VaultClient] configuration KV2 Engine for client %s', vault_client.client)
+        log.info('[VaultClient] configuration KV2 Engine for the mount point %s', vault_client.namespace)
 
-        self.client = vault_client.client
         self.vault_client = vault_client
         self.max_versions = kwargs.get('max_versions', 10)
         self.mount_point = vault_client.namespace
         self.cas_required = kwargs.get('cas_required', False)
+        self.cas_retries = kwargs.get('cas_retries', 3)
         self.raise_on_deleted_version = kwargs.get('raise_on_deleted_version', True)
+        self.cache = self._create_cache(kwargs['cache']) if kwargs.get('cache') is not None else None
+        self.singleflight = SingleFlight(enabled=kwargs.get('coalesce', True))
+        self.version_cache = VersionCache(**kwargs.get('version_cache', {}))
+        self.watcher_configuration = kwargs.get('watcher', {})
+        self._watcher = None
+        self._watcher_lock = threading.Lock()
+        if self.cache is not None and getattr(vault_client, 'metrics', None) is not None:
+            vault_client.metrics.add_collector('cache', self._cache_stats, label='mount_point')
 
-        if self.mount_point and self.client:
-            self.client.secrets.kv.v2.configure(
-                max_versions=self.max_versions,
-                mount_point=self.mount_point,
-                cas_required=self.cas_required
-            )
-            log.info('[VaultClient] configuration KV2 Engine for client %s has been completed', self.client)
-        else:
+        if not self.mount_point:
             raise WrongKV2Configuration("Mount point not specified, KV2 Engine configuration error. Please set the argument mount_point=<mount_point_name>.")
+        if kwargs.get('configure') is not False:
+            self.configure(force=kwargs.get('configure', False))
+
+    @property
+    def client(self) -> hvac.Client:
+        """Returns the current hvac client of the vault client, it is replaced on re-authentication"""
+        return self.vault_client.client
+
+    def _create_cache(self, configuration: dict) -> SecretCache:
+        """Returns the in-process cache or the cache shared by the processes of the host"""
+        configuration = dict(configuration)
+        shared = configuration.pop('shared', None)
+        if not shared:
+            return SecretCache(**configuration)
+        shared = {'name': f"{self.vault_client.url}/{self.mount_point}", **(shared if isinstance(shared, dict) else {})}
+        return SharedSecretCache(**configuration, **shared)
+
+    def _cache_stats(self) -> dict:
+        """Returns the cache counters of the mount point for the metrics registry"""
+        return {self.mount_point: self.cache.stats()}
 
     @reauthenticate_on_forbidden
-    def read_secret(self, path: str = None, key: str = None) -> str | dict | None:
+    def configure(self, force: bool = False) -> bool:
+        """
+        A method for applying max_versions and cas_required to the mount configuration of the KV2 Engine.
+        The configuration is written only if it differs from the current one, unless force is set.
+
+        Args:
+            :param force (bool): write the configuration without comparing it with the current one.
+
+        Returns:
+            (bool) True if the configuration has been written
+                or
+            (bool) False
+        """
+        if not force:
+            try:
+                current = self.client.secrets.kv.v2.read_configuration(mount_point=self.mount_point)['data']
+                if current.get('max_versions') == self.max_versions and current.get('cas_required') == self.cas_required:
+                    log.info('[VaultClient] configuration KV2 Engine for the mount point %s is up to date', self.mount_point)
+                    return False
+            except hvac.exceptions.Forbidden as forbidden:
+                log.warning('[VaultClient] not enough permissions to read the configuration of the mount point %s, skipping: %s', self.mount_point, forbidden)
+                return False
+        self.client.secrets.kv.v2.configure(
+            max_versions=self.max_versions,
+            mount_point=self.mount_point,
+            cas_required=self.cas_required
+        )
+        log.info('[VaultClient] configuration KV2 Engine for the mount point %s has been completed', self.mount_point)
+        return True
+
+    @serve_stale_on_error
+    @reauthenticate_on_forbidden
+    def read_secret(self, path: str = None, key: str = None, version: int = None) -> str | dict | None:
         """
         A method for read secret from KV2 Engine.
+        If the cache is enabled, the secret is returned from the cache until its ttl expires.
+        After that, the version of the secret is compared with the metadata and the secret is re-read only if it has changed.
+        If the cache is configured with serve_stale, the expired secret is returned while the vault server is unavailable.
+        Concurrent calls for the same path share one request to the vault server unless coalesce is disabled.
+        The specified versions are read from the vault and kept in the versions cache used by history() and diff().
 
         Args:
             :param path (str): the path to the secret in vault.
             :param key (str): specify the key if you want to get only the value of a specific key.
+            :param version (int): the version of the secret to read (the current version by default).
 
         Returns:
             (str) 'value'
                 or
             (dict) {'key': 'value'}
                 or
-            None
+            None if the path or the version does not exist or the version has been deleted
+
+        Examples:
+            >>> kv2engine.read_secret(path='configuration/db', key='password', version=3)
         """
         try:
-            response = self.client.secrets.kv.v2.read_secret_version(
-                path=path,
-                mount_point=self.mount_point,
-                raise_on_deleted_version=self.raise_on_deleted_version
-            )
+            if version:
+                secret = self._read_version(path=path, version=version)
+            elif self.cache is None:
+                secret = self.singleflight.do(('read_secret', self.mount_point, path), lambda: self._read_secret_version(path=path)['data'])
+            else:
+                secret = self._read_secret_cached(path=path)
+                if secret is None:
+                    return None
             if key:
-                return response['data']['data'][key]
-            return response['data']['data']
+                return secret[key]
+            return dict(secret)
         except hvac.exceptions.InvalidPath as invalid_path:
             log.warning('[VaultClient] the path %s/%s does not exist: %s', path, key, invalid_path)
             return None
 
+    def _read_version(self, path: str = None, version: int = None, created_time: str = None) -> dict:
+        """
+        A method for reading the data of the version through the versions cache.
+        The version numbers start again from 1 when the secret is deleted and created again (also by another client),
+        so the cached version is returned only if its created_time matches the metadata read by the caller.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+            :param version (int): the version of the secret.
+            :param created_time (str): the created_time of the version from the metadata (None reads the version from the vault).
+
+        Returns:
+            (dict) the data of the version shared with the cache, it has to be copied before returning to the caller
+        """
+        data = self.version_cache.get(path, version, created_time) if created_time else None
+        if data is None:
+            data = self.singleflight.do(('read_secret', self.mount_point, path, version), lambda: self._fetch_version(path=path, version=version))
+        return data
+
+    def _fetch_version(self, path: str = None, version: int = None) -> dict:
+        """
+        A method for reading the data of the version from the vault and storing it in the versions cache.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+            :param version (int): the version of the secret.
+
+        Returns:
+            (dict) the data of the version shared with the cache, it has to be copied before returning to the caller
+        """
+        secret = self.client.secrets.kv.v2.read_secret_version(
+            path=path,
+            version=version,
+            mount_point=self.mount_point,
+            raise_on_deleted_version=True
+        )['data']
+        self.version_cache.set(path=path, version=version, data=secret['data'], created_time=secret['metadata']['created_time'])
+        return secret['data']
+
+    @reauthenticate_on_forbidden
+    def _read_listed_version(self, path: str = None, version: int = None, versions: dict = None) -> dict | None:
+        """
+        A method for reading the version listed in the metadata of the secret through the versions cache.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+            :param version (int): the version of the secret.
+            :param versions (dict): the versions from the metadata of the secret.
+
+        Returns:
+            (dict) a copy of the data of the version
+                or
+            None if the version does not exist or has been deleted
+        """
+        created_time = (versions.get(str(version)) or {}).get('created_time')
+        try:
+            return dict(self._read_version(path=path, version=version, created_time=created_time))
+        except hvac.exceptions.InvalidPath:
+            return None
+
+    def _read_secret_version(self, path: str = None) -> dict:
+        """Returns the data and the metadata of the current version of the secret"""
+        return self.client.secrets.kv.v2.read_secret_version(
+            path=path,
+            mount_point=self.mount_point,
+            raise_on_deleted_version=self.raise_on_deleted_version
+        )['data']
+
+    def _read_secret_cached(self, path: str = None) -> dict | None:
+        """
+        A method for reading the secret through the cache.
+        The concurrent misses of the same path are coalesced into one revalidation or read.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+
+        Returns:
+            (dict) the secret data shared with the cache, it has to be copied before returning to the caller
+                or
+            None if the path is cached as missing
+        """
+        entry = self.cache.get(path)
+        if entry is not None:
+            return entry.data if not entry.missing else None
+        return self.singleflight.do(('read_secret', self.mount_point, path), lambda: self._refresh_secret(path=path))
+
+    def _refresh_secret(self, path: str = None) -> dict | None:
+        """
+        A method for revalidating the expired secret by comparing versions instead of reading the full secret.
+        The secret is read and stored in the cache if it has changed or is not cached.
+        With the shared cache only one process of the host refreshes the path, the others use its result.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+
+        Returns:
+            (dict) the secret data
+                or
+            None if the path has been cached as missing by another process
+        """
+        with self.cache.refreshing(path) as refreshed:
+            if refreshed is not None:
+                return refreshed.data if not refreshed.missing else None
+            # a write of this client that completes during the refresh invalidates the path, the result is not stored then
+            generation = self.cache.generation(path)
+            entry = self.cache.get_stale(path)
+            if entry is not None and not entry.missing:
+                current_version = self.client.secrets.kv.v2.read_secret_metadata(
+                    path=path,
+                    mount_point=self.mount_point
+                )['data']['current_version']
+                if current_version == entry.version:
+                    revalidated = self.cache.revalidate(path, generation=generation)
+                    if revalidated is not None:
+                        return revalidated.data
+            try:
+                response = self._read_secret_version(path=path)
+            except hvac.exceptions.InvalidPath:
+                self.cache.set_missing(path, generation=generation)
+                raise
+            self.cache.set(path=path, data=response['data'], version=response['metadata']['version'], generation=generation)
+            return response['data']
+
+    def read_secrets(self, paths: list = None, key: str = None, max_workers: int = 8) -> dict:
+        """
+        A method for read several secrets from KV2 Engine concurrently.
+        The reads share the connection pool of the client and are re-authenticated on Forbidden like read_secret().
+        An error of a single path does not abort the batch, the exception is returned as the value of the path.
+
+        Args:
+            :param paths (list): the paths to the secrets in vault.
+            :param key (str): specify the key if you want to get only the value of a specific key from each secret.
+            :param max_workers (int): maximum number of concurrent requests (keep it within the connection pool size).
+
+        Returns:
+            (dict) {'path1': {'key': 'value'}, 'path2': None, 'path3': Exception()}
+
+        Examples:
+            >>> secrets = kv2engine.read_secrets(paths=['configuration/db', 'configuration/api'], max_workers=8)
+        """
+        return self._map_paths(lambda path: self.read_secret(path=path, key=key), paths=paths, max_workers=max_workers, action='read the secret')
+
+    def read_metadata(self, paths: list = None, max_workers: int = 8) -> dict:
+        """
+        A method for read the metadata of several secrets from KV2 Engine concurrently.
+        An error of a single path does not abort the batch, the exception is returned as the value of the path.
+
+        Args:
+            :param paths (list): the paths to the secrets in vault.
+            :param max_workers (int): maximum number of concurrent requests.
+
+        Returns:
+            (dict) {
+                'path1': {'current_version': 3, 'oldest_version': 1, 'created_time': '...', 'versions': {'1': {...}}, ...},
+                'path2': None,
+                'path3': Exception()
+            }
+
+        Examples:
+            >>> metadata = kv2engine.read_metadata(paths=['configuration/db', 'configuration/api'])
+            >>> rotated = {path: meta['updated_time'] for path, meta in metadata.items() if isinstance(meta, dict)}
+        """
+        return self._map_paths(lambda path: self._read_metadata(path=path), paths=paths, max_workers=max_workers, action='read the metadata of')
+
+    @staticmethod
+    def _map_paths(function: callable, paths: list = None, max_workers: int = 8, action: str = None) -> dict:
+        """
+        A method for calling the function for the unique paths concurrently and collecting the results by path.
+
+        Args:
+            :param function (callable): the function called with the path.
+            :param paths (list): the paths to the secrets in vault.
+            :param max_workers (int): maximum number of concurrent calls.
+            :param action (str): the description of the call for the error log.
+
+        Returns:
+            (dict) {'path': result or Exception()}
+        """
+        paths = list(dict.fromkeys(paths or []))
+        if not paths:
+            return {}
+        results = {}
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(paths)), thread_name_prefix='vault-read') as executor:
+            futures = {path: executor.submit(function, path) for path in paths}
+            for path, future in futures.items():
+                try:
+                    results[path] = future.result()
+                except Exception as error:  # pylint: disable=broad-exception-caught
+                    log.error('[VaultClient] failed to %s %s: %s', action, path, error)
+                    results[path] = error
+        return results
+
+    @reauthenticate_on_forbidden
+    def _read_metadata(self, path: str = None) -> dict | None:
+        """Returns the metadata of the secret or None if the secret does not exist"""
+        try:
+            return self.client.secrets.kv.v2.read_secret_metadata(path=path, mount_point=self.mount_point)['data']
+        except hvac.exceptions.InvalidPath:
+            return None
+
+    def history(self, path: str = None, include_data: bool = True, reverse: bool = False) -> Iterator[dict]:
+        """
+        A method for iterating over the versions of the secret.
+        The metadata is read once and the data of every version is read only when the iteration reaches it,
+        so the iteration can be stopped without reading the remaining versions.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+            :param include_data (bool): read the data of the versions.
+            :param reverse (bool): yield the newest versions first.
+
+        Returns:
+            (Iterator) {'version': 1, 'created_time': '...', 'deletion_time': None, 'destroyed': False, 'data': {'key': 'value'}}
+                the data is None for the deleted and destroyed versions
+
+        Examples:
+            >>> for version in kv2engine.history(path='configuration/db', reverse=True):
+            ...     print(version['version'], version['created_time'], sorted(version['data']))
+        """
+        metadata = self._read_metadata(path=path)
+        if metadata is None:
+            return
+        versions = metadata.get('versions') or {}
+        for version in sorted(versions, key=int, reverse=reverse):
+            info = versions[version]
+            record = {
+                'version': int(version),
+                'created_time': info.get('created_time'),
+                'deletion_time': info.get('deletion_time') or None,
+                'destroyed': bool(info.get('destroyed'))
+            }
+            if include_data:
+                if record['destroyed'] or record['deletion_time']:
+                    self.version_cache.invalidate(path, int(version))
+                    record['data'] = None
+                else:
+                    record['data'] = self._read_listed_version(path=path, version=int(version), versions=versions)
+            yield record
+
+    def diff(self, path: str = None, version1: int = None, version2: int = None) -> dict:
+        """
+        A method for comparing two versions of the secret.
+        Only the names of the keys are returned, so the values of the secret are not exposed to the caller.
+        The metadata is read once to resolve the current version and to check the versions cached before.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+            :param version1 (int): the older version.
+            :param version2 (int): the newer version (the current version by default).
+
+        Returns:
+            (dict) {'added': ['key3'], 'removed': ['key1'], 'changed': ['key2']}
+
+        Raises:
+            ValueError: the secret or one of the versions does not exist or has been deleted.
+
+        Examples:
+            >>> kv2engine.diff(path='configuration/db', version1=2, version2=3)
+            {'added': [], 'removed': [], 'changed': ['password']}
+        """
+        if version1 == version2:
+            return {'added': [], 'removed': [], 'changed': []}
+        metadata = self._read_metadata(path=path)
+        if metadata is None:
+            raise ValueError(f"the secret {path} does not exist")
+        if version2 is None:
+            version2 = metadata['current_version']
+            if version1 == version2:
+                return {'added': [], 'removed': [], 'changed': []}
+        versions = metadata.get('versions') or {}
+        old = self._read_listed_version(path=path, version=version1, versions=versions)
+        new = self._read_listed_version(path=path, version=version2, versions=versions)
+        for version, data in ((version1, old), (version2, new)):
+            if data is None:
+                raise ValueError(f"the version {version} of the secret {path} does not exist or has been deleted")
+        return {
+            'added': sorted(new.keys() - old.keys()),
+            'removed': sorted(old.keys() - new.keys()),
+            'changed': sorted(key for key in old.keys() & new.keys() if old[key] != new[key])
+        }
+
     @reauthenticate_on_forbidden
     def write_secret(self, path: str = None, key: str = None, value: str = None) -> object:
         """
         A method for create or update secret in KV2 Engine.
+        The key is updated with a single PATCH request, other keys of the secret are preserved.
 
         Args:
             :param path (str): the path to the secret in vault.
             :param key (str): the key to write to the secret.
-            :param value (str): the value of the key to write to the secret.
+            :param value (str): the value of the key to write to the secret, None removes the key (also when the secret is created).
+
+        Returns:
+            (object) https://www.w3schools.com/python/ref_requests_response.asp
+        """
+        return self._patch_secret(path=path, secrets={key: value})
+
+    @reauthenticate_on_forbidden
+    def write_secrets(self, path: str = None, secrets: dict = None, cas: bool = None) -> object:
+        """
+        A method for create or update several keys of the secret in KV2 Engine with a single request.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+            :param secrets (dict): the keys and values to write to the secret, a key with the value None is removed.
+            :param cas (bool): check-and-set against the current version, retried on conflicts (default cas_required of the engine).
+
+        Returns:
+            (object) https://www.w3schools.com/python/ref_requests_response.asp
+
+        Examples:
+            >>> kv2engine.write_secrets(path='configuration/db', secrets={'username': 'user1', 'password': 'qwerty'})
+        """
+        return self._patch_secret(path=path, secrets=secrets, cas_required=cas)
+
+    def write_buffer(self, max_keys: int = 100, interval: float = 1.0, cas: bool = True, max_workers: int = 8) -> WriteBuffer:
+        """
+        A method for creating the write-behind buffer of the engine.
+        The pending keys of the same path are merged and written with one request when the buffer is flushed.
+
+        Args:
+            :param max_keys (int): number of pending keys that triggers the flush in the writing thread.
+            :param interval (float): interval of the background flushes in seconds (None disables them).
+            :param cas (bool): write every path with check-and-set against its current version.
+            :param max_workers (int): maximum number of paths written concurrently by the flush.
+
+        Returns:
+            (WriteBuffer) the buffer, it has to be closed or used as a context manager
+
+        Examples:
+            >>> with kv2engine.write_buffer(interval=5) as buffer:
+            ...     for step in range(1000):
+            ...         buffer.write_secrets(path='jobs/42', secrets={'progress': str(step), 'state': 'running'})
+        """
+        return WriteBuffer(kv2engine=self, max_keys=max_keys, interval=interval, cas=cas, max_workers=max_workers)
+
+    def _patch_secret(self, path: str = None, secrets: dict = None, cas_required: bool = None) -> object:
+        """
+        A method for merging keys into the secret using the PATCH method of the KV2 Engine.
+        If the engine requires the cas parameter, the write is checked against the current version of the secret
+        and retried when another writer has changed it. If the secret doesn't exist, it is created.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+            :param secrets (dict): the keys and values to write to the secret.
+            :param cas_required (bool): check-and-set against the current version (default cas_required of the engine).
 
         Returns:
             (object) https://www.w3schools.com/python/ref_requests_response.asp
         """
-        # This is not an optimal solution,
-        # but the hvac module cannot verify the existence of a secret without exception
-        # https://github.com/hvac/hvac/issues/381
+        cas_required = self.cas_required if cas_required is None else cas_required
+        cas = self._current_version(path=path) if cas_required else None
+        create_cas = 0
+        url = utils.format_url('/v1/{mount_point}/data/{path}', mount_point=self.mount_point, path=path)
         try:
-            # secret existence verification
-            secret = self.client.secrets.kv.v2.read_secret_version(
-                path=path,
-                mount_point=self.mount_point,
-                raise_on_deleted_version=self.raise_on_deleted_version
-            )['data']['data']
-            secret[key] = value
-            # update an existing secret
-            return self.client.secrets.kv.v2.create_or_update_secret(
-                path=path,
-                secret=secret,
-                mount_point=self.mount_point
-            )
+            for attempt in range(self.cas_retries + 1):
+                try:
+                    return self.client.adapter.request(method='patch', url=url, **patch_request(secrets=secrets, cas=cas))
+                except hvac.exceptions.InvalidPath:
+                    # if the secret doesn't exist, create it only if no one else has created it yet
+                    try:
+                        return self.client.adapter.request(method='post', url=url, **create_request(secrets=secrets, cas=create_cas))
+                    except hvac.exceptions.InvalidRequest as invalid_request:
+                        if not retry_cas_mismatch(path=path, error=invalid_request, attempt=attempt, retries=self.cas_retries):
+                            raise
+                        create_cas = self._current_version(path=path)
+                        cas = create_cas if cas_required else None
+                except hvac.exceptions.InvalidRequest as invalid_request:
+                    if not retry_cas_mismatch(path=path, error=invalid_request, attempt=attempt, retries=self.cas_retries):
+                        raise
+                    cas = self._current_version(path=path)
+            return None
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate(path)
+
+    def _current_version(self, path: str = None) -> int:
+        """
+        A method for getting the current version of the secret from the metadata.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+
+        Returns:
+            (int) the current version or 0 if the secret doesn't exist
+        """
+        try:
+            return self.client.secrets.kv.v2.read_secret_metadata(path=path, mount_point=self.mount_point)['data']['current_version']
         except hvac.exceptions.InvalidPath:
-            # if the secret doesn't exist
-            return self.client.secrets.kv.v2.create_or_update_secret(
-                path=path,
-                secret={key: value},
-                mount_point=self.mount_point
-            )
+            return 0
 
     @reauthenticate_on_forbidden
     def list_secrets(self, path: str = None) -> list:
@@ -154,6 +698,515 @@ class KV2Engine:
             log.error('[VaultClient] the path %s does not exist: %s', path, invalid_path)
             return []
 
+    # pylint: disable=too-many-locals,too-many-branches
+    def walk(
+        self,
+        path: str = None,
+        depth: int = None,
+        prefix: str = None,
+        include_data: bool = False,
+        max_workers: int = 4
+    ) -> Iterator[str | tuple]:
+        """
+        A method for recursive walk through the tree of secrets in KV2 Engine.
+        Subdirectories are listed concurrently and the leaf paths are yielded as soon as they are discovered,
+        only the directories that have not been listed yet are kept in memory.
+
+        Args:
+            :param path (str): the path to start the walk from (the root of the engine by default).
+            :param depth (int): maximum depth of subdirectories to descend into (unlimited by default, 0 - only the path itself).
+            :param prefix (str): yield only the paths starting with the prefix and skip the directories that cannot contain them.
+            :param include_data (bool): yield the secret data together with the path.
+            :param max_workers (int): maximum number of concurrent requests.
+
+        Returns:
+            (Iterator) 'path/to/secret'
+                or
+            (Iterator) ('path/to/secret', {'key': 'value'}) if include_data is True
+
+        Examples:
+            >>> for path in kv2engine.walk(path='configuration/', depth=2):
+            ...     print(path)
+            >>> for path, secret in kv2engine.walk(path='configuration/', prefix='configuration/prod', include_data=True):
+            ...     print(path, secret)
+        """
+        root = f"{path.strip('/')}/" if path and path.strip('/') else ''
+        directories = [(root, 0)]
+        leaves = deque()
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='vault-walk')
+        running = {}
+        try:
+            while directories or leaves or running:
+                # keep the number of requests in flight bounded, reading secrets before descending deeper
+                while len(running) < max_workers and (directories or (include_data and leaves)):
+                    if include_data and leaves:
+                        leaf = leaves.popleft()
+                        running[executor.submit(self.read_secret, path=leaf)] = ('read', leaf, None)
+                    else:
+                        directory, level = directories.pop()
+                        running[executor.submit(self.list_secrets, path=directory)] = ('list', directory, level)
+                if not include_data:
+                    while leaves:
+                        yield leaves.popleft()
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, current, level = running.pop(future)
+                    if kind == 'read':
+                        yield current, future.result()
+                        continue
+                    for child in self._walk_filter(directory=current, keys=future.result(), prefix=prefix):
+                        if not child.endswith('/'):
+                            leaves.append(child)
+                        elif depth is None or level < depth:
+                            directories.append((child, level + 1))
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _walk_filter(directory: str = None, keys: list = None, prefix: str = None) -> Iterator[str]:
+        """Yields the full paths of the listed keys that match the prefix or may contain matching paths"""
+        for key in keys:
+            child = f"{directory}{key}"
+            if not prefix or child.startswith(prefix) or (key.endswith('/') and prefix.startswith(child)):
+                yield child
+
+    def export(self, prefix: str = None, stream: IO = None, versions: bool = False, max_workers: int = 8) -> dict:
+        """
+        A method for exporting the secrets under the prefix to the stream as JSON lines.
+        The paths are streamed from walk() and read concurrently, only the records in flight are kept in memory.
+
+        Args:
+            :param prefix (str): export only the secrets whose paths start with the prefix (the whole engine by default).
+            :param stream (IO): text stream to write the records to, one JSON object per line.
+            :param versions (bool): export all versions and the metadata of the secrets instead of the current version.
+            :param max_workers (int): maximum number of concurrent requests.
+
+        Returns:
+            (dict) {'exported': 100, 'skipped': 1, 'failed': {'path': Exception()}}
+                skipped are the secrets whose current version has been deleted
+
+        Examples:
+            >>> with open('backup.jsonl', 'w', encoding='UTF-8') as backup:
+            ...     kv2engine.export(prefix='configuration/', stream=backup, versions=True)
+            # {"path": "configuration/db", "version": 3, "data": {"password": "qwerty"}}
+            # {"path": "configuration/db", "metadata": {...}, "versions": [{"version": 1, "data": {...}, "deleted": false}, ...]}
+        """
+        directory = prefix.rsplit('/', 1)[0] if prefix and '/' in prefix else ''
+        results = {'exported': 0, 'skipped': 0, 'failed': {}}
+        paths = self.walk(path=directory, prefix=prefix)
+        for path, future in self._map_bounded(lambda path: self._export_record(path=path, versions=versions), paths, max_workers):
+            try:
+                record = future.result()
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                log.error('[VaultClient] failed to export the secret %s: %s', path, error)
+                results['failed'][path] = error
+                continue
+            if record is None:
+                results['skipped'] += 1
+                continue
+            stream.write(json.dumps(record) + '\n')
+            results['exported'] += 1
+        log.info('[VaultClient] exported %s secrets from %s/%s', results['exported'], self.mount_point, prefix or '')
+        return results
+
+    @reauthenticate_on_forbidden
+    def _export_record(self, path: str = None, versions: bool = False) -> dict | None:
+        """
+        A method for reading the export record of the secret.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+            :param versions (bool): include all versions and the metadata of the secret.
+
+        Returns:
+            (dict) {'path': 'path', 'version': 3, 'data': {...}}
+                or
+            (dict) {'path': 'path', 'metadata': {...}, 'versions': [{'version': 1, 'data': {...}, 'deleted': False}]}
+                or
+            None if the secret or its current version has been deleted
+        """
+        try:
+            if not versions:
+                response = self.client.secrets.kv.v2.read_secret_version(
+                    path=path,
+                    mount_point=self.mount_point,
+                    raise_on_deleted_version=True
+                )['data']
+                return {'path': path, 'version': response['metadata']['version'], 'data': response['data']}
+            metadata = self.client.secrets.kv.v2.read_secret_metadata(path=path, mount_point=self.mount_point)['data']
+        except hvac.exceptions.InvalidPath:
+            return None
+        history = []
+        for version in sorted(metadata.get('versions', {}), key=int):
+            info = metadata['versions'][version]
+            deleted = bool(info.get('destroyed') or info.get('deletion_time'))
+            data = None if deleted else self.client.secrets.kv.v2.read_secret_version(
+                path=path,
+                version=int(version),
+                mount_point=self.mount_point,
+                raise_on_deleted_version=True
+            )['data']['data']
+            history.append({'version': int(version), 'data': data, 'deleted': deleted})
+        return {
+            'path': path,
+            'metadata': {key: metadata.get(key) for key in ('current_version', 'max_versions', 'cas_required', 'delete_version_after', 'custom_metadata')},
+            'versions': history
+        }
+
+    # pylint: disable=too-many-locals
+    def import_(self, stream: IO = None, max_workers: int = 8, checkpoint: str = None, dry_run: bool = False) -> dict:
+        """
+        A method for importing the secrets from the JSON lines stream created by export().
+        The records are read lazily and written concurrently. The imported paths are appended to the checkpoint file,
+        so an interrupted import can be restarted with the same checkpoint and continues with the remaining secrets.
+        The versions of the exported history are written in order as new versions, the deleted versions are skipped.
+        Every version is written with check-and-set and noted in the checkpoint before the write,
+        so neither a restarted import nor a retried request writes a version twice.
+
+        Args:
+            :param stream (IO): text stream with the records, one JSON object per line.
+            :param max_workers (int): maximum number of concurrent requests.
+            :param checkpoint (str): path to the file with the already imported paths.
+            :param dry_run (bool): only validate the records and count the secrets that would be written.
+
+        Returns:
+            (dict) {'imported': 100, 'skipped': 5, 'failed': {'path': Exception()}}
+                skipped are the secrets that have already been imported according to the checkpoint
+
+        Examples:
+            >>> with open('backup.jsonl', 'r', encoding='UTF-8') as backup:
+            ...     kv2engine.import_(stream=backup, checkpoint='backup.checkpoint', max_workers=16)
+        """
+        done, progress = set(), {}
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint, 'r', encoding='UTF-8') as checkpoint_file:
+                for line in checkpoint_file:
+                    line = line.rstrip('\n')
+                    fields = line.rsplit('\t', 2)
+                    if len(fields) == 3 and fields[1].isdigit() and fields[2].isdigit():
+                        # the version of the record that was being written: path, index of the version, cas of the write
+                        progress[fields[0]] = (int(fields[1]), int(fields[2]))
+                    elif line.strip():
+                        done.add(line)
+        results = {'imported': 0, 'skipped': 0, 'failed': {}}
+
+        def records() -> Iterator[dict]:
+            for number, line in enumerate(stream, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    if not isinstance(record.get('path'), str) or not isinstance(record.get('data', record.get('versions')), (dict, list)):
+                        raise ValueError('the record must contain the path and the data or the versions')
+                except (ValueError, AttributeError) as error:
+                    results['failed'][f"line {number}"] = error
+                    continue
+                if record['path'] in done:
+                    results['skipped'] += 1
+                    continue
+                yield record
+
+        if dry_run:
+            for record in records():
+                results['imported'] += 1
+            log.info('[VaultClient] dry run: %s secrets would be imported to %s, %s skipped', results['imported'], self.mount_point, results['skipped'])
+            return results
+
+        checkpoint_file = open(checkpoint, 'a', encoding='UTF-8') if checkpoint else None  # pylint: disable=consider-using-with
+        checkpoint_lock = threading.Lock()
+
+        def journal(line: str) -> None:
+            if checkpoint_file is not None:
+                with checkpoint_lock:
+                    checkpoint_file.write(line + '\n')
+                    checkpoint_file.flush()
+
+        def import_record(record: dict) -> None:
+            self._import_record(record=record, progress=progress.get(record['path']), journal=journal)
+
+        try:
+            for record, future in self._map_bounded(import_record, records(), max_workers):
+                try:
+                    future.result()
+                except Exception as error:  # pylint: disable=broad-exception-caught
+                    log.error('[VaultClient] failed to import the secret %s: %s', record['path'], error)
+                    results['failed'][record['path']] = error
+                    continue
+                results['imported'] += 1
+                journal(record['path'])
+        finally:
+            if checkpoint_file is not None:
+                checkpoint_file.close()
+        log.info('[VaultClient] imported %s secrets to %s, %s skipped, %s failed', results['imported'], self.mount_point, results['skipped'], len(results['failed']))
+        return results
+
+    def _import_record(self, record: dict = None, progress: tuple = None, journal: callable = None) -> None:
+        """
+        A method for writing the export record to the engine.
+
+        Args:
+            :param record (dict): the record created by export().
+            :param progress (tuple): the index of the version and the cas of the last write noted in the checkpoint.
+            :param journal (callable): the function that notes the write in the checkpoint before it is sent.
+
+        Returns:
+            None
+        """
+        path = record['path']
+        if 'versions' in record:
+            versions = [version['data'] for version in record['versions'] if not version.get('deleted') and version.get('data') is not None]
+        else:
+            versions = [record['data']]
+        written, current = self._resume_point(path=path, versions=versions, progress=progress)
+        for data in versions[written:]:
+            if journal is not None:
+                journal(f"{path}\t{written}\t{current}")
+            current = self._put_secret(path=path, data=data, cas=current)
+            written += 1
+        custom_metadata = (record.get('metadata') or {}).get('custom_metadata')
+        if custom_metadata:
+            self._update_custom_metadata(path=path, custom_metadata=custom_metadata)
+
+    @reauthenticate_on_forbidden
+    def _resume_point(self, path: str = None, versions: list = None, progress: tuple = None) -> tuple:
+        """
+        A method for finding the first version of the record that has not been written yet.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+            :param versions (list): the data of the versions of the record.
+            :param progress (tuple): the index of the version and the cas of the last write noted in the checkpoint.
+
+        Returns:
+            (tuple) the index of the first version to write and the current version of the secret
+        """
+        written, cas = progress or (0, None)
+        current = self._current_version(path=path)
+        # the last noted write has reached the vault before the import was interrupted
+        if cas is not None and current == cas + 1 and written < len(versions) and self._has_version(path=path, version=current, data=versions[written]):
+            written += 1
+        return written, current
+
+    @reauthenticate_on_forbidden
+    def _put_secret(self, path: str = None, data: dict = None, cas: int = None) -> int:
+        """
+        A method for replacing the whole secret with the data as the next version.
+        The write is checked against the current version, so a request retried after it has been written is rejected
+        by the vault and recognized by the data of the next version instead of creating a duplicate.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+            :param data (dict): the secret data.
+            :param cas (int): the current version of the secret (0 if it doesn't exist).
+
+        Returns:
+            (int) the version that has been written
+        """
+        try:
+            self.client.secrets.kv.v2.create_or_update_secret(path=path, secret=data, cas=cas, mount_point=self.mount_point)
+        except hvac.exceptions.InvalidRequest as invalid_request:
+            if not is_cas_mismatch(invalid_request) or not self._has_version(path=path, version=cas + 1, data=data):
+                raise
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate(path)
+        return cas + 1
+
+    def _has_version(self, path: str = None, version: int = None, data: dict = None) -> bool:
+        """Checks if the version of the secret exists and contains the data"""
+        try:
+            response = self.client.secrets.kv.v2.read_secret_version(path=path, version=version, mount_point=self.mount_point, raise_on_deleted_version=True)
+        except hvac.exceptions.InvalidPath:
+            return False
+        return response['data']['data'] == data
+
+    @reauthenticate_on_forbidden
+    def _update_custom_metadata(self, path: str = None, custom_metadata: dict = None) -> object:
+        """
+        A method for setting the custom metadata of the secret.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+            :param custom_metadata (dict): the custom metadata.
+
+        Returns:
+            (object) https://www.w3schools.com/python/ref_requests_response.asp
+        """
+        return self.client.adapter.post(
+            url=utils.format_url('/v1/{mount_point}/metadata/{path}', mount_point=self.mount_point, path=path),
+            json={'custom_metadata': custom_metadata}
+        )
+
+    @staticmethod
+    def _map_bounded(function: callable, items: Iterator, max_workers: int) -> Iterator[tuple]:
+        """
+        A method for calling the function for the items concurrently while keeping only a bounded number of calls in flight.
+
+        Args:
+            :param function (callable): the function called with every item.
+            :param items (Iterator): the items, consumed lazily.
+            :param max_workers (int): maximum number of concurrent calls.
+
+        Returns:
+            (Iterator) (item, future) in the order of completion
+        """
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='vault-batch')
+        running = {}
+        try:
+            for item in items:
+                running[executor.submit(function, item)] = item
+                if len(running) >= max_workers * 2:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield running.pop(future), future
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield running.pop(future), future
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def watch(
+        self,
+        paths: list = None,
+        callback: callable = None,
+        prefix: str = None,
+        interval: float = 30,
+        max_interval: float = 300,
+        versions: dict = None
+    ) -> Watcher:
+        """
+        A method for watching the secrets for changes.
+        Only the metadata of the secrets is polled, the secret is read when its version has changed
+        and the callback is called with the previous and the new data. All watched paths are served by one background thread.
+
+        Args:
+            :param paths (list): the paths to the secrets in vault.
+            :param callback (callable): callback(path, old_data, new_data) called when the secret changes,
+                old_data is None for a new secret and new_data is None for a deleted secret.
+            :param prefix (str): watch all secrets whose paths start with the prefix, including the secrets created later.
+            :param interval (float): polling interval in seconds.
+            :param max_interval (float): maximum polling interval in seconds, the interval is increased while the secrets do not change.
+            :param versions (dict): the versions of the paths already known to the caller {'path': 3 or None if it does not exist},
+                a change between the read of the caller and the first poll is reported to the callback with old_data None.
+
+        Returns:
+            (Watcher) the watcher of the engine
+
+        Examples:
+            >>> watcher = kv2engine.watch(paths=['configuration/db'], callback=lambda path, old, new: pool.reconnect(new))
+            >>> kv2engine.watch(prefix='configuration/features/', callback=on_feature_change, interval=10, max_interval=60)
+            >>> watcher.unwatch(paths=['configuration/db'])
+        """
+        with self._watcher_lock:
+            if self._watcher is None:
+                self._watcher = Watcher(kv2engine=self, **self.watcher_configuration)
+        return self._watcher.watch(paths=paths, callback=callback, prefix=prefix, interval=interval, max_interval=max_interval, versions=versions)
+
+    def after_fork(self) -> None:
+        """
+        A method for resetting the state of the engine inherited from the parent process in the child process.
+
+        Returns:
+            None
+        """
+        self.singleflight.after_fork()
+        self.version_cache.after_fork()
+        if self.cache is not None:
+            self.cache.after_fork()
+        self._watcher_lock = threading.Lock()
+        if self._watcher is not None:
+            self._watcher.after_fork()
+
+    def close(self) -> None:
+        """
+        A method for stopping the background watcher of the engine.
+
+        Returns:
+            None
+        """
+        with self._watcher_lock:
+            watcher, self._watcher = self._watcher, None
+        if watcher is not None:
+            watcher.stop()
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def delete_tree(
+        self,
+        prefix: str = None,
+        max_workers: int = 8,
+        rate: float = None,
+        burst: int = None,
+        dry_run: bool = False
+    ) -> dict:
+        """
+        A method for deleting all versions and the metadata of the secrets under the prefix.
+        The paths are streamed from walk() and deleted concurrently while the tree is still being listed,
+        the deletions can be limited to a number of requests per second.
+
+        Args:
+            :param prefix (str): delete the secrets whose paths start with the prefix, for example 'environments/pr-123/'.
+            :param max_workers (int): maximum number of concurrent requests.
+            :param rate (float): maximum number of delete requests per second (unlimited by default).
+            :param burst (int): maximum number of delete requests sent at once when the rate is limited (default max(1, rate)).
+            :param dry_run (bool): only list the secrets that would be deleted.
+
+        Returns:
+            (dict) {'deleted': ['path1', 'path2'], 'failed': {'path3': Exception()}}
+                with dry_run the deleted list contains the paths that would be deleted
+
+        Examples:
+            >>> results = kv2engine.delete_tree(prefix='environments/pr-123/', max_workers=16, rate=50)
+            >>> kv2engine.delete_tree(prefix='environments/pr-123/', dry_run=True)['deleted']
+        """
+        if not prefix:
+            raise ValueError('the prefix is required, the whole engine is never deleted implicitly')
+        directory = prefix.rsplit('/', 1)[0] if '/' in prefix else ''
+        results = {'deleted': [], 'failed': {}}
+        paths = self.walk(path=directory, prefix=prefix, max_workers=min(max_workers, 4))
+        if dry_run:
+            results['deleted'] = list(paths)
+            log.info('[VaultClient] dry run: %s secrets would be deleted from %s/%s', len(results['deleted']), self.mount_point, prefix)
+            return results
+        limiter = RateLimiter(rate=rate, burst=burst) if rate else None
+
+        def delete(path: str) -> None:
+            if limiter is not None:
+                limiter.acquire()
+            self._delete_metadata(path=path)
+
+        for path, future in self._map_bounded(delete, paths, max_workers):
+            try:
+                future.result()
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                log.error('[VaultClient] failed to delete the secret %s: %s', path, error)
+                results['failed'][path] = error
+                continue
+            results['deleted'].append(path)
+        log.info('[VaultClient] deleted %s secrets from %s/%s, %s failed', len(results['deleted']), self.mount_point, prefix, len(results['failed']))
+        return results
+
+    @reauthenticate_on_forbidden
+    def _delete_metadata(self, path: str = None) -> object:
+        """
+        A method for deleting all versions and the metadata of the secret, the errors are raised to the caller.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+
+        Returns:
+            (object) https://www.w3schools.com/python/ref_requests_response.asp
+        """
+        try:
+            return self.client.secrets.kv.v2.delete_metadata_and_all_versions(path=path, mount_point=self.mount_point)
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate(path)
+            self.version_cache.invalidate(path)
+
     @reauthenticate_on_forbidden
     def delete_secret(self, path: str = None) -> bool:
         """
@@ -172,11 +1225,10 @@ class KV2Engine:
                 path=path,
                 mount_point=self.mount_point
             )
-            if response.status_code == 204:
-                log.info('[VaultClient] the secret %s has been deleted: %s', path, response)
-                return True
-            log.error("[VaultClient] failed to delete secret %s: %s", path, response)
-            return False
+            return deletion_result(path=path, response=response)
         except hvac.exceptions.InvalidPath as invalid_path:
-            log.error('[VaultClient] it looks like the path %s does not exist: %s', path, invalid_path)
-            return False
+            return deletion_result(path=path, error=invalid_path)
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate(path)
+            self.version_cache.invalidate(path)
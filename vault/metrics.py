@@ -0,0 +1,316 @@
+"""This module contains the metrics registry and the tracing hooks of the Vault clients and engines"""
+import os
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    Cumulative histogram of the observed values.
+
+    Attributes:
+        buckets (tuple): upper bounds of the buckets.
+        counts (list): number of observations in every bucket (not cumulative).
+        count (int): number of observations.
+        sum (float): sum of the observed values.
+    """
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """Adds the value to the histogram"""
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> list:
+        """Returns the cumulative counts of the buckets [(upper bound, count), ..., ('+Inf', count)]"""
+        result, total = [], 0
+        for bound, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+def _escape(value: object) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+# pylint: disable=too-many-instance-attributes
+class MetricsRegistry:
+    """
+    This class is responsible for collecting the metrics of the vault calls.
+    Features:
+        - latency histograms per engine method
+        - request, error, authentication and re-authentication counters
+        - bytes sent to and received from the vault server
+        - collectors for the cache and connection pool stats
+        - OpenTelemetry-style span hooks
+        - Prometheus text exposition format
+    """
+    def __init__(self, prefix: str = 'vault', buckets: tuple = DEFAULT_BUCKETS) -> None:
+        """
+        A method for creating an instance of the metrics registry.
+
+        Args:
+            :param prefix (str): prefix of the metric names.
+            :param buckets (tuple): upper bounds of the latency histogram buckets in seconds.
+
+        Returns:
+            None
+
+        Examples:
+            >>> from vault import MetricsRegistry, VaultClient
+            >>> metrics = MetricsRegistry()
+            >>> metrics.add_span_hook(lambda name, attributes: tracer.start_as_current_span(name, attributes=attributes))
+            >>> client = VaultClient(url='http://vault:8200', namespace='app', metrics=metrics)
+            >>> metrics.export_prometheus()
+        """
+        self.prefix = prefix
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = {}
+        self._span_hooks = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """
+        A method for incrementing the counter.
+
+        Args:
+            :param name (str): name of the counter without the prefix.
+            :param value (float): increment.
+
+        Keyword Args:
+            Labels of the counter.
+
+        Returns:
+            None
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """
+        A method for adding the value to the histogram.
+
+        Args:
+            :param name (str): name of the histogram without the prefix.
+            :param value (float): observed value.
+
+        Keyword Args:
+            Labels of the histogram.
+
+        Returns:
+            None
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets=self.buckets)
+            histogram.observe(value)
+
+    def add_collector(self, name: str, collector: callable, label: str = None) -> None:
+        """
+        A method for registering a function whose values are exported as gauges.
+
+        Args:
+            :param name (str): name of the collector, used as a part of the gauge names.
+            :param collector (callable): returns {'gauge': value} or {'label value': {'gauge': value}} if the label is set.
+            :param label (str): name of the label for the keys of the nested dictionaries.
+
+        Returns:
+            None
+
+        Examples:
+            >>> metrics.add_collector('pool', transport.stats, label='host')
+            # vault_pool_in_use{host="http://vault:8200"} 2
+        """
+        with self._lock:
+            self._collectors[(name, collector)] = label
+
+    def remove_collector(self, name: str, collector: callable) -> None:
+        """
+        A method for unregistering the collector.
+
+        Args:
+            :param name (str): name of the collector.
+            :param collector (callable): the registered function.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._collectors.pop((name, collector), None)
+
+    def add_span_hook(self, hook: callable) -> None:
+        """
+        A method for registering the tracing hook.
+        The hook is called with the name of the span and its attributes and has to return a context manager,
+        for example tracer.start_as_current_span of OpenTelemetry.
+
+        Args:
+            :param hook (callable): hook(name, attributes) -> context manager.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._span_hooks.append(hook)
+
+    @contextmanager
+    def measure(self, name: str, namespace: str = None):
+        """
+        A context manager for measuring the call of the engine method: latency, requests, errors and spans.
+
+        Args:
+            :param name (str): name of the method, for example KV2Engine.read_secret.
+            :param namespace (str): namespace of the vault client.
+
+        Returns:
+            None
+        """
+        with ExitStack() as spans:
+            for hook in self._span_hooks:
+                spans.enter_context(hook(name, {'vault.method': name, 'vault.namespace': namespace}))
+            started = time.perf_counter()
+            try:
+                yield
+            except Exception as error:
+                self.inc('errors_total', method=name, error=type(error).__name__)
+                raise
+            finally:
+                self.observe('request_duration_seconds', time.perf_counter() - started, method=name)
+                self.inc('requests_total', method=name)
+
+    def record_bytes(self, sent: int = 0, received: int = 0) -> None:
+        """
+        A method for counting the bytes transferred to and from the vault server.
+
+        Args:
+            :param sent (int): size of the request body.
+            :param received (int): size of the response body.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            for name, value in (('bytes_sent_total', sent), ('bytes_received_total', received)):
+                key = (name, ())
+                self._counters[key] = self._counters.get(key, 0) + value
+
+    def record_response(self, response: object, *_, **__) -> object:
+        """
+        The response hook of the requests session for counting the transferred bytes.
+
+        Args:
+            :param response (requests.Response): the response of the vault server.
+
+        Returns:
+            (requests.Response) the same response
+        """
+        body = response.request.body if response.request is not None else None
+        self.record_bytes(sent=len(body) if body else 0, received=len(response.content or b''))
+        return response
+
+    def snapshot(self) -> dict:
+        """
+        A method for getting the current values of the metrics.
+
+        Returns:
+            (dict) {
+                'counters': {('requests_total', (('method', 'KV2Engine.read_secret'),)): 10},
+                'histograms': {('request_duration_seconds', (('method', 'KV2Engine.read_secret'),)): {'count': 10, 'sum': 0.1, 'buckets': [...]}},
+                'gauges': {('cache_hits', ()): 8}
+            }
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {
+                key: {'count': histogram.count, 'sum': histogram.sum, 'buckets': histogram.cumulative()}
+                for key, histogram in self._histograms.items()
+            }
+            collectors = list(self._collectors.items())
+        gauges = {}
+        for (name, collector), label in collectors:
+            values = collector()
+            if label is None:
+                values = {None: values}
+            for label_value, stats in values.items():
+                labels = ((label, label_value),) if label is not None else ()
+                for gauge, value in stats.items():
+                    gauges[(f"{name}_{gauge}", labels)] = value
+        return {'counters': counters, 'histograms': histograms, 'gauges': gauges}
+
+    def export_prometheus(self) -> str:
+        """
+        A method for exporting the metrics in the Prometheus text exposition format.
+
+        Returns:
+            (str) the metrics
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for kind, metrics in (('counter', snapshot['counters']), ('gauge', snapshot['gauges'])):
+            declared = set()
+            for (name, labels), value in sorted(metrics.items()):
+                if name not in declared:
+                    lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+                    declared.add(name)
+                lines.append(f"{self.prefix}_{name}{_labels(labels)} {value}")
+        declared = set()
+        for (name, labels), histogram in sorted(snapshot['histograms'].items()):
+            if name not in declared:
+                lines.append(f"# TYPE {self.prefix}_{name} histogram")
+                declared.add(name)
+            for bound, count in histogram['buckets']:
+                lines.append(f"{self.prefix}_{name}_bucket{_labels(labels + (('le', bound),))} {count}")
+            lines.append(f"{self.prefix}_{name}_sum{_labels(labels)} {histogram['sum']}")
+            lines.append(f"{self.prefix}_{name}_count{_labels(labels)} {histogram['count']}")
+        return '\n'.join(lines) + '\n'
+
+    def after_fork(self) -> None:
+        """
+        A method for resetting the lock and the values in the child process, so every process reports only its own calls.
+
+        Returns:
+            None
+        """
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        A method for resetting the counters and histograms.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
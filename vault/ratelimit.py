@@ -0,0 +1,51 @@
+"""This module contains the rate limiter of the bulk operations against the Vault Server"""
+import threading
+import time
+
+
+# pylint: disable=too-few-public-methods
+class RateLimiter:
+    """
+    This class is responsible for limiting the number of requests per second with a token bucket.
+    Up to burst requests are allowed at once, after that the callers are spaced out by 1/rate seconds.
+    Every caller reserves its slot under the lock and sleeps outside of it, so the waiting threads are served in order.
+    """
+    def __init__(self, rate: float = 10, burst: int = None) -> None:
+        """
+        A method for creating an instance of the rate limiter.
+
+        Args:
+            :param rate (float): maximum number of requests per second.
+            :param burst (int): maximum number of requests allowed at once (default max(1, rate)).
+
+        Returns:
+            None
+
+        Examples:
+            >>> limiter = RateLimiter(rate=50)
+            >>> limiter.acquire()
+            0.0
+        """
+        if rate <= 0:
+            raise ValueError('the rate must be greater than 0')
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        A method for waiting for the slot of the next request.
+
+        Returns:
+            (float) the time in seconds the caller has waited
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate) - 1
+            self._updated = now
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if delay:
+            time.sleep(delay)
+        return delay
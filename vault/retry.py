@@ -0,0 +1,347 @@
+"""This module contains the retry policy and the circuit breaker for the transient errors of the Vault Server"""
+import asyncio
+import os
+import random
+import threading
+import time
+
+import hvac.exceptions
+import requests
+import urllib3
+
+from logger import log
+from .exceptions import CircuitOpenError
+
+try:
+    import httpx
+    CONNECTION_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout, ConnectionError, httpx.TransportError)
+    CONNECT_ERRORS = (requests.exceptions.ConnectTimeout, ConnectionRefusedError, httpx.ConnectError, httpx.ConnectTimeout)
+except ImportError:
+    CONNECTION_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout, ConnectionError)
+    CONNECT_ERRORS = (requests.exceptions.ConnectTimeout, ConnectionRefusedError)
+
+
+STATUS_CODES = {
+    hvac.exceptions.RateLimitExceeded: 429,
+    hvac.exceptions.InternalServerError: 500,
+    hvac.exceptions.VaultNotInitialized: 501,
+    hvac.exceptions.BadGateway: 502,
+    hvac.exceptions.VaultDown: 503
+}
+
+# the vault server rejects these requests without executing them
+NOT_EXECUTED_STATUS_CODES = (429, 503)
+
+
+def unreachable(error: Exception) -> bool:
+    """Returns True if the connection to the vault server has not been established, so the request has not been sent"""
+    if isinstance(error, CONNECT_ERRORS):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, urllib3.exceptions.ConnectTimeoutError)
+
+
+def is_transient(error: Exception, retry_on: tuple = (429, 500, 502, 503), idempotent: bool = True) -> bool:
+    """
+    A function for checking if the error is caused by a temporary unavailability of the vault server.
+    For the requests that are not idempotent only the errors raised before the request has been executed are transient:
+    an open circuit, connection errors, rate limiting (429) and a sealed or standby vault (503).
+
+    Args:
+        :param error (Exception): the raised exception.
+        :param retry_on (tuple): the HTTP status codes considered transient.
+        :param idempotent (bool): the request can be repeated without side effects.
+
+    Returns:
+        (bool) True for connection errors, timeouts, an open circuit and the listed status codes
+    """
+    if isinstance(error, CircuitOpenError):
+        return True
+    if not idempotent:
+        return unreachable(error) or STATUS_CODES.get(type(error)) in set(retry_on) & set(NOT_EXECUTED_STATUS_CODES)
+    if isinstance(error, CONNECTION_ERRORS):
+        return True
+    return STATUS_CODES.get(type(error)) in retry_on
+
+
+class CircuitBreaker:
+    """
+    This class is responsible for failing fast while an endpoint of the vault server is unhealthy.
+    After failure_threshold consecutive transient errors the circuit of the endpoint is opened and the calls are rejected
+    with CircuitOpenError. After recovery_timeout a limited number of probe calls is allowed, the circuit is closed
+    on the first successful probe and opened again on a failed one.
+    """
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30, half_open_calls: int = 1) -> None:
+        """
+        A method for creating an instance of the circuit breaker.
+
+        Args:
+            :param failure_threshold (int): number of consecutive transient errors that opens the circuit.
+            :param recovery_timeout (float): time in seconds after which the probe calls are allowed.
+            :param half_open_calls (int): number of concurrent probe calls while the circuit is half-open.
+
+        Returns:
+            None
+
+        Examples:
+            >>> breaker = CircuitBreaker(failure_threshold=5, recovery_timeout=30)
+            >>> client = VaultClient(url='http://vault:8200', namespace='app', circuit_breaker=breaker)
+            >>> breaker.state('KV2Engine.read_secret')
+            'closed'
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_calls = half_open_calls
+        self._circuits = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def after_fork(self) -> None:
+        """
+        A method for resetting the lock in the child process, the states of the circuits are kept.
+
+        Returns:
+            None
+        """
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._lock = threading.Lock()
+
+    def state(self, endpoint: str) -> str:
+        """
+        A method for getting the state of the circuit.
+
+        Args:
+            :param endpoint (str): the name of the endpoint, for example KV2Engine.read_secret.
+
+        Returns:
+            (str) 'closed', 'open' or 'half-open'
+        """
+        with self._lock:
+            return self._circuits.get(endpoint, {}).get('state', 'closed')
+
+    def before(self, endpoint: str) -> None:
+        """
+        A method for checking that the call to the endpoint is allowed.
+
+        Args:
+            :param endpoint (str): the name of the endpoint.
+
+        Returns:
+            None
+
+        Raises:
+            CircuitOpenError: the circuit of the endpoint is open.
+        """
+        with self._lock:
+            circuit = self._circuits.get(endpoint)
+            if circuit is None or circuit['state'] == 'closed':
+                return
+            remaining = circuit['opened_at'] + self.recovery_timeout - time.monotonic()
+            if circuit['state'] == 'open' and remaining <= 0:
+                circuit['state'], circuit['probes'] = 'half-open', 0
+            if circuit['state'] == 'half-open' and circuit['probes'] < self.half_open_calls:
+                circuit['probes'] += 1
+                return
+        raise CircuitOpenError(endpoint=endpoint, retry_in=max(remaining, 0))
+
+    def success(self, endpoint: str) -> None:
+        """
+        A method for recording the successful call, the circuit is closed.
+
+        Args:
+            :param endpoint (str): the name of the endpoint.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            circuit = self._circuits.pop(endpoint, None)
+        if circuit is not None and circuit['state'] != 'closed':
+            log.info('[VaultClient]: the circuit of %s has been closed', endpoint)
+
+    def failure(self, endpoint: str) -> None:
+        """
+        A method for recording the transient error of the call, the circuit is opened when the threshold is reached.
+
+        Args:
+            :param endpoint (str): the name of the endpoint.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            circuit = self._circuits.setdefault(endpoint, {'state': 'closed', 'failures': 0, 'opened_at': 0.0, 'probes': 0})
+            circuit['failures'] += 1
+            if circuit['state'] == 'half-open' or circuit['failures'] >= self.failure_threshold:
+                if circuit['state'] != 'open':
+                    log.warning('[VaultClient]: the circuit of %s has been opened after %s failures', endpoint, circuit['failures'])
+                circuit['state'], circuit['opened_at'] = 'open', time.monotonic()
+
+
+class RetryPolicy:
+    """
+    This class is responsible for retrying the calls that have failed with transient errors:
+    429, 5xx, sealed or standby vault, connection errors and timeouts.
+    The delays grow exponentially and are randomized (full jitter) so that the clients do not retry at the same time.
+    """
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        backoff: float = 0.1,
+        max_backoff: float = 5,
+        jitter: bool = True,
+        retry_on: tuple = (429, 500, 502, 503),
+        deadline: float = None
+    ) -> None:
+        """
+        A method for creating an instance of the retry policy.
+
+        Args:
+            :param max_attempts (int): maximum number of attempts including the first one.
+            :param backoff (float): delay in seconds before the first retry, doubled for every next retry.
+            :param max_backoff (float): maximum delay in seconds between the attempts.
+            :param jitter (bool): randomize the delays between 0 and the exponential delay.
+            :param retry_on (tuple): HTTP status codes to retry (429, 500, 501, 502, 503 are recognized).
+            :param deadline (float): maximum time in seconds for all attempts of the call.
+
+        Returns:
+            None
+
+        Examples:
+            >>> policy = RetryPolicy(max_attempts=5, backoff=0.2, max_backoff=10, deadline=30)
+            >>> client = VaultClient(url='http://vault:8200', namespace='app', retry=policy)
+        """
+        self.max_attempts = max(max_attempts, 1)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.retry_on = tuple(retry_on)
+        self.deadline = deadline
+
+    def delay(self, attempt: int) -> float:
+        """
+        A method for calculating the delay before the next attempt.
+
+        Args:
+            :param attempt (int): the number of the failed attempt starting from 1.
+
+        Returns:
+            (float) delay in seconds
+        """
+        delay = min(self.backoff * 2 ** (attempt - 1), self.max_backoff)
+        return random.uniform(0, delay) if self.jitter else delay
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def _next_delay(self, error: Exception, attempt: int, started: float, endpoint: str, breaker: CircuitBreaker, metrics: object, idempotent: bool) -> float | None:
+        """
+        A method for recording the failed attempt and getting the delay before the next one.
+
+        Returns:
+            (float) delay in seconds
+                or
+            None if the error has to be raised
+        """
+        transient = not isinstance(error, CircuitOpenError) and is_transient(error, self.retry_on)
+        if breaker is not None:
+            if transient:
+                breaker.failure(endpoint)
+            elif not isinstance(error, CircuitOpenError):
+                breaker.success(endpoint)
+        if not transient or attempt >= self.max_attempts:
+            return None
+        if not idempotent and not is_transient(error, self.retry_on, idempotent=False):
+            return None
+        delay = self.delay(attempt)
+        if self.deadline is not None and time.monotonic() - started + delay > self.deadline:
+            return None
+        log.warning('[VaultClient]: %s failed with a transient error, retrying in %.2fs (attempt %s/%s): %s', endpoint, delay, attempt, self.max_attempts, error)
+        if metrics is not None:
+            metrics.inc('retries_total', method=endpoint)
+        return delay
+
+    def run(self, function: callable, endpoint: str = None, breaker: CircuitBreaker = None, metrics: object = None, idempotent: bool = True) -> object:
+        """
+        A method for calling the function with retries.
+
+        Args:
+            :param function (callable): the function without arguments.
+            :param endpoint (str): the name of the endpoint for the circuit breaker and the logs.
+            :param breaker (CircuitBreaker): the circuit breaker of the endpoints.
+            :param metrics (MetricsRegistry): the registry for the retry counter.
+            :param idempotent (bool): the call can be repeated without side effects, otherwise it is retried only if it has not been executed.
+
+        Returns:
+            (object) the result of the function
+        """
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                if breaker is not None:
+                    breaker.before(endpoint)
+                result = function()
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                delay = self._next_delay(error, attempt, started, endpoint, breaker, metrics, idempotent)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            if breaker is not None:
+                breaker.success(endpoint)
+            return result
+
+    async def run_async(self, function: callable, endpoint: str = None, breaker: CircuitBreaker = None, metrics: object = None, idempotent: bool = True) -> object:
+        """
+        A method for awaiting the coroutine function with retries.
+
+        Args:
+            :param function (callable): the coroutine function without arguments.
+            :param endpoint (str): the name of the endpoint for the circuit breaker and the logs.
+            :param breaker (CircuitBreaker): the circuit breaker of the endpoints.
+            :param metrics (MetricsRegistry): the registry for the retry counter.
+            :param idempotent (bool): the call can be repeated without side effects, otherwise it is retried only if it has not been executed.
+
+        Returns:
+            (object) the result of the coroutine
+        """
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                if breaker is not None:
+                    breaker.before(endpoint)
+                result = await function()
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                delay = self._next_delay(error, attempt, started, endpoint, breaker, metrics, idempotent)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            if breaker is not None:
+                breaker.success(endpoint)
+            return result
+
+
+def resilience(configuration: dict) -> tuple:
+    """
+    A function for creating the retry policy and the circuit breaker from the configuration of the client.
+
+    Args:
+        :param configuration (dict): the keyword arguments of the client with the 'retry' and 'circuit_breaker' keys.
+
+    Returns:
+        (tuple) RetryPolicy or None, CircuitBreaker or None
+    """
+    retry = configuration.get('retry')
+    breaker = configuration.get('circuit_breaker')
+    if isinstance(retry, dict) or retry is True:
+        retry = RetryPolicy(**(retry if isinstance(retry, dict) else {}))
+    if isinstance(breaker, dict) or breaker is True:
+        breaker = CircuitBreaker(**(breaker if isinstance(breaker, dict) else {}))
+    if breaker is not None and retry is None:
+        retry = RetryPolicy(max_attempts=1)
+    return retry or None, breaker or None
@@ -0,0 +1,471 @@
+"""This module contains the cache of the secrets shared by the processes of one host through a memory-mapped file"""
+import base64
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from logger import log
+from .cache import CacheEntry, SecretCache
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    DECODE_ERRORS = (ValueError, InvalidTag)
+except ImportError:
+    AESGCM = None
+    DECODE_ERRORS = (ValueError,)
+
+
+# the header of the file: magic, number of slots, size of the slot
+MAGIC = b'VLTCACH1'
+HEADER = struct.Struct('<8sII')
+HEADER_SIZE = 64
+# the header of the slot: hash of the path, expiration (wall clock), version, state, length of the payload
+SLOT = struct.Struct('<QdqBI')
+SLOT_HEADER_SIZE = 32
+EMPTY, DATA, MISSING = 0, 1, 2
+# number of consecutive slots where the path can be stored
+PROBES = 4
+NONCE_SIZE = 12
+
+_FILE_LOCKS = {}
+_FILE_LOCKS_GUARD = threading.Lock()
+
+
+def _reset_file_locks() -> None:
+    """Replaces the locks inherited from the parent process, they may have been held by its threads"""
+    global _FILE_LOCKS_GUARD  # pylint: disable=global-statement
+    _FILE_LOCKS_GUARD = threading.Lock()
+    _FILE_LOCKS.clear()
+
+
+os.register_at_fork(after_in_child=_reset_file_locks)
+
+
+def _file_lock(file: str, offset: int = None) -> threading.RLock:
+    """
+    Returns the lock of the threads of the current process for the file or for the byte of the file at the offset.
+    The fcntl locks belong to the process, so the threads of one process are serialized separately.
+    """
+    with _FILE_LOCKS_GUARD:
+        return _FILE_LOCKS.setdefault((os.path.realpath(file), offset), threading.RLock())
+
+
+# pylint: disable=too-many-instance-attributes
+class SharedSecretCache(SecretCache):
+    """
+    This class is responsible for caching the secrets in a memory-mapped file shared by the worker processes of one host
+    (for example, the workers of a pre-fork server), so every secret is stored once and read from vault by one worker.
+    Features:
+        - the ttl of the entries is shared: the expiration is stored in wall clock time
+        - only one process refreshes an expired entry, the others wait for it and use the refreshed entry
+        - the entries are encrypted with AES-GCM, the file contains no plaintext secrets
+        - the file is created with the 0600 mode and is rejected if it is owned by another user
+    The file has a fixed number of slots, the path is stored in one of several consecutive slots chosen by the hash of the path
+    and the entry that expires first is evicted when all of them are used. The secrets larger than the slot are not cached.
+    """
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(
+        self,
+        file: str = None,
+        key: str | bytes = None,
+        encrypt: bool = True,
+        slot_size: int = 4096,
+        name: str = 'default',
+        **kwargs
+    ) -> None:
+        """
+        A method for creating an instance of the shared secrets cache.
+
+        Args:
+            :param file (str): path to the cache file, by default a file in /dev/shm (or the temporary directory) derived from the name.
+            :param key (str | bytes): the AES key of 16, 24 or 32 bytes or its urlsafe base64 encoding (VAULT_CACHE_KEY by default).
+            :param encrypt (bool): encrypt the entries, requires the cryptography module (the 'crypto' extra).
+            :param slot_size (int): size of the slot in bytes, limits the size of the cached secret.
+            :param name (str): the name of the default cache file, the processes with the same name share the file.
+
+        Keyword Args:
+            the arguments of SecretCache: ttl, max_size (number of slots), negative_ttl, path_ttl, serve_stale.
+
+        Returns:
+            None
+
+        Examples:
+            >>> from vault.shared_cache import SharedSecretCache
+            >>> key = SharedSecretCache.generate_key()
+            >>> cache = SharedSecretCache(file='/dev/shm/vault-app.cache', key=key, ttl=60, max_size=1024)
+        """
+        super().__init__(**kwargs)
+        if slot_size <= SLOT_HEADER_SIZE + NONCE_SIZE:
+            raise ValueError(f"the slot size must be greater than {SLOT_HEADER_SIZE + NONCE_SIZE} bytes")
+        self._cipher = self._create_cipher(key) if encrypt else None
+        if file is None:
+            directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+            file = os.path.join(directory, f"vault-cache-{os.getuid()}-{hashlib.sha256(name.encode()).hexdigest()[:16]}")
+        self.file = file
+        self._lock = _file_lock(file)
+        self._counters.update({'refresh_waits': 0, 'oversized': 0})
+        self._fd = os.open(file, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+        try:
+            self.slots, self.slot_size = self._initialize(slots=max(self.max_size, 1), slot_size=slot_size)
+            self._size = HEADER_SIZE + (self.slots + PROBES - 1) * self.slot_size
+            self._map = mmap.mmap(self._fd, self._size)
+        except BaseException:
+            os.close(self._fd)
+            raise
+
+    @staticmethod
+    def generate_key() -> str:
+        """
+        A method for generating a random key for the encryption of the cache.
+
+        Returns:
+            (str) urlsafe base64 encoded 32 bytes key
+        """
+        return base64.urlsafe_b64encode(os.urandom(32)).decode()
+
+    @staticmethod
+    def _create_cipher(key: str | bytes = None) -> object:
+        if AESGCM is None:
+            raise ImportError("The cryptography module is required for the encryption of the shared cache, install the package with the 'crypto' extra")
+        key = key or os.environ.get('VAULT_CACHE_KEY')
+        if not key:
+            raise ValueError("The encryption key of the shared cache is not specified, pass the key argument or set VAULT_CACHE_KEY")
+        return AESGCM(base64.urlsafe_b64decode(key) if isinstance(key, str) else key)
+
+    def _initialize(self, slots: int, slot_size: int) -> tuple:
+        """
+        A method for checking the owner of the file and writing the header if the file is new.
+        The layout of an existing file is kept, so all processes use the same slots.
+
+        Returns:
+            (tuple) number of slots, size of the slot
+        """
+        stat = os.fstat(self._fd)
+        if stat.st_uid != os.getuid() or stat.st_mode & 0o077:
+            raise PermissionError(f"The cache file {self.file} must be owned by the current user and not be accessible by other users")
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, HEADER_SIZE, 0)
+        try:
+            magic, existing_slots, existing_slot_size = HEADER.unpack(os.pread(self._fd, HEADER.size, 0).ljust(HEADER.size, b'\0'))
+            if magic == MAGIC:
+                if (existing_slots, existing_slot_size) != (slots, slot_size):
+                    log.warning(
+                        '[VaultClient]: the cache file %s has %s slots of %s bytes, the existing layout is used',
+                        self.file, existing_slots, existing_slot_size
+                    )
+                return existing_slots, existing_slot_size
+            os.ftruncate(self._fd, HEADER_SIZE + (slots + PROBES - 1) * slot_size)
+            os.pwrite(self._fd, HEADER.pack(MAGIC, slots, slot_size), 0)
+            return slots, slot_size
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, HEADER_SIZE, 0)
+
+    def _locate(self, path: str) -> tuple:
+        """Returns the hash of the path and the index of its first slot"""
+        key = int.from_bytes(hashlib.blake2b(path.encode(), digest_size=8).digest(), 'little')
+        return key, key % self.slots
+
+    def _offset(self, index: int) -> int:
+        return HEADER_SIZE + index * self.slot_size
+
+    @contextmanager
+    def _locked(self, first: int, exclusive: bool = False) -> Iterator[None]:
+        """Locks the slots of the path for the threads of this process and for the other processes"""
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH, PROBES * self.slot_size, self._offset(first))
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, PROBES * self.slot_size, self._offset(first))
+
+    def _encode(self, key: int, path: str, data: dict | None) -> bytes:
+        payload = json.dumps([path, data], separators=(',', ':')).encode()
+        if self._cipher is None:
+            return payload
+        # the hash of the path is authenticated, so an entry can not be moved to the slot of another path
+        nonce = os.urandom(NONCE_SIZE)
+        return nonce + self._cipher.encrypt(nonce, payload, key.to_bytes(8, 'little'))
+
+    def _decode(self, key: int, payload: bytes) -> list | None:
+        try:
+            if self._cipher is not None:
+                payload = self._cipher.decrypt(payload[:NONCE_SIZE], payload[NONCE_SIZE:], key.to_bytes(8, 'little'))
+            return json.loads(payload)
+        except DECODE_ERRORS as error:
+            log.warning('[VaultClient]: the entry of the cache file %s can not be decoded, it is ignored: %s', self.file, error.__class__.__name__)
+            return None
+
+    def _find(self, path: str, key: int, first: int) -> tuple | None:
+        """
+        A method for finding the entry of the path, the slots have to be locked.
+
+        Returns:
+            (tuple) index of the slot, CacheEntry
+                or
+            None
+        """
+        for index in range(first, first + PROBES):
+            offset = self._offset(index)
+            slot_key, expires_at, version, state, length = SLOT.unpack_from(self._map, offset)
+            if state == EMPTY or slot_key != key:
+                continue
+            record = self._decode(key, self._map[offset + SLOT_HEADER_SIZE:offset + SLOT_HEADER_SIZE + length])
+            if record is None or record[0] != path:
+                continue
+            # the expiration is converted to the monotonic clock of the process
+            return index, CacheEntry(
+                data=record[1] if state == DATA else None,
+                version=version if version >= 0 else None,
+                expires_at=time.monotonic() + expires_at - time.time()
+            )
+        return None
+
+    def _read(self, path: str) -> CacheEntry | None:
+        key, first = self._locate(path)
+        with self._locked(first):
+            found = self._find(path, key, first)
+        return found[1] if found is not None else None
+
+    def get(self, path: str) -> CacheEntry | None:
+        """
+        A method for getting a fresh entry from the shared cache.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+
+        Returns:
+            (CacheEntry) the entry if it exists and has not expired
+                or
+            None
+        """
+        entry = self._read(path)
+        with self._lock:
+            if entry is None or entry.expired():
+                self._counters['misses'] += 1
+                return None
+            self._counters['hits'] += 1
+            if entry.missing:
+                self._counters['negative_hits'] += 1
+            return entry
+
+    def get_stale(self, path: str) -> CacheEntry | None:
+        """
+        A method for getting an entry regardless of its ttl (used for revalidation).
+
+        Args:
+            :param path (str): the path to the secret in vault.
+
+        Returns:
+            (CacheEntry) the entry
+                or
+            None
+        """
+        return self._read(path)
+
+    def set(self, path: str, data: dict, version: int = None, generation: int = None) -> None:
+        """
+        A method for storing a secret in the shared cache.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+            :param data (dict): the secret data.
+            :param version (int): the version of the secret.
+            :param generation (int): the generation of the path before the secret was read, the secret is not stored if it has changed.
+
+        Returns:
+            None
+        """
+        self._write(path, data, version, self.ttl_for(path), generation)
+
+    def set_missing(self, path: str, generation: int = None) -> None:
+        """
+        A method for storing a negative entry for a path that does not exist.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+            :param generation (int): the generation of the path before the secret was read, the entry is not stored if it has changed.
+
+        Returns:
+            None
+        """
+        if self.negative_ttl:
+            self._write(path, None, None, self.negative_ttl, generation)
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def _write(self, path: str, data: dict | None, version: int | None, ttl: float, generation: int = None) -> None:
+        key, first = self._locate(path)
+        payload = self._encode(key, path, data)
+        if len(payload) > self.slot_size - SLOT_HEADER_SIZE:
+            log.debug('[VaultClient]: the secret %s is larger than the slot of the cache file %s and is not cached', path, self.file)
+            with self._lock:
+                self._counters['oversized'] += 1
+            self.invalidate(path)
+            return
+        with self._locked(first, exclusive=True):
+            # the generations are kept by the process, the writes of the other processes are not tracked
+            if not self._current(path, generation):
+                return
+            index, evicted = self._choose(key, first)
+            offset = self._offset(index)
+            self._map[offset + SLOT_HEADER_SIZE:offset + SLOT_HEADER_SIZE + len(payload)] = payload
+            SLOT.pack_into(
+                self._map, offset, key, time.time() + ttl,
+                version if version is not None else -1, DATA if data is not None else MISSING, len(payload)
+            )
+            if evicted:
+                self._counters['evictions'] += 1
+
+    def _choose(self, key: int, first: int) -> tuple:
+        """Returns the slot of the path, the first empty slot or the slot that expires first and True if it is evicted"""
+        empty, oldest, oldest_expires_at = None, None, None
+        for index in range(first, first + PROBES):
+            slot_key, expires_at, _, state, _ = SLOT.unpack_from(self._map, self._offset(index))
+            if state != EMPTY and slot_key == key:
+                return index, False
+            if state == EMPTY:
+                empty = index if empty is None else empty
+            elif oldest is None or expires_at < oldest_expires_at:
+                oldest, oldest_expires_at = index, expires_at
+        return (empty, False) if empty is not None else (oldest, True)
+
+    def revalidate(self, path: str, generation: int = None) -> CacheEntry | None:
+        """
+        A method for extending the shared ttl of an entry whose version has not changed.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+            :param generation (int): the generation of the path before the version was read, the entry is not extended if it has changed.
+
+        Returns:
+            (CacheEntry) the revalidated entry
+                or
+            None
+        """
+        key, first = self._locate(path)
+        ttl = self.ttl_for(path)
+        with self._locked(first, exclusive=True):
+            found = self._find(path, key, first) if self._current(path, generation) else None
+            if found is None:
+                return None
+            index, entry = found
+            SLOT.pack_into(
+                self._map, self._offset(index), key, time.time() + ttl,
+                entry.version if entry.version is not None else -1, DATA if not entry.missing else MISSING,
+                SLOT.unpack_from(self._map, self._offset(index))[4]
+            )
+            entry.expires_at = time.monotonic() + ttl
+            self._counters['revalidations'] += 1
+            return entry
+
+    def invalidate(self, path: str) -> None:
+        """
+        A method for removing a path from the shared cache.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+
+        Returns:
+            None
+        """
+        key, first = self._locate(path)
+        with self._locked(first, exclusive=True):
+            self._generations[path] = self._generations.get(path, 0) + 1
+            found = self._find(path, key, first)
+            if found is not None:
+                offset = self._offset(found[0])
+                self._map[offset:offset + SLOT_HEADER_SIZE] = bytes(SLOT_HEADER_SIZE)
+                self._counters['invalidations'] += 1
+
+    def clear(self) -> None:
+        """
+        A method for removing all entries from the shared cache.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, self._size - HEADER_SIZE, HEADER_SIZE)
+            try:
+                self._map[HEADER_SIZE:self._size] = bytes(self._size - HEADER_SIZE)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, self._size - HEADER_SIZE, HEADER_SIZE)
+
+    def after_fork(self) -> None:
+        """
+        A method for resetting the lock in the child process, the mapping of the file is inherited and stays shared.
+
+        Returns:
+            None
+        """
+        self._lock = _file_lock(self.file)
+
+    @contextmanager
+    def refreshing(self, path: str) -> Iterator[CacheEntry | None]:
+        """
+        A context manager that allows only one thread of the processes of the host to refresh the entry of the path.
+        The other threads and processes wait for the lock and receive the entry refreshed by the first one.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+
+        Yields:
+            (CacheEntry) the entry refreshed by another process while waiting
+                or
+            None if the caller has to refresh the entry
+        """
+        _, first = self._locate(path)
+        # the refresh locks are placed after the end of the file, so they do not block the reads
+        offset = self._size + first
+        # the fcntl lock is shared by the threads of the process, they wait for each other on the lock of the offset
+        lock = _file_lock(self.file, offset)
+        waited = not lock.acquire(blocking=False)
+        if waited:
+            with self._lock:
+                self._counters['refresh_waits'] += 1
+            lock.acquire()
+        try:
+            try:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, offset)
+            except OSError:
+                if not waited:
+                    waited = True
+                    with self._lock:
+                        self._counters['refresh_waits'] += 1
+                fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, offset)
+            try:
+                yield self.get(path) if waited else None
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, offset)
+        finally:
+            lock.release()
+
+    def stats(self) -> dict:
+        """
+        A method for getting the cache counters of the current process and the number of entries in the file.
+
+        Returns:
+            (dict) {'hits': 10, 'misses': 2, 'negative_hits': 0, 'revalidations': 1, 'evictions': 0, 'invalidations': 1,
+                    'refresh_waits': 1, 'oversized': 0, 'size': 2}
+        """
+        with self._lock:
+            size = sum(1 for index in range(self.slots + PROBES - 1) if self._map[self._offset(index) + 24] != EMPTY)
+            return {**self._counters, 'size': size}
+
+    def close(self) -> None:
+        """
+        A method for unmapping and closing the cache file, the file itself is kept for the other processes.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._map.close()
+            os.close(self._fd)
@@ -0,0 +1,135 @@
+"""This module contains the deduplication of the concurrent identical calls to the Vault Server"""
+import asyncio
+import threading
+
+
+# pylint: disable=too-few-public-methods
+class _Call:
+    """The call in flight: the waiters block on the event and receive the result or the error of the leader"""
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    This class is responsible for coalescing the concurrent calls with the same key into one call.
+    The first caller (the leader) performs the call, the callers that arrive while it is in flight wait for it
+    and receive the same result or the same exception. The next call after the completion is performed again,
+    so the results are never cached. Both threads (do) and asyncio tasks (do_async) are supported.
+    """
+    def __init__(self, enabled: bool = True) -> None:
+        """
+        A method for creating an instance of the single-flight group.
+
+        Args:
+            :param enabled (bool): if False every call is performed without coalescing.
+
+        Returns:
+            None
+
+        Examples:
+            >>> group = SingleFlight()
+            >>> secret = group.do(('read_secret', 'app', 'configuration/db'), lambda: read('configuration/db'))
+        """
+        self.enabled = enabled
+        self._calls = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self._counters = {'calls': 0, 'shared': 0}
+
+    def do(self, key: tuple, function: callable) -> object:
+        """
+        A method for performing the call once for all threads that request the same key at the same time.
+
+        Args:
+            :param key (tuple): the key of the call, for example (method, mount point, path).
+            :param function (callable): the function without arguments.
+
+        Returns:
+            (object) the result of the function, shared by all waiters
+        """
+        if not self.enabled:
+            return function()
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._counters['calls'] += 1
+            else:
+                self._counters['shared'] += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = function()
+            return call.result
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    async def do_async(self, key: tuple, function: callable) -> object:
+        """
+        A method for awaiting the coroutine once for all tasks of the event loop that request the same key at the same time.
+        The call runs in its own task, so the cancellation of one waiter does not cancel it for the others.
+
+        Args:
+            :param key (tuple): the key of the call, for example (method, mount point, path).
+            :param function (callable): the coroutine function without arguments.
+
+        Returns:
+            (object) the result of the coroutine, shared by all waiters
+        """
+        if not self.enabled:
+            return await function()
+        loop = asyncio.get_running_loop()
+        task_key = (loop, key)
+        task = self._tasks.get(task_key)
+        if task is None:
+            task = self._tasks[task_key] = loop.create_task(function())
+            task.add_done_callback(lambda done: self._complete(task_key, done))
+            with self._lock:
+                self._counters['calls'] += 1
+        else:
+            with self._lock:
+                self._counters['shared'] += 1
+        return await asyncio.shield(task)
+
+    def _complete(self, task_key: tuple, task: asyncio.Task) -> None:
+        if self._tasks.get(task_key) is task:
+            del self._tasks[task_key]
+        if not task.cancelled():
+            # the exception is retrieved here in case all waiters have been cancelled
+            task.exception()
+
+    def after_fork(self) -> None:
+        """
+        A method for forgetting the calls of the parent process in the child process, their leaders do not exist there.
+
+        Returns:
+            None
+        """
+        self._calls = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def stats(self) -> dict:
+        """
+        A method for getting the counters of the coalesced calls.
+
+        Returns:
+            (dict) {'calls': 10, 'shared': 90, 'in_flight': 1}
+                calls - performed calls, shared - calls that have received the result of another call
+        """
+        with self._lock:
+            return {**self._counters, 'in_flight': len(self._calls) + len(self._tasks)}
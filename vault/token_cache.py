@@ -0,0 +1,250 @@
+"""This module contains the cache of the authentication token reused by the next starts of the process"""
+import base64
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator
+
+from logger import log
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    DECODE_ERRORS = (ValueError, KeyError, InvalidTag)
+except ImportError:
+    AESGCM = None
+    DECODE_ERRORS = (ValueError, KeyError)
+
+NONCE_SIZE = 12
+
+
+class TokenCache:
+    """
+    This class is responsible for keeping the token of the vault client in memory.
+    It is also the interface of the pluggable stores: a store implements load(), save() and clear()
+    and optionally locked() to let only one process authenticate at a time.
+    The OSError of a store is logged by the client and treated as a miss, so the cache never prevents the login.
+    """
+    def __init__(self, min_ttl: float = 300) -> None:
+        """
+        A method for creating an instance of the token cache.
+
+        Args:
+            :param min_ttl (float): the minimum remaining ttl of the cached token in seconds, a token that expires sooner is not reused.
+
+        Returns:
+            None
+
+        Examples:
+            >>> from vault.token_cache import TokenCache
+            >>> client = VaultClient(url='http://vault:8200', namespace='project1', token_cache=TokenCache(min_ttl=600))
+        """
+        self.min_ttl = min_ttl
+        self._entry = None
+
+    def load(self, identity: str) -> dict | None:
+        """
+        A method for getting the cached token of the identity.
+
+        Args:
+            :param identity (str): the url, the namespace and the authentication of the client the token belongs to.
+
+        Returns:
+            (dict) {'token': '...', 'expires_at': 1700000000.0 or None if the token never expires}
+                or
+            None
+        """
+        entry = self._entry
+        if entry is None or entry['identity'] != identity:
+            return None
+        return {'token': entry['token'], 'expires_at': entry['expires_at']}
+
+    def save(self, identity: str, token: str, expires_at: float | None) -> None:
+        """
+        A method for storing the token after the authentication or the renewal.
+
+        Args:
+            :param identity (str): the url, the namespace and the authentication of the client the token belongs to.
+            :param token (str): the token.
+            :param expires_at (float): the wall clock time when the token expires (None if the token never expires).
+
+        Returns:
+            None
+        """
+        self._entry = {'identity': identity, 'token': token, 'expires_at': expires_at}
+
+    # pylint: disable=unused-argument
+    def clear(self, identity: str) -> None:
+        """
+        A method for removing the cached token, for example after it has been rejected by the vault.
+
+        Args:
+            :param identity (str): the url, the namespace and the authentication of the client the token belongs to.
+
+        Returns:
+            None
+        """
+        self._entry = None
+
+    @contextmanager
+    def locked(self, identity: str) -> Iterator[None]:
+        """
+        A context manager around the load of the token and the authentication.
+        The in-process authentications are serialized by the client, so nothing is locked here.
+
+        Args:
+            :param identity (str): the url, the namespace and the authentication of the client the token belongs to.
+
+        Yields:
+            None
+        """
+        yield
+
+
+class FileTokenCache(TokenCache):
+    """
+    This class is responsible for keeping the token of the vault client in a file, so the token survives the restart of the process.
+    Features:
+        - the file is readable only by the owner and is replaced atomically
+        - the token is encrypted with AES-GCM bound to the identity of the client (optional 'crypto' extra)
+        - the processes restarted at the same time wait for one authentication instead of logging in all at once
+    """
+    def __init__(self, file: str = None, key: str | bytes = None, encrypt: bool = True, min_ttl: float = 300) -> None:
+        """
+        A method for creating an instance of the token cache file.
+
+        Args:
+            :param file (str): path to the cache file, by default a file in /dev/shm (or the temporary directory) derived from the identity.
+            :param key (str | bytes): the AES key of 16, 24 or 32 bytes or its urlsafe base64 encoding (VAULT_TOKEN_CACHE_KEY by default).
+            :param encrypt (bool): encrypt the token, requires the cryptography module (the 'crypto' extra).
+            :param min_ttl (float): the minimum remaining ttl of the cached token in seconds, a token that expires sooner is not reused.
+
+        Returns:
+            None
+
+        Examples:
+            >>> from vault.token_cache import FileTokenCache
+            >>> cache = FileTokenCache(file='/dev/shm/vault-app.token', key=FileTokenCache.generate_key(), min_ttl=600)
+        """
+        super().__init__(min_ttl=min_ttl)
+        self.file = file
+        self._cipher = self._create_cipher(key) if encrypt else None
+
+    @staticmethod
+    def generate_key() -> str:
+        """
+        A method for generating a random key for the encryption of the token.
+
+        Returns:
+            (str) urlsafe base64 encoded 32 bytes key
+        """
+        return base64.urlsafe_b64encode(os.urandom(32)).decode()
+
+    @staticmethod
+    def _create_cipher(key: str | bytes = None) -> object:
+        if AESGCM is None:
+            raise ImportError("The cryptography module is required for the encryption of the token cache, install the package with the 'crypto' extra")
+        key = key or os.environ.get('VAULT_TOKEN_CACHE_KEY')
+        if not key:
+            raise ValueError("The encryption key of the token cache is not specified, pass the key argument or set VAULT_TOKEN_CACHE_KEY")
+        return AESGCM(base64.urlsafe_b64decode(key) if isinstance(key, str) else key)
+
+    @staticmethod
+    def directory() -> str:
+        """
+        A method for getting the directory of the default cache files, the tmpfs /dev/shm if it exists.
+
+        Returns:
+            (str) the path to the directory
+        """
+        return '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+    def path(self, identity: str) -> str:
+        """
+        A method for getting the path to the cache file of the identity.
+
+        Args:
+            :param identity (str): the url, the namespace and the authentication of the client the token belongs to.
+
+        Returns:
+            (str) the path to the file
+        """
+        if self.file is not None:
+            return self.file
+        return os.path.join(self.directory(), f"vault-token-{os.getuid()}-{hashlib.sha256(identity.encode()).hexdigest()[:16]}")
+
+    def load(self, identity: str) -> dict | None:
+        file = self.path(identity)
+        try:
+            descriptor = os.open(file, os.O_RDONLY | os.O_NOFOLLOW)
+        except FileNotFoundError:
+            return None
+        with os.fdopen(descriptor, 'rb') as source:
+            self._check(source.fileno(), file)
+            payload = source.read()
+        try:
+            if self._cipher is not None:
+                # the identity is authenticated, so the token of another client is never reused
+                payload = self._cipher.decrypt(payload[:NONCE_SIZE], payload[NONCE_SIZE:], identity.encode())
+            entry = json.loads(payload)
+            if entry['identity'] != identity:
+                return None
+            return {'token': entry['token'], 'expires_at': entry['expires_at']}
+        except DECODE_ERRORS as error:
+            log.warning('[VaultClient]: the token cache file %s can not be decoded, it is ignored: %s', file, error.__class__.__name__)
+            return None
+
+    def save(self, identity: str, token: str, expires_at: float | None) -> None:
+        file = self.path(identity)
+        payload = json.dumps({'identity': identity, 'token': token, 'expires_at': expires_at}).encode()
+        if self._cipher is not None:
+            nonce = os.urandom(NONCE_SIZE)
+            payload = nonce + self._cipher.encrypt(nonce, payload, identity.encode())
+        directory, name = os.path.split(os.path.abspath(file))
+        # mkstemp creates the file with the mode 0600
+        descriptor, temporary = tempfile.mkstemp(dir=directory, prefix=f".{name}.")
+        try:
+            with os.fdopen(descriptor, 'wb') as output:
+                output.write(payload)
+            os.replace(temporary, file)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def clear(self, identity: str) -> None:
+        try:
+            os.unlink(self.path(identity))
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def locked(self, identity: str) -> Iterator[None]:
+        """
+        A context manager that lets only one process of the host authenticate with the identity at a time,
+        the other processes wait and reuse the token saved by it.
+
+        Args:
+            :param identity (str): the url, the namespace and the authentication of the client the token belongs to.
+
+        Yields:
+            None
+        """
+        descriptor = os.open(f"{self.path(identity)}.lock", os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+        try:
+            # the lock of every open file description is separate, so the threads of the process wait for each other too
+            fcntl.flock(descriptor, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(descriptor, fcntl.LOCK_UN)
+        finally:
+            os.close(descriptor)
+
+    @staticmethod
+    def _check(descriptor: int, file: str) -> None:
+        stat = os.fstat(descriptor)
+        if stat.st_uid != os.getuid() or stat.st_mode & 0o077:
+            raise PermissionError(f"The token cache file {file} must be owned by the current user and not be accessible by other users")
@@ -0,0 +1,352 @@
+"""This module contains the class and methods for working with the transit engine in the Vault"""
+import base64
+import itertools
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, Iterator
+
+from logger import log
+
+import hvac
+from hvac import utils
+
+from .decorators import reauthenticate_on_forbidden
+from .exceptions import TransitError
+
+
+def _encode(value: bytes | str) -> str:
+    """Returns the base64 representation of the bytes or of the UTF-8 encoded string"""
+    return base64.b64encode(value.encode('UTF-8') if isinstance(value, str) else value).decode('ascii')
+
+
+class TransitEngine:
+    """
+    This class is responsible for working with the transit engine (encryption as a service) in the vault.
+    All methods take iterables of any length and return iterators of the results in the order of the input:
+        - the input is split into batch_input requests of batch_size items
+        - up to max_workers requests are sent concurrently, the input is consumed only as fast as the results are read
+        - an item rejected by the vault is returned as TransitError, an error of the whole request as the exception
+          for every item of the request, the other items are not affected
+    Supported methods for:
+        - encrypt, decrypt and rewrap the data
+        - sign the data and verify the signatures
+    """
+    def __init__(self, vault_client: object = None, mount_point: str = None, **kwargs) -> None:
+        """
+        A method for creating an instance of the transit engine.
+
+        Args:
+            :param vault_client (object): vault client instance with VaultClient class and attribute hvac.Client
+            :param mount_point (str): the path where the transit engine is mounted.
+
+        Keyword Args:
+            :param batch_size (int): number of items in one batch_input request (default 250)
+            :param max_workers (int): maximum number of concurrent requests of one call (default 4)
+
+        Returns:
+            None
+
+        Examples:
+            >>> from vault import TransitEngine
+            >>> transit_engine = TransitEngine(vault_client=client, mount_point='transit', batch_size=500, max_workers=8)
+        """
+        log.info('[VaultClient] configuration Transit Engine for the vault client %s', vault_client.url)
+        self.vault_client = vault_client
+        if mount_point:
+            self.mount_point = mount_point
+        else:
+            self.mount_point = f"{vault_client.namespace}-transit"
+        self.batch_size = kwargs.get('batch_size', 250)
+        self.max_workers = kwargs.get('max_workers', 4)
+
+    @property
+    def client(self) -> hvac.Client:
+        """Returns the current hvac client of the vault client, it is replaced on re-authentication"""
+        return self.vault_client.client
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def encrypt(
+        self,
+        name: str,
+        plaintexts: Iterable[bytes | str],
+        context: bytes | str = None,
+        key_version: int = None,
+        batch_size: int = None,
+        max_workers: int = None
+    ) -> Iterator[str | Exception]:
+        """
+        A method for encrypting the data with the named key.
+
+        Args:
+            :param name (str): the name of the encryption key.
+            :param plaintexts (Iterable[bytes | str]): the data to encrypt, the strings are encoded as UTF-8.
+            :param context (bytes | str): the key derivation context of all items (only for the derived keys).
+            :param key_version (int): the version of the key to encrypt with (the latest version by default).
+            :param batch_size (int): number of items in one request (the batch_size of the engine by default).
+            :param max_workers (int): maximum number of concurrent requests (the max_workers of the engine by default).
+
+        Returns:
+            (Iterator[str | Exception]) the ciphertexts 'vault:v1:...' in the order of the input or the errors of the items
+
+        Examples:
+            >>> ciphertexts = list(transitengine.encrypt(name='records', plaintexts=(record.ssn for record in records)))
+        """
+        extra = {'context': _encode(context)} if context is not None else {}
+        return self._batches(
+            operation='encrypt',
+            name=name,
+            items=({'plaintext': _encode(plaintext), **extra} for plaintext in plaintexts),
+            field='ciphertext',
+            params={'key_version': key_version},
+            batch_size=batch_size,
+            max_workers=max_workers
+        )
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def decrypt(
+        self,
+        name: str,
+        ciphertexts: Iterable[str],
+        context: bytes | str = None,
+        batch_size: int = None,
+        max_workers: int = None
+    ) -> Iterator[bytes | Exception]:
+        """
+        A method for decrypting the data with the named key.
+
+        Args:
+            :param name (str): the name of the encryption key.
+            :param ciphertexts (Iterable[str]): the ciphertexts 'vault:v1:...'.
+            :param context (bytes | str): the key derivation context of all items (only for the derived keys).
+            :param batch_size (int): number of items in one request (the batch_size of the engine by default).
+            :param max_workers (int): maximum number of concurrent requests (the max_workers of the engine by default).
+
+        Returns:
+            (Iterator[bytes | Exception]) the decrypted data in the order of the input or the errors of the items
+
+        Examples:
+            >>> for record, plaintext in zip(records, transitengine.decrypt(name='records', ciphertexts=(r.ssn for r in records))):
+            ...     record.ssn = plaintext.decode()
+        """
+        extra = {'context': _encode(context)} if context is not None else {}
+        return self._batches(
+            operation='decrypt',
+            name=name,
+            items=({'ciphertext': ciphertext, **extra} for ciphertext in ciphertexts),
+            field='plaintext',
+            transform=base64.b64decode,
+            batch_size=batch_size,
+            max_workers=max_workers
+        )
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def rewrap(
+        self,
+        name: str,
+        ciphertexts: Iterable[str],
+        context: bytes | str = None,
+        key_version: int = None,
+        batch_size: int = None,
+        max_workers: int = None
+    ) -> Iterator[str | Exception]:
+        """
+        A method for re-encrypting the ciphertexts with the latest (or the specified) version of the key
+        without revealing the plaintext, for example after the rotation of the key.
+
+        Args:
+            :param name (str): the name of the encryption key.
+            :param ciphertexts (Iterable[str]): the ciphertexts 'vault:v1:...'.
+            :param context (bytes | str): the key derivation context of all items (only for the derived keys).
+            :param key_version (int): the version of the key to re-encrypt with (the latest version by default).
+            :param batch_size (int): number of items in one request (the batch_size of the engine by default).
+            :param max_workers (int): maximum number of concurrent requests (the max_workers of the engine by default).
+
+        Returns:
+            (Iterator[str | Exception]) the new ciphertexts in the order of the input or the errors of the items
+
+        Examples:
+            >>> rewrapped = transitengine.rewrap(name='records', ciphertexts=stored, batch_size=1000, max_workers=8)
+        """
+        extra = {'context': _encode(context)} if context is not None else {}
+        return self._batches(
+            operation='rewrap',
+            name=name,
+            items=({'ciphertext': ciphertext, **extra} for ciphertext in ciphertexts),
+            field='ciphertext',
+            params={'key_version': key_version},
+            batch_size=batch_size,
+            max_workers=max_workers
+        )
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def sign(
+        self,
+        name: str,
+        inputs: Iterable[bytes | str],
+        hash_algorithm: str = None,
+        key_version: int = None,
+        batch_size: int = None,
+        max_workers: int = None
+    ) -> Iterator[str | Exception]:
+        """
+        A method for signing the data with the named key.
+
+        Args:
+            :param name (str): the name of the signing key.
+            :param inputs (Iterable[bytes | str]): the data to sign, the strings are encoded as UTF-8.
+            :param hash_algorithm (str): the hash algorithm, for example sha2-256 (the default of the vault by default).
+            :param key_version (int): the version of the key to sign with (the latest version by default).
+            :param batch_size (int): number of items in one request (the batch_size of the engine by default).
+            :param max_workers (int): maximum number of concurrent requests (the max_workers of the engine by default).
+
+        Returns:
+            (Iterator[str | Exception]) the signatures 'vault:v1:...' in the order of the input or the errors of the items
+
+        Examples:
+            >>> signatures = list(transitengine.sign(name='documents', inputs=documents, hash_algorithm='sha2-256'))
+        """
+        return self._batches(
+            operation='sign',
+            name=name,
+            items=({'input': _encode(data)} for data in inputs),
+            field='signature',
+            params={'hash_algorithm': hash_algorithm, 'key_version': key_version},
+            batch_size=batch_size,
+            max_workers=max_workers
+        )
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def verify(
+        self,
+        name: str,
+        inputs: Iterable[bytes | str],
+        signatures: Iterable[str],
+        hash_algorithm: str = None,
+        batch_size: int = None,
+        max_workers: int = None
+    ) -> Iterator[bool | Exception]:
+        """
+        A method for verifying the signatures of the data with the named key.
+
+        Args:
+            :param name (str): the name of the signing key.
+            :param inputs (Iterable[bytes | str]): the signed data, the strings are encoded as UTF-8.
+            :param signatures (Iterable[str]): the signatures of the data in the same order.
+            :param hash_algorithm (str): the hash algorithm used to sign the data.
+            :param batch_size (int): number of items in one request (the batch_size of the engine by default).
+            :param max_workers (int): maximum number of concurrent requests (the max_workers of the engine by default).
+
+        Returns:
+            (Iterator[bool | Exception]) True for the valid signatures in the order of the input or the errors of the items,
+                the items of the longer iterable without a pair are returned as TransitError
+
+        Examples:
+            >>> all(valid is True for valid in transitengine.verify(name='documents', inputs=documents, signatures=signatures))
+        """
+        missing = object()
+
+        def items() -> Iterator[dict | TransitError]:
+            for index, (data, signature) in enumerate(itertools.zip_longest(inputs, signatures, fillvalue=missing)):
+                if data is missing or signature is missing:
+                    yield TransitError(message=f"the {'input' if data is missing else 'signature'} is missing", index=index)
+                else:
+                    yield {'input': _encode(data), 'signature': signature}
+
+        return self._batches(
+            operation='verify',
+            name=name,
+            items=items(),
+            field='valid',
+            params={'hash_algorithm': hash_algorithm},
+            batch_size=batch_size,
+            max_workers=max_workers
+        )
+
+    def after_fork(self) -> None:
+        """
+        A method for resetting the state of the engine in the child process, the engine keeps no state between the calls.
+
+        Returns:
+            None
+        """
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals
+    def _batches(
+        self,
+        operation: str,
+        name: str,
+        items: Iterable[dict],
+        field: str,
+        params: dict = None,
+        transform: callable = None,
+        batch_size: int = None,
+        max_workers: int = None
+    ) -> Iterator:
+        """
+        Sends the items in batch_input requests concurrently and yields the results in the order of the input.
+        Only max_workers requests and one prepared batch are kept in flight, so the memory does not grow with the input.
+        The items that are already errors are not sent and are yielded in their place.
+        """
+        batch_size = batch_size or self.batch_size
+        max_workers = max_workers or self.max_workers
+        params = {key: value for key, value in (params or {}).items() if value is not None}
+        items = iter(items)
+        batches = iter(lambda: list(itertools.islice(items, batch_size)), [])
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        pending = deque()
+        offset = 0
+        try:
+            for batch in batches:
+                if any(not isinstance(item, Exception) for item in batch):
+                    sent = [item for item in batch if not isinstance(item, Exception)]
+                    future = executor.submit(self._batch_request, operation=operation, name=name, batch=sent, params=params)
+                else:
+                    future = Future()
+                    future.set_result([])
+                pending.append((offset, batch, future))
+                offset += len(batch)
+                if len(pending) > max_workers:
+                    yield from self._results(*pending.popleft(), field=field, transform=transform)
+            while pending:
+                yield from self._results(*pending.popleft(), field=field, transform=transform)
+        finally:
+            # the caller may stop reading the results early
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    @staticmethod
+    def _results(offset: int, batch: list, future: Future, field: str, transform: callable = None) -> Iterator:
+        """Yields the results of the batch, the error of the whole request is yielded for every sent item of the batch"""
+        size = sum(1 for item in batch if not isinstance(item, Exception))
+        results, failure = [], None
+        try:
+            results = future.result()
+            if len(results) != size:
+                raise TransitError(message=f"the vault has returned {len(results)} results for {size} items")
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            log.error('[VaultClient] the transit batch of %s items at %s has failed: %s', size, offset, error)
+            failure = error
+        sent = 0
+        for index, item in enumerate(batch, start=offset):
+            if isinstance(item, Exception) or failure is not None:
+                yield item if isinstance(item, Exception) else failure
+                continue
+            result = results[sent]
+            sent += 1
+            if result.get('error'):
+                yield TransitError(message=result['error'], index=index)
+            else:
+                yield transform(result[field]) if transform is not None else result[field]
+
+    @reauthenticate_on_forbidden
+    def _batch_request(self, operation: str, name: str, batch: list, params: dict) -> list:
+        """
+        Sends one batch_input request through the adapter of the hvac client.
+        The hvac methods do not support batch_input for all operations and the partial_failure_response_code parameter,
+        without it the vault rejects the whole batch with 400 when some items are invalid.
+        """
+        response = self.client.adapter.post(
+            url=utils.format_url('/v1/{mount_point}/{operation}/{name}', mount_point=self.mount_point, operation=operation, name=name),
+            json={**params, 'batch_input': batch, 'partial_failure_response_code': 200}
+        )
+        return response['data']['batch_results']
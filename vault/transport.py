@@ -0,0 +1,158 @@
+"""This module contains the HTTP transport shared by the Vault clients and engines"""
+import os
+import socket
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+from logger import log
+
+
+class PoolAdapter(HTTPAdapter):
+    """
+    HTTP adapter with TCP keep-alive for the connections of the pool.
+    """
+    def __init__(self, socket_options: list = None, **kwargs) -> None:
+        self.socket_options = socket_options
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.socket_options is not None:
+            kwargs['socket_options'] = self.socket_options
+        return super().init_poolmanager(*args, **kwargs)
+
+
+# pylint: disable=too-many-instance-attributes
+class Transport:
+    """
+    This class is responsible for the HTTP connection pool used by the hvac clients.
+    The same transport persists across re-authentications and can be shared by several VaultClient instances,
+    so TCP/TLS connections (and their TLS sessions) are reused instead of being created for every new hvac.Client.
+    """
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(
+        self,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        pool_block: bool = False,
+        timeout: float = 30,
+        keepalive: bool = True,
+        tcp_keepalive: bool = True,
+        verify: bool | str = True,
+        cert: tuple = None
+    ) -> None:
+        """
+        A method for creating an instance of the HTTP transport.
+
+        Args:
+            :param pool_connections (int): number of connection pools (one per vault host) to keep.
+            :param pool_maxsize (int): maximum number of connections kept per host.
+            :param pool_block (bool): wait for a free connection instead of opening an extra one when the pool is exhausted.
+            :param timeout (float): timeout of the requests in seconds.
+            :param keepalive (bool): keep the connections open between requests (HTTP keep-alive).
+            :param tcp_keepalive (bool): enable TCP keep-alive probes on the sockets of the pool.
+            :param verify (bool | str): TLS verification or path to the CA bundle.
+            :param cert (tuple): client certificate and key for TLS authentication.
+
+        Returns:
+            None
+
+        Examples:
+            >>> from vault import Transport, VaultClient
+            >>> transport = Transport(pool_maxsize=50, timeout=5)
+            >>> client1 = VaultClient(url='http://vault:8200', namespace='app1', transport=transport)
+            >>> client2 = VaultClient(url='http://vault:8200', namespace='app2', transport=transport)
+            >>> transport.stats()
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.timeout = timeout
+        self.keepalive = keepalive
+        self.tcp_keepalive = tcp_keepalive
+        self.verify = verify
+        self.cert = cert
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.session = self._build_session()
+
+    def _build_session(self) -> requests.Session:
+        """
+        A method for building the requests session with the pooled adapter.
+
+        Returns:
+            (requests.Session) session
+        """
+        socket_options = None
+        if self.tcp_keepalive:
+            socket_options = HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+        adapter = PoolAdapter(
+            socket_options=socket_options,
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=self.pool_block,
+            max_retries=0
+        )
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.verify = self.verify
+        session.cert = self.cert
+        if not self.keepalive:
+            session.headers['Connection'] = 'close'
+        log.info('[VaultClient]: prepared the HTTP transport: pool_maxsize=%s, timeout=%s', self.pool_maxsize, self.timeout)
+        return session
+
+    def stats(self) -> dict:
+        """
+        A method for getting the usage of the connection pools.
+
+        Returns:
+            (dict) {'http://vault:8200': {'maxsize': 10, 'in_use': 1, 'idle': 3, 'created': 4, 'requests': 120}}
+                created greater than maxsize means the pool is too small and extra connections have been discarded
+        """
+        stats = {}
+        with self._lock:
+            for adapter in set(self.session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for key in list(pools.keys()):
+                    pool = pools.get(key)
+                    if pool is None or pool.pool is None:
+                        continue
+                    stats[f"{key.key_scheme}://{key.key_host}:{key.key_port}"] = {
+                        'maxsize': pool.pool.maxsize,
+                        'in_use': pool.pool.maxsize - pool.pool.qsize(),
+                        'idle': sum(1 for connection in list(pool.pool.queue) if connection is not None),
+                        'created': pool.num_connections,
+                        'requests': pool.num_requests
+                    }
+        return stats
+
+    def after_fork(self) -> bool:
+        """
+        A method for replacing the session inherited from the parent process with a new one in the child process.
+        The connections of the parent are left untouched: they are not closed or reused by the child.
+
+        Returns:
+            (bool) True if the session has been replaced, False if it has already been created in the current process
+        """
+        if self._pid == os.getpid():
+            return False
+        hooks = self.session.hooks['response']
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self.session = self._build_session()
+        self.session.hooks['response'] = list(hooks)
+        return True
+
+    def close(self) -> None:
+        """
+        A method for closing all connections of the transport.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.session.close()
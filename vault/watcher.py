@@ -0,0 +1,350 @@
+"""This module contains the watcher of the secrets changes in the KV2 Engine"""
+import heapq
+import random
+import threading
+import time
+
+import hvac.exceptions
+
+from logger import log
+from .decorators import reauthenticate_on_forbidden
+
+
+# pylint: disable=too-few-public-methods,too-many-instance-attributes
+class WatchedPath:
+    """
+    A secret whose version is polled by the watcher.
+
+    Attributes:
+        path (str): the path to the secret in vault.
+        callbacks (list): functions called with (path, old_data, new_data) when the secret changes.
+        version (int | None): the last seen version of the secret (None if it does not exist).
+        data (dict | None): the last seen data of the secret.
+        interval (float): the current polling interval, grows while the secret does not change.
+        base_interval (float): the polling interval after a change.
+        max_interval (float): the upper bound of the polling interval.
+        due (float): monotonic time of the next poll.
+        initialized (bool): True after the first poll has recorded the baseline version.
+        discovered (bool): True if the path has been found under a watched prefix and was not added explicitly.
+    """
+    __slots__ = ('path', 'callbacks', 'version', 'data', 'interval', 'base_interval', 'max_interval', 'due', 'initialized', 'discovered')
+
+    def __init__(self, path: str, interval: float, max_interval: float) -> None:
+        self.path = path
+        self.callbacks = []
+        self.version = None
+        self.data = None
+        self.interval = interval
+        self.base_interval = interval
+        self.max_interval = max_interval
+        self.due = 0.0
+        self.initialized = False
+        self.discovered = False
+
+
+class Watcher:
+    """
+    This class is responsible for detecting the changes of the secrets in the KV2 Engine.
+    Features:
+        - only the metadata of the secrets is polled, the data is read when the version has changed
+        - the polls are spread over time with jitter and are backed off while the secrets do not change
+        - new and deleted secrets under the watched prefixes are detected by periodic listing
+        - one background thread serves all watched paths of the engine
+    """
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(
+        self,
+        kv2engine: object = None,
+        jitter: float = 0.1,
+        backoff: float = 2.0,
+        batch_size: int = 100,
+        discovery_interval: float = 300
+    ) -> None:
+        """
+        A method for creating an instance of the watcher.
+
+        Args:
+            :param kv2engine (KV2Engine): the engine used to read the metadata and data of the secrets.
+            :param jitter (float): random deviation of the polling intervals (0.1 - up to 10% shorter or longer).
+            :param backoff (float): multiplier of the polling interval of a secret that has not changed.
+            :param batch_size (int): maximum number of polls performed before the schedule is checked for new paths.
+            :param discovery_interval (float): interval of listing the watched prefixes for new and deleted secrets.
+
+        Returns:
+            None
+
+        Examples:
+            >>> watcher = kv2engine.watch(paths=['configuration/db'], callback=lambda path, old, new: reload(new))
+            >>> watcher.stop()
+        """
+        self.kv2engine = kv2engine
+        self.vault_client = kv2engine.vault_client
+        self.jitter = jitter
+        self.backoff = backoff
+        self.batch_size = batch_size
+        self.discovery_interval = discovery_interval
+        self._paths = {}
+        self._prefixes = {}
+        self._schedule = []
+        self._sequence = 0
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def watch(
+        self,
+        paths: list = None,
+        callback: callable = None,
+        prefix: str = None,
+        interval: float = 30,
+        max_interval: float = 300,
+        versions: dict = None
+    ) -> 'Watcher':
+        """
+        A method for adding the paths or the prefix to the watched secrets.
+
+        Args:
+            :param paths (list): the paths to the secrets in vault.
+            :param callback (callable): callback(path, old_data, new_data) called when the secret changes,
+                old_data is None for a new secret and new_data is None for a deleted secret.
+            :param prefix (str): watch all secrets whose paths start with the prefix, including the secrets created later.
+            :param interval (float): polling interval in seconds.
+            :param max_interval (float): maximum polling interval in seconds when the secrets do not change.
+            :param versions (dict): the versions of the paths already known to the caller {'path': 3 or None if it does not exist},
+                the first poll reports a different version as a change instead of recording it as the baseline.
+
+        Returns:
+            (Watcher) the watcher
+        """
+        now = time.monotonic()
+        with self._condition:
+            if prefix is not None:
+                self._prefixes.setdefault(prefix, {'callbacks': [], 'interval': interval, 'max_interval': max_interval, 'known': set(), 'listed': False})
+                if callback is not None and callback not in self._prefixes[prefix]['callbacks']:
+                    self._prefixes[prefix]['callbacks'].append(callback)
+                self._push(now, ('prefix', prefix))
+            for path in paths or []:
+                entry = self._add(path=path, callback=callback, interval=interval, max_interval=max_interval, now=now)
+                if versions is not None and path in versions and not entry.initialized:
+                    entry.version, entry.initialized = versions[path], True
+            self._start()
+            self._condition.notify()
+        return self
+
+    def unwatch(self, paths: list = None, prefix: str = None) -> None:
+        """
+        A method for removing the paths or the prefix from the watched secrets.
+
+        Args:
+            :param paths (list): the paths to the secrets in vault.
+            :param prefix (str): the watched prefix, the secrets discovered under it are removed too.
+
+        Returns:
+            None
+        """
+        with self._condition:
+            if prefix is not None:
+                for path in self._prefixes.pop(prefix, {}).get('known', ()):
+                    self._paths.pop(path, None)
+            for path in paths or []:
+                self._paths.pop(path, None)
+
+    def watched(self) -> dict:
+        """
+        A method for getting the watched paths.
+
+        Returns:
+            (dict) {'path': {'version': 3, 'interval': 60.0, 'next_poll_in': 12.5}}
+        """
+        now = time.monotonic()
+        with self._condition:
+            return {
+                path: {'version': entry.version, 'interval': entry.interval, 'next_poll_in': max(entry.due - now, 0)}
+                for path, entry in self._paths.items()
+            }
+
+    def after_fork(self) -> None:
+        """
+        A method for restarting the background thread of the watcher in the child process, the watched paths are kept.
+
+        Returns:
+            None
+        """
+        self._condition = threading.Condition()
+        self._thread = None
+        if not self._stopped and (self._paths or self._prefixes):
+            self._start()
+
+    def stop(self) -> None:
+        """
+        A method for stopping the background thread of the watcher.
+
+        Returns:
+            None
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def _add(self, path: str, callback: callable, interval: float, max_interval: float, now: float, discovered: bool = False) -> WatchedPath:
+        entry = self._paths.get(path)
+        if entry is None:
+            entry = self._paths[path] = WatchedPath(path=path, interval=interval, max_interval=max_interval)
+            entry.discovered = discovered
+            # spread the baseline polls of many paths instead of sending them at once
+            self._reschedule(entry, now, delay=random.uniform(0, interval * self.jitter))
+        elif not discovered:
+            entry.discovered = False
+        if callback is not None and callback not in entry.callbacks:
+            entry.callbacks.append(callback)
+        return entry
+
+    def _start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name='vault-watcher', daemon=True)
+            self._thread.start()
+
+    def _push(self, due: float, key: tuple) -> None:
+        self._sequence += 1
+        heapq.heappush(self._schedule, (due, self._sequence, key))
+
+    def _reschedule(self, entry: WatchedPath, now: float, delay: float = None) -> None:
+        if delay is None:
+            delay = entry.interval * (1 + random.uniform(-self.jitter, self.jitter))
+        entry.due = now + delay
+        self._push(entry.due, ('path', entry.path))
+
+    def _due(self) -> list:
+        """Pops the scheduled polls whose time has come, skipping the outdated entries of the schedule"""
+        now = time.monotonic()
+        batch = []
+        while self._schedule and self._schedule[0][0] <= now and len(batch) < self.batch_size:
+            due, _, key = heapq.heappop(self._schedule)
+            kind, name = key
+            if kind == 'path':
+                entry = self._paths.get(name)
+                if entry is not None and entry.due == due:
+                    batch.append(key)
+            elif name in self._prefixes:
+                batch.append(key)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                batch = self._due()
+                while not batch and not self._stopped:
+                    timeout = self._schedule[0][0] - time.monotonic() if self._schedule else None
+                    self._condition.wait(timeout=timeout)
+                    batch = self._due()
+                if self._stopped:
+                    return
+            for kind, name in batch:
+                try:
+                    if kind == 'path':
+                        self._poll(name)
+                    else:
+                        self._discover(name)
+                except Exception as error:  # pylint: disable=broad-exception-caught
+                    log.error('[VaultClient] failed to watch the %s %s: %s', kind, name, error)
+                    with self._condition:
+                        entry = self._paths.get(name) if kind == 'path' else None
+                        if entry is not None:
+                            entry.interval = min(entry.interval * self.backoff, entry.max_interval)
+                            self._reschedule(entry, time.monotonic())
+                        elif kind == 'prefix' and name in self._prefixes:
+                            self._push(time.monotonic() + self.discovery_interval, ('prefix', name))
+
+    def _poll(self, path: str) -> None:
+        """Compares the current version of the secret with the last seen one and reads the data only if it has changed"""
+        with self._condition:
+            entry = self._paths.get(path)
+        if entry is None:
+            return
+        version = self._read_version(path=path)
+        changed = entry.initialized and version != entry.version
+        data = entry.data
+        if version is not None and (changed or not entry.initialized):
+            cached = self.kv2engine.cache.get_stale(path) if self.kv2engine.cache is not None else None
+            data = dict(cached.data) if cached is not None and cached.version == version else self._read_data(path=path, version=version)
+        old = entry.data
+        with self._condition:
+            entry.version, entry.data = version, data if version is not None else None
+            if changed:
+                entry.interval = entry.base_interval
+            elif entry.initialized:
+                entry.interval = min(entry.interval * self.backoff, entry.max_interval)
+            entry.initialized = True
+            callbacks, new = list(entry.callbacks), entry.data
+            if version is None and entry.discovered:
+                # the secret found under a prefix has been deleted, the prefix listing will pick it up if it is created again
+                self._paths.pop(path, None)
+                for watch in self._prefixes.values():
+                    watch['known'].discard(path)
+            elif path in self._paths:
+                self._reschedule(entry, time.monotonic())
+        if not changed:
+            return
+        log.info('[VaultClient] the secret %s has changed: version %s', path, version)
+        if self.kv2engine.cache is not None:
+            self.kv2engine.cache.invalidate(path)
+            if new is not None:
+                self.kv2engine.cache.set(path=path, data=new, version=version)
+        for callback in callbacks:
+            try:
+                callback(path, old, new)
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                log.error('[VaultClient] the watch callback for the secret %s failed: %s', path, error)
+
+    def _discover(self, prefix: str) -> None:
+        """Lists the prefix and starts or stops watching the secrets that have appeared or disappeared"""
+        directory = prefix.rsplit('/', 1)[0] if '/' in prefix else ''
+        found = set(self.kv2engine.walk(path=directory, prefix=prefix))
+        now = time.monotonic()
+        with self._condition:
+            watch = self._prefixes.get(prefix)
+            if watch is None:
+                return
+            for path in found - watch['known']:
+                new = path not in self._paths
+                entry = self._add(path=path, callback=None, interval=watch['interval'], max_interval=watch['max_interval'], now=now, discovered=True)
+                if new and watch['listed']:
+                    # the secrets created after the first listing are reported as new
+                    entry.initialized = True
+                    self._reschedule(entry, now, delay=0)
+                for callback in watch['callbacks']:
+                    if callback not in entry.callbacks:
+                        entry.callbacks.append(callback)
+            watch['known'] |= found
+            watch['listed'] = True
+            self._push(now + self.discovery_interval, ('prefix', prefix))
+
+    @reauthenticate_on_forbidden
+    def _read_version(self, path: str = None) -> int | None:
+        """Returns the current version of the secret from its metadata or None if the secret does not exist"""
+        try:
+            return self.kv2engine.client.secrets.kv.v2.read_secret_metadata(
+                path=path,
+                mount_point=self.kv2engine.mount_point
+            )['data']['current_version']
+        except hvac.exceptions.InvalidPath:
+            return None
+
+    @reauthenticate_on_forbidden
+    def _read_data(self, path: str = None, version: int = None) -> dict | None:
+        """Returns the data of the specified version of the secret or None if the version has been deleted"""
+        try:
+            return self.kv2engine.client.secrets.kv.v2.read_secret_version(
+                path=path,
+                version=version,
+                mount_point=self.kv2engine.mount_point,
+                raise_on_deleted_version=False
+            )['data']['data']
+        except hvac.exceptions.InvalidPath:
+            return None
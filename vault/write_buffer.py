@@ -0,0 +1,204 @@
+"""This module contains the write-behind buffer that merges the writes of the same path into one KV2 update"""
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from logger import log
+from .exceptions import FlushError
+
+
+# pylint: disable=too-many-instance-attributes
+class WriteBuffer:
+    """
+    This class is responsible for buffering the writes to the KV2 Engine and flushing them in batches.
+    The pending keys of the same path are merged, so many writes of a path become one request and one new version.
+    The buffer is flushed when the number of pending keys reaches max_keys, every interval seconds in the background,
+    on flush() and on close() or the exit of the context manager. The updates of the failed paths are kept and written
+    again by the next flush, the error of a background flush is raised by the next write of the caller.
+    The pending writes are not visible to the reads of the engine until they are flushed.
+    """
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(
+        self,
+        kv2engine: object = None,
+        max_keys: int = 100,
+        interval: float = 1.0,
+        cas: bool = True,
+        max_workers: int = 8
+    ) -> None:
+        """
+        A method for creating an instance of the write buffer.
+
+        Args:
+            :param kv2engine (KV2Engine): the engine used to write the secrets.
+            :param max_keys (int): number of pending keys of all paths that triggers the flush in the writing thread.
+            :param interval (float): interval of the background flushes in seconds (None disables them).
+            :param cas (bool): write every path with check-and-set against its current version, retried on conflicts.
+            :param max_workers (int): maximum number of paths written concurrently by the flush.
+
+        Returns:
+            None
+
+        Examples:
+            >>> with kv2engine.write_buffer(max_keys=100, interval=1) as buffer:
+            ...     for step in range(1000):
+            ...         buffer.write_secret(path='jobs/42', key='progress', value=str(step))
+        """
+        self.kv2engine = kv2engine
+        self.max_keys = max_keys
+        self.interval = interval
+        self.cas = cas
+        self.max_workers = max_workers
+        self._pending = {}
+        self._keys = 0
+        self._error = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._counters = {'writes': 0, 'flushes': 0, 'requests': 0, 'failures': 0}
+        self._thread = None
+        if interval:
+            self._thread = threading.Thread(target=self._run, name='vault-write-buffer', daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def __enter__(self) -> 'WriteBuffer':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def write_secret(self, path: str = None, key: str = None, value: str = None) -> None:
+        """
+        A method for buffering the update of the key in the secret.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+            :param key (str): the key to write to the secret.
+            :param value (str): the value of the key, None removes the key.
+
+        Returns:
+            None
+        """
+        self.write_secrets(path=path, secrets={key: value})
+
+    def write_secrets(self, path: str = None, secrets: dict = None) -> None:
+        """
+        A method for buffering the update of several keys in the secret, the later values of a key replace the earlier ones.
+
+        Args:
+            :param path (str): the path to the secret in vault.
+            :param secrets (dict): the keys and values to write to the secret, a key with the value None is removed.
+
+        Returns:
+            None
+
+        Raises:
+            FlushError: the previous background flush has failed, the update is buffered and written with the next flush.
+        """
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('the write buffer is closed')
+            pending = self._pending.setdefault(path, {})
+            self._keys += len(secrets.keys() - pending.keys())
+            pending.update(secrets)
+            self._counters['writes'] += 1
+            full = self._keys >= self.max_keys
+        if full:
+            self.flush()
+        else:
+            self._raise_error()
+
+    def flush(self) -> None:
+        """
+        A method for writing the pending updates, every path is written with one request.
+
+        Returns:
+            None
+
+        Raises:
+            FlushError: some paths have not been written, their updates are kept in the buffer.
+        """
+        with self._lock:
+            # the updates of the failed background flush are written again here
+            self._error = None
+        self._flush()
+
+    def _flush(self) -> None:
+        # the flushes are serialized, so an older update of a path never overwrites a newer one
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending, self._keys = self._pending, {}, 0
+            if not batch:
+                return
+            if len(batch) == 1:
+                results = {path: self._write(path, secrets) for path, secrets in batch.items()}
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batch)), thread_name_prefix='vault-flush') as executor:
+                    futures = {path: executor.submit(self._write, path, secrets) for path, secrets in batch.items()}
+                results = {path: future.result() for path, future in futures.items()}
+            errors = {path: error for path, error in results.items() if error is not None}
+            with self._lock:
+                self._counters['flushes'] += 1
+                self._counters['requests'] += len(batch)
+                self._counters['failures'] += len(errors)
+                for path in errors:
+                    # the newer pending updates of the failed path take precedence over the failed ones
+                    pending = self._pending.get(path, {})
+                    self._keys += len(batch[path].keys() - pending.keys())
+                    self._pending[path] = {**batch[path], **pending}
+        if errors:
+            raise FlushError(errors)
+
+    def _write(self, path: str, secrets: dict) -> Exception | None:
+        try:
+            self.kv2engine.write_secrets(path=path, secrets=secrets, cas=self.cas)
+            return None
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            log.error('[VaultClient] failed to flush the buffered writes of %s: %s', path, error)
+            return error
+
+    def _run(self) -> None:
+        while not self._stopped.wait(timeout=self.interval):
+            try:
+                self._flush()
+            except FlushError as error:
+                with self._lock:
+                    self._error = error
+
+    def _raise_error(self) -> None:
+        with self._lock:
+            error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def stats(self) -> dict:
+        """
+        A method for getting the pending updates and the counters of the buffer.
+
+        Returns:
+            (dict) {'pending_paths': 1, 'pending_keys': 2, 'writes': 1000, 'flushes': 10, 'requests': 10, 'failures': 0}
+        """
+        with self._lock:
+            return {'pending_paths': len(self._pending), 'pending_keys': self._keys, **self._counters}
+
+    def close(self) -> None:
+        """
+        A method for stopping the background flushes and writing the pending updates.
+
+        Returns:
+            None
+
+        Raises:
+            FlushError: some paths have not been written, their updates are discarded.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        atexit.unregister(self.close)
+        self._stopped.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()